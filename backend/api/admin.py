@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import Cognition, Node, PresetResponse, Arc, UserProfile, Widget, WidgetInteraction
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .models import (
+    Cognition, Node, PresetResponse, Arc, UserProfile, Widget, WidgetInteraction, ProcessingJob, RequestProfile, LLMCall
+)
 # Synthesis and SynthesisPresetLink removed - functionality replaced by widget system
 
 class NodeInline(admin.TabularInline):
@@ -74,4 +81,70 @@ class UserProfileAdmin(admin.ModelAdmin):
 
     def get_followers_count(self, obj):
         return obj.followers.count()
-    get_followers_count.short_description = 'Followers'
\ No newline at end of file
+    get_followers_count.short_description = 'Followers'
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('job_type', 'user', 'status', 'progress_current', 'progress_total', 'created_at', 'finished_at')
+    list_filter = ('job_type', 'status', 'created_at')
+    search_fields = ('user__username',)
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Profiles captured by api.request_profiler; read-only, with the stacks downloadable for flame-graph tools"""
+    list_display = ('created_at', 'method', 'path', 'status_code', 'user', 'duration_ms', 'sql_count', 'sql_ms',
+                    'llm_count', 'llm_ms', 'flame_graph_link')
+    list_filter = ('method', 'status_code', 'created_at')
+    search_fields = ('path', 'user__username')
+    exclude = ('collapsed_stacks', 'sql_queries')
+    readonly_fields = ('flame_graph_link', 'slowest_queries')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/flamegraph/', self.admin_site.admin_view(self.flame_graph),
+                 name='api_requestprofile_flamegraph'),
+        ] + super().get_urls()
+
+    def flame_graph(self, request, profile_id):
+        """The sampled stacks in collapsed format, for flamegraph.pl, speedscope or inferno"""
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(profile.collapsed_stacks + '\n', content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="request-profile-{profile.pk}.folded"'
+        return response
+
+    def flame_graph_link(self, obj):
+        url = reverse('admin:api_requestprofile_flamegraph', args=[obj.pk])
+        return format_html('<a href="{}">{} samples</a>', url, obj.sample_count)
+    flame_graph_link.short_description = 'Flame graph'
+
+    def slowest_queries(self, obj):
+        queries = sorted(obj.sql_queries, key=lambda query: query['duration_ms'], reverse=True)[:20]
+        return format_html(
+            '<table>{}</table>',
+            format_html_join('', '<tr><td>{} ms</td><td><code>{}</code><br><small>{}</small></td></tr>', (
+                (round(query['duration_ms'], 2), query['sql'], ' > '.join(query['origin'])) for query in queries
+            ))
+        )
+    slowest_queries.short_description = 'Slowest queries'
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'operation', 'model', 'user', 'prompt_tokens', 'completion_tokens', 'latency_ms',
+                    'finish_reason', 'cache_hit', 'cost_usd')
+    list_filter = ('operation', 'model', 'finish_reason', 'cache_hit', 'created_at')
+    search_fields = ('user__username', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
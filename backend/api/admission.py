@@ -0,0 +1,155 @@
+# api/admission.py
+"""
+Token-bucket admission control for the LLM-bound endpoints
+"""
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from typing import Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+CHARS_PER_TOKEN = 4
+LOCK_TIMEOUT = 2  # seconds a bucket lock may be held before the cache expires it
+
+
+class AdmissionDenied(Exception):
+    """The request would have to queue longer than LLM_ADMISSION_MAX_WAIT"""
+
+    def __init__(self, retry_after: float, scope: str):
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.scope = scope
+        super().__init__(f"LLM capacity for {'your account' if scope == 'user' else 'the service'} is exhausted.")
+
+
+def estimate_tokens(input_chars: int, output_tokens: int = 0) -> int:
+    """Rough prompt plus completion size of a call, for budgeting only"""
+    return int(math.ceil(input_chars / CHARS_PER_TOKEN)) + output_tokens
+
+
+def estimate_toc_tokens(cognition) -> int:
+    """Estimated size of generating a TOC: the flat prompt sends up to 500 characters per node"""
+    from django.db.models import Sum, Value
+    from django.db.models.functions import Least
+
+    chars = cognition.nodes.filter(node_type='content').aggregate(
+        chars=Sum(Least('character_count', Value(500)))
+    )['chars'] or 0
+    return estimate_tokens(chars, 2000)
+
+
+def estimate_widget_batch_tokens(cognition, node_ids=None) -> int:
+    """Estimated size of a batch widget job: one call per content node, each answered in up to 500 tokens"""
+    from django.db.models import Count, Sum
+
+    nodes = cognition.nodes.filter(node_type='content')
+    if node_ids:
+        nodes = nodes.filter(id__in=node_ids)
+    totals = nodes.aggregate(chars=Sum('character_count'), count=Count('id'))
+    return estimate_tokens(totals['chars'] or 0, 500 * totals['count'])
+
+
+class AdmissionController:
+    """
+    Per-user and global token buckets, sized in estimated LLM tokens.
+
+    Each bucket refills at a steady rate up to its burst size. Admitting a
+    request reserves its estimated tokens from both buckets up front, and a
+    bucket may go into debt: the debt is the queue in front of the next
+    request, which waits until it is repaid. Reservations are served in
+    arrival order, and because a user's reservations are capped by their own
+    bucket, one heavy user queues behind themselves rather than in front of
+    everyone else. A request that would wait longer than
+    LLM_ADMISSION_MAX_WAIT is refused with the time after which it would fit.
+
+    Bucket state lives in the Django cache so all workers share it; configure
+    a shared backend (Redis, Memcached, database) in production, as the
+    default local-memory cache is per process.
+    """
+
+    def settings_for(self, scope: str):
+        """(tokens per second, burst) for 'user' or 'global'"""
+        prefix = 'LLM_USER' if scope == 'user' else 'LLM_GLOBAL'
+        per_minute = getattr(settings, f'{prefix}_TOKENS_PER_MINUTE')
+        burst = getattr(settings, f'{prefix}_TOKEN_BURST')
+        return per_minute / 60.0, float(burst)
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'LLM_ADMISSION_ENABLED', True)
+
+    @property
+    def max_wait(self) -> float:
+        return getattr(settings, 'LLM_ADMISSION_MAX_WAIT', 10)
+
+    def reserve(self, user, tokens: int) -> float:
+        """
+        Reserve tokens for one LLM operation and return how many seconds the
+        caller must wait before starting it; raises AdmissionDenied instead of
+        reserving when that wait would exceed LLM_ADMISSION_MAX_WAIT.
+        """
+        if not self.enabled or tokens <= 0:
+            return 0.0
+
+        buckets = [('user', f'llm-admission:user:{user.id}'), ('global', 'llm-admission:global')]
+        with self._locked(buckets[0][1]), self._locked(buckets[1][1]):
+            now = time.time()
+            states = []
+            wait, limiting = 0.0, 'user'
+            for scope, key in buckets:
+                rate, burst = self.settings_for(scope)
+                level = self._level(cache.get(key), rate, burst, now)
+                # A request bigger than the whole bucket is charged the bucket, or it could never run
+                remaining = level - min(tokens, burst)
+                scope_wait = max(0.0, -remaining / rate)
+                if scope_wait > wait:
+                    wait, limiting = scope_wait, scope
+                states.append((key, remaining, rate, burst))
+
+            if wait > self.max_wait:
+                raise AdmissionDenied(wait - self.max_wait, limiting)
+
+            for key, remaining, rate, burst in states:
+                # Keep the entry until the bucket would be full again
+                cache.set(key, {'tokens': remaining, 'at': now}, timeout=int((burst - remaining) / rate) + 60)
+        return wait
+
+    def acquire(self, user, tokens: int):
+        """reserve() and sleep until the reservation comes due"""
+        wait = self.reserve(user, tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, user, tokens: int):
+        """Async variant of acquire; waiting does not hold a thread"""
+        wait = await sync_to_async(self.reserve)(user, tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _level(state: Optional[dict], rate: float, burst: float, now: float) -> float:
+        if not state:
+            return burst
+        return min(burst, state['tokens'] + (now - state['at']) * rate)
+
+    @staticmethod
+    @contextmanager
+    def _locked(key: str):
+        """Best-effort cross-worker mutex from cache.add; proceeds unlocked if it cannot get one"""
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.005)
+            acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+        try:
+            yield
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+
+
+# Global instance
+admission = AdmissionController()
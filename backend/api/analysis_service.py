@@ -0,0 +1,172 @@
+# api/analysis_service.py
+"""
+Runs full semantic document analysis and persists it for later reads
+"""
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+from django.db import transaction
+from .models import Cognition, DocumentAnalysisResult, ProcessingJob, SemanticSegment
+from .semantic_models import DocumentAnalysis, SegmentationPreferences
+
+ANALYSIS_JOB_TYPE = 'document_analysis'
+
+
+def node_spans(raw_content: str, nodes) -> List[Tuple[int, int, int]]:
+    """
+    Locate each node's text in raw_content, in position order.
+
+    ``nodes`` yields (node_id, content, source_start, source_end). Offset-backed
+    nodes already know their span; the rest are found by a forward search
+    from the previous match. Returns (node_id, start, end) for every node
+    located; edited nodes that no longer appear in the raw text are left out.
+    """
+    spans = []
+    cursor = 0
+    for node_id, content, source_start, source_end in nodes:
+        if source_start is not None:
+            spans.append((node_id, source_start, source_end))
+            cursor = source_end
+            continue
+        text = content.strip()
+        if not text:
+            continue
+        start = raw_content.find(text, cursor)
+        if start < 0:
+            continue
+        end = start + len(text)
+        spans.append((node_id, start, end))
+        cursor = end
+    return spans
+
+
+class DocumentAnalysisPipeline:
+    """Runs analyze_document for a cognition and stores the result and its segments"""
+
+    def pending_job(self, cognition: Cognition) -> Optional[ProcessingJob]:
+        """An analysis job for this cognition that has not finished yet"""
+        return ProcessingJob.objects.filter(
+            job_type=ANALYSIS_JOB_TYPE,
+            status__in=['pending', 'running'],
+            params__cognition_id=cognition.id,
+        ).first()
+
+    def run(self, job: ProcessingJob, cognition_id: int, preferences: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Analyze a cognition and store the result (ProcessingJob function)"""
+        from .semantic_service import semantic_service
+
+        cognition = Cognition.objects.get(id=cognition_id)
+        raw_content = cognition.raw_content
+        job.set_progress(0, total=2)
+
+        analysis, processing_time = semantic_service.analyze_document(
+            raw_content,
+            SegmentationPreferences(**(preferences or {}))
+        )
+        job.set_progress(1)
+
+        result = self.store(cognition, raw_content, analysis, processing_time, semantic_service.model)
+        job.set_progress(2)
+
+        return {
+            'analysis_id': result.id,
+            'segments_created': result.segments_created,
+            'segments_linked': result.segments_linked,
+            'processing_time_ms': processing_time,
+        }
+
+    def store(
+        self,
+        cognition: Cognition,
+        raw_content: str,
+        analysis: DocumentAnalysis,
+        processing_time: int,
+        model_name: str,
+    ) -> DocumentAnalysisResult:
+        """Replace the cognition's stored analysis with ``analysis`` in one transaction"""
+        text_length = len(raw_content)
+        segments = []
+        for order, segment in enumerate(sorted(analysis.segments, key=lambda s: s.start_position)):
+            start = max(0, min(segment.start_position, text_length))
+            end = max(start, min(segment.end_position, text_length))
+            if end == start:
+                continue
+            segments.append(SemanticSegment(
+                start_position=start,
+                end_position=end,
+                title=segment.title[:200],
+                summary=segment.summary[:500],
+                topic_keywords=segment.topic_keywords,
+                importance_level=segment.importance_level.value,
+                estimated_reading_time=max(0, segment.estimated_reading_time),
+                semantic_coherence_score=segment.semantic_coherence_score,
+                sequence_order=order,
+            ))
+
+        with transaction.atomic():
+            # Lock the cognition so concurrent analyses of it apply one at a time
+            Cognition.objects.select_for_update().filter(id=cognition.id).first()
+            DocumentAnalysisResult.objects.filter(cognition=cognition).delete()
+
+            result = DocumentAnalysisResult.objects.create(
+                cognition=cognition,
+                document_type=analysis.document_type.value,
+                overall_summary=analysis.overall_summary,
+                main_themes=analysis.main_themes,
+                target_audience=analysis.target_audience[:200],
+                complexity_level=analysis.complexity_level,
+                estimated_total_read_time=max(0, analysis.estimated_total_read_time),
+                overall_coherence_score=analysis.overall_coherence_score,
+                segmentation_confidence=analysis.segmentation_confidence,
+                table_of_contents=[section.model_dump() for section in analysis.table_of_contents],
+                reading_flow=analysis.reading_flow.model_dump(),
+                processing_time_ms=processing_time,
+                openai_model_used=model_name,
+                content_hash=hashlib.sha256(raw_content.encode('utf-8')).hexdigest(),
+            )
+
+            for segment in segments:
+                segment.analysis = result
+            linked = self.link_segments(
+                segments,
+                node_spans(raw_content, cognition.nodes.filter(node_type='content')
+                           .order_by('position').values_list('id', 'content', 'source_start', 'source_end'))
+            )
+            SemanticSegment.objects.bulk_create(segments, batch_size=500)
+
+        result.segments_created = len(segments)
+        result.segments_linked = linked
+        return result
+
+    @staticmethod
+    def link_segments(segments: List[SemanticSegment], spans: List[Tuple[int, int, int]]) -> int:
+        """
+        Point each segment at the node it overlaps most, in a single sweep.
+
+        Segments and spans are both ordered by start offset, so one pointer
+        over the spans is enough. A node is linked to at most one segment.
+        """
+        used = set()
+        linked = 0
+        first = 0
+        for segment in segments:
+            while first < len(spans) and spans[first][2] <= segment.start_position:
+                first += 1
+
+            best_id, best_overlap = None, 0
+            i = first
+            while i < len(spans) and spans[i][1] < segment.end_position:
+                node_id, start, end = spans[i]
+                overlap = min(end, segment.end_position) - max(start, segment.start_position)
+                if overlap > best_overlap and node_id not in used:
+                    best_id, best_overlap = node_id, overlap
+                i += 1
+
+            if best_id is not None:
+                segment.node_id = best_id
+                used.add(best_id)
+                linked += 1
+        return linked
+
+
+# Global instance
+analysis_pipeline = DocumentAnalysisPipeline()
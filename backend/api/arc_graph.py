@@ -0,0 +1,183 @@
+# api/arc_graph.py
+"""
+Bounded graph traversal over Arcs, restricted to what a user may see
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+from django.db import models
+from .models import Arc, Node
+
+MAX_DEPTH = 4
+MAX_FANOUT = 100
+MAX_NODES = 500
+
+
+class ArcGraphService:
+    """
+    Neighborhood, shortest-path and subgraph queries over the arc graph.
+
+    Traversal is breadth-first with one query per hop: each query fetches the
+    visible arcs touching the current frontier, strongest first, so depth
+    bounds the number of queries and fan-out bounds the size of each hop.
+    """
+
+    @staticmethod
+    def visible_arcs(user):
+        """Arcs whose two endpoints both belong to cognitions the user can read"""
+        return Arc.objects.filter(
+            models.Q(source_node__cognition__user=user) | models.Q(source_node__cognition__is_public=True),
+            models.Q(target_node__cognition__user=user) | models.Q(target_node__cognition__is_public=True),
+        )
+
+    @staticmethod
+    def visible_nodes(user):
+        return Node.objects.filter(
+            models.Q(cognition__user=user) | models.Q(cognition__is_public=True)
+        )
+
+    def _expand(self, user, frontier: Set[int], max_fanout: int, arc_types=None) -> List[Arc]:
+        """Fetch the strongest visible arcs touching each frontier node, at most max_fanout per node"""
+        arcs = self.visible_arcs(user).filter(
+            models.Q(source_node_id__in=frontier) | models.Q(target_node_id__in=frontier)
+        )
+        if arc_types:
+            arcs = arcs.filter(arc_type__in=arc_types)
+        arcs = arcs.order_by('-strength', 'id')[:len(frontier) * max_fanout * 2]
+
+        per_node: Dict[int, int] = {}
+        kept = []
+        for arc in arcs:
+            ends = [end for end in (arc.source_node_id, arc.target_node_id) if end in frontier]
+            if all(per_node.get(end, 0) >= max_fanout for end in ends):
+                continue
+            for end in ends:
+                per_node[end] = per_node.get(end, 0) + 1
+            kept.append(arc)
+        return kept
+
+    def _node_summaries(self, node_ids, depths: Optional[Dict[int, int]] = None) -> List[Dict[str, Any]]:
+        nodes = Node.objects.filter(id__in=node_ids).values(
+            'id', 'cognition_id', 'position', 'node_type'
+        )
+        summaries = []
+        for node in nodes:
+            summary = {
+                'id': node['id'],
+                'cognition': node['cognition_id'],
+                'position': node['position'],
+                'node_type': node['node_type'],
+            }
+            if depths is not None:
+                summary['depth'] = depths.get(node['id'])
+            summaries.append(summary)
+        summaries.sort(key=lambda n: (n.get('depth') or 0, n['cognition'], n['position']))
+        return summaries
+
+    def neighborhood(self, user, node_id: int, depth: int = 1, max_fanout: int = 25,
+                     max_nodes: int = MAX_NODES, arc_types=None) -> Dict[str, Any]:
+        """Nodes and arcs within ``depth`` hops of ``node_id``"""
+        depth = max(1, min(depth, MAX_DEPTH))
+        max_fanout = max(1, min(max_fanout, MAX_FANOUT))
+        max_nodes = max(1, min(max_nodes, MAX_NODES))
+
+        depths = {node_id: 0}
+        arcs: Dict[int, Arc] = {}
+        frontier = {node_id}
+        truncated = False
+
+        for hop in range(1, depth + 1):
+            if not frontier:
+                break
+            next_frontier = set()
+            for arc in self._expand(user, frontier, max_fanout, arc_types):
+                for end in (arc.source_node_id, arc.target_node_id):
+                    if end in depths:
+                        continue
+                    if len(depths) >= max_nodes:
+                        truncated = True
+                        break
+                    depths[end] = hop
+                    next_frontier.add(end)
+                # Keep arcs only between nodes that made it into the result
+                if arc.source_node_id in depths and arc.target_node_id in depths:
+                    arcs[arc.id] = arc
+            frontier = next_frontier
+
+        return {
+            'root': node_id,
+            'depth': depth,
+            'nodes': self._node_summaries(depths.keys(), depths),
+            'arcs': list(arcs.values()),
+            'truncated': truncated,
+        }
+
+    def shortest_path(self, user, source_id: int, target_id: int, max_depth: int = MAX_DEPTH,
+                      max_fanout: int = MAX_FANOUT, arc_types=None) -> Optional[Dict[str, Any]]:
+        """Shortest undirected arc path between two nodes, or None if none exists within max_depth"""
+        max_depth = max(1, min(max_depth, MAX_DEPTH))
+        max_fanout = max(1, min(max_fanout, MAX_FANOUT))
+
+        if source_id == target_id:
+            return {'nodes': self._node_summaries([source_id]), 'arcs': [], 'length': 0}
+
+        parents: Dict[int, Optional[tuple]] = {source_id: None}
+        frontier = {source_id}
+
+        for _ in range(max_depth):
+            if not frontier:
+                break
+            next_frontier = set()
+            for arc in self._expand(user, frontier, max_fanout, arc_types):
+                for here, there in ((arc.source_node_id, arc.target_node_id),
+                                    (arc.target_node_id, arc.source_node_id)):
+                    if here in frontier and there not in parents:
+                        parents[there] = (here, arc)
+                        next_frontier.add(there)
+            if target_id in parents:
+                break
+            frontier = next_frontier
+
+        if target_id not in parents:
+            return None
+
+        path_nodes = deque([target_id])
+        path_arcs = deque()
+        current = target_id
+        while parents[current] is not None:
+            previous, arc = parents[current]
+            path_nodes.appendleft(previous)
+            path_arcs.appendleft(arc)
+            current = previous
+
+        summaries = {n['id']: n for n in self._node_summaries(path_nodes)}
+        return {
+            'nodes': [summaries[node_id] for node_id in path_nodes],
+            'arcs': list(path_arcs),
+            'length': len(path_arcs),
+        }
+
+    def cognition_subgraph(self, user, cognition, include_external: bool = False,
+                           arc_types=None) -> Dict[str, Any]:
+        """Arcs among a cognition's nodes, optionally including visible arcs that leave it"""
+        node_ids = set(cognition.nodes.values_list('id', flat=True))
+        arcs = self.visible_arcs(user)
+        if include_external:
+            arcs = arcs.filter(models.Q(source_node__cognition=cognition) | models.Q(target_node__cognition=cognition))
+        else:
+            arcs = arcs.filter(source_node__cognition=cognition, target_node__cognition=cognition)
+        if arc_types:
+            arcs = arcs.filter(arc_type__in=arc_types)
+        arcs = list(arcs.order_by('id'))
+
+        for arc in arcs:
+            node_ids.update((arc.source_node_id, arc.target_node_id))
+
+        return {
+            'cognition': cognition.id,
+            'nodes': self._node_summaries(node_ids),
+            'arcs': arcs,
+        }
+
+
+# Global instance
+arc_graph = ArcGraphService()
@@ -0,0 +1,304 @@
+# api/async_views.py
+"""
+Native async versions of the LLM-bound endpoints.
+
+Served under the ASGI entry point these hold no thread while waiting on
+OpenAI, so one process can keep hundreds of LLM requests in flight. Under
+WSGI they still work, but Django runs each one in its own event loop.
+
+DRF views are synchronous, so these are plain Django async views that mirror
+the request and response shapes of their DRF counterparts and authenticate
+with the same expiring API tokens.
+"""
+import functools
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from .models import Cognition, Node
+from .semantic_service import semantic_service, SemanticAnalysisError
+from .serializers import WidgetSerializer
+from .single_flight import single_flight
+from .admission import admission, AdmissionDenied, estimate_tokens, estimate_toc_tokens
+from .text_segmentation import split_into_paragraphs
+from .token_auth import ExpiringTokenAuthentication
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+async def _admit(request, tokens):
+    """Queue for LLM capacity; returns a 429 response with Retry-After when over budget"""
+    try:
+        await admission.acquire_async(request.user, tokens)
+    except AdmissionDenied as e:
+        response = _error(str(e), 429)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+
+def async_api_view(view):
+    """POST-only, token-authenticated async view with a parsed JSON body in request.data"""
+
+    @csrf_exempt
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return _error(f'Method "{request.method}" not allowed.', 405)
+
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) != 2 or auth[0].lower() != 'token':
+            return _error('Authentication credentials were not provided.', 401)
+        try:
+            user, _ = await sync_to_async(ExpiringTokenAuthentication().authenticate_credentials)(auth[1])
+        except AuthenticationFailed as e:
+            return _error(str(e.detail), 401)
+        request.user = user
+
+        try:
+            request.data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return _error('Invalid JSON body', 400)
+
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def _owned_cognition(request, pk):
+    return await Cognition.objects.filter(pk=pk, user=request.user).afirst()
+
+
+@async_api_view
+async def process_text(request, pk):
+    """Async version of CognitionViewSet.process_text"""
+    cognition = await _owned_cognition(request, pk)
+    if cognition is None:
+        return _error('Not found.', 404)
+
+    if not cognition.raw_content.strip():
+        return _error('Cannot process empty content', 400)
+
+    # Try AI semantic segmentation first for substantial text
+    if len(cognition.raw_content) > 200:
+        try:
+            # Over budget, fall back to local splitting rather than reject
+            await admission.acquire_async(request.user, estimate_tokens(len(cognition.raw_content), 2000))
+            result, processing_time = await semantic_service.quick_segmentation_async(
+                cognition.raw_content,
+                max_segments=20
+            )
+            await sync_to_async(cognition.replace_nodes)([
+                cognition.raw_content[segment.start_position:segment.end_position].strip()
+                for segment in result.segments
+            ])
+            return JsonResponse({
+                'status': 'success',
+                'method': 'ai_segmentation',
+                'nodes_created': len(result.segments),
+                'document_type': result.document_type.value,
+                'processing_time_ms': processing_time
+            })
+        except Exception as e:
+            print(f"AI segmentation failed for cognition {cognition.id}: {str(e)}")
+
+    # Fallback to local paragraph splitting
+    created_count = await sync_to_async(cognition.replace_nodes)(split_into_paragraphs(cognition.raw_content))
+    return JsonResponse({
+        'status': 'success',
+        'method': 'fallback_splitting',
+        'nodes_created': created_count
+    })
+
+
+@async_api_view
+async def quick_segment(request, pk):
+    """Async version of CognitionViewSet.quick_segment"""
+    cognition = await _owned_cognition(request, pk)
+    if cognition is None:
+        return _error('You do not have permission to segment this cognition', 403)
+
+    if not cognition.raw_content.strip():
+        return _error('Cannot segment empty content', 400)
+
+    max_segments = request.data.get('max_segments', None)
+    create_nodes = request.data.get('create_nodes', True)
+
+    async def run_segmentation():
+        result, processing_time = await semantic_service.quick_segmentation_async(
+            cognition.raw_content,
+            max_segments
+        )
+
+        if create_nodes:
+            await sync_to_async(cognition.replace_nodes)([
+                cognition.raw_content[segment.start_position:segment.end_position].strip()
+                for segment in result.segments
+            ])
+
+        return {
+            'status': 'success',
+            'document_type': result.document_type.value,
+            'overall_summary': result.overall_summary,
+            'estimated_total_read_time': result.estimated_total_read_time,
+            'segments_created': len(result.segments),
+            'nodes_created': len(result.segments) if create_nodes else 0,
+            'processing_time_ms': processing_time,
+            'segments': [
+                {
+                    'title': seg.title,
+                    'summary': seg.summary,
+                    'start_position': seg.start_position,
+                    'end_position': seg.end_position,
+                    'importance_level': seg.importance_level.value,
+                    'estimated_reading_time': seg.estimated_reading_time
+                } for seg in result.segments
+            ]
+        }
+
+    denied = await _admit(request, estimate_tokens(len(cognition.raw_content), 2000))
+    if denied:
+        return denied
+
+    try:
+        return JsonResponse(await single_flight.run_async(
+            'quick_segment',
+            cognition.id,
+            single_flight.content_hash(cognition.raw_content, max_segments, create_nodes),
+            run_segmentation,
+            shared_errors=(SemanticAnalysisError,)
+        ))
+    except SemanticAnalysisError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        print(f"Quick segmentation error: {str(e)}")
+        return _error(f'Unexpected error during quick analysis: {str(e)}', 500)
+
+
+@async_api_view
+async def generate_toc(request, pk):
+    """Async version of CognitionViewSet.generate_toc"""
+    from .toc_processor import toc_processor
+
+    cognition = await _owned_cognition(request, pk)
+    if cognition is None:
+        return _error('You do not have permission to generate TOC for this cognition', 403)
+
+    mode = request.data.get('mode', 'auto')
+    regenerate = request.data.get('regenerate', False)
+
+    if regenerate or not await sync_to_async(toc_processor.has_toc)(cognition):
+        denied = await _admit(request, await sync_to_async(estimate_toc_tokens)(cognition))
+        if denied:
+            return denied
+
+    async def generate():
+        if regenerate:
+            return await toc_processor.regenerate_toc_for_cognition_async(cognition, mode)
+        return await toc_processor.generate_toc_for_cognition_async(cognition, mode)
+
+    try:
+        result = await single_flight.run_async(
+            'generate_toc',
+            cognition.id,
+            single_flight.content_hash(cognition.revision, regenerate, mode),
+            generate,
+            shared_errors=(ValueError,)
+        )
+        return JsonResponse(result)
+    except ValueError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        print(f"TOC generation error: {str(e)}")
+        return _error(f'Failed to generate TOC: {str(e)}', 500)
+
+
+@async_api_view
+async def create_llm_widget(request):
+    """Async version of WidgetViewSet.create_llm_widget"""
+    from .llm_widget_service import llm_widget_service
+
+    node_id = request.data.get('node_id')
+    llm_preset = request.data.get('llm_preset')
+    custom_prompt = request.data.get('custom_prompt', '')
+    widget_type = request.data.get('widget_type')
+
+    if not node_id:
+        return _error('node_id is required', 400)
+    if not widget_type:
+        return _error('widget_type is required', 400)
+    try:
+        node_id = int(node_id)
+    except (TypeError, ValueError):
+        return _error('node_id must be an integer', 400)
+
+    node = await Node.objects.select_related('cognition').filter(id=node_id).afirst()
+    if node is None:
+        return _error('Node not found', 404)
+
+    if widget_type.startswith('author_') and node.cognition.user_id != request.user.id:
+        return _error('Only the author can create author widgets', 403)
+    if widget_type.startswith('reader_') and not (node.cognition.user_id == request.user.id or node.cognition.is_public):
+        return _error('Cannot create reader widgets on inaccessible nodes', 403)
+
+    denied = await _admit(request, estimate_tokens(len(node.text), 500))
+    if denied:
+        return denied
+
+    async def create_widget():
+        generated_content = await llm_widget_service.generate_async(node.text, llm_preset, custom_prompt)
+
+        widget_data = {
+            'node': node.id,
+            'widget_type': widget_type,
+        }
+        widget_data.update(llm_widget_service.widget_fields(widget_type, llm_preset, generated_content))
+
+        def save_widget():
+            serializer = WidgetSerializer(data=widget_data)
+            if not serializer.is_valid():
+                return {'errors': serializer.errors}
+            widget = serializer.save(user=request.user)
+            return {'widget': WidgetSerializer(widget).data}
+
+        return await sync_to_async(save_widget)()
+
+    try:
+        # A double-submitted request gets the same widget instead of a second one
+        outcome = await single_flight.run_async(
+            'create_llm_widget',
+            node.id,
+            single_flight.content_hash(request.user.id, widget_type, llm_preset, custom_prompt, node.text),
+            create_widget
+        )
+    except Exception as e:
+        return _error(f'Failed to generate widget: {str(e)}', 500)
+
+    if 'errors' in outcome:
+        return JsonResponse(outcome['errors'], status=400)
+    return JsonResponse(outcome['widget'], status=201)
+
+
+@async_api_view
+async def convert_text_to_markdown(request):
+    """Async version of convert_text_to_markdown"""
+    from .openai_service import markdown_service
+
+    raw_text = (request.data.get('raw_text') or '').strip()
+    if not raw_text:
+        return _error('Raw text is required', 400)
+    if len(raw_text) > markdown_service.max_input_chars:
+        return _error('Text too long (max 50,000 characters)', 400)
+
+    denied = await _admit(request, estimate_tokens(len(raw_text), len(raw_text) // 4))
+    if denied:
+        return denied
+
+    try:
+        return JsonResponse(await markdown_service.convert_async(raw_text))
+    except Exception as e:
+        print(f"Markdown conversion error: {str(e)}")
+        return _error(f'Failed to convert text to markdown: {str(e)}', 500)
@@ -0,0 +1,68 @@
+# api/authorization.py
+"""
+Request-scoped group membership lookups for permission checks
+"""
+from typing import Dict, Optional
+from .models import GroupMembership
+
+
+class AuthorizationContext:
+    """
+    The requesting user's group roles, loaded with one query the first time
+    a check needs them and answered from memory for the rest of the request.
+
+    Checks take ids rather than objects where they can, so deciding whether a
+    user may edit a cognition never loads its group. Call invalidate() after
+    changing the user's own memberships within the request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._roles: Optional[Dict[int, str]] = None
+
+    @property
+    def roles(self) -> Dict[int, str]:
+        """group_id -> role for every group the user belongs to"""
+        if self._roles is None:
+            if self.user is None or not self.user.is_authenticated:
+                self._roles = {}
+            else:
+                self._roles = dict(
+                    GroupMembership.objects.filter(user=self.user).values_list('group_id', 'role')
+                )
+        return self._roles
+
+    def role(self, group_id) -> Optional[str]:
+        if group_id is None:
+            return None
+        return self.roles.get(group_id)
+
+    def is_member(self, group_id) -> bool:
+        return self.role(group_id) is not None
+
+    def is_admin(self, group_id) -> bool:
+        return self.role(group_id) == 'admin'
+
+    def can_edit(self, cognition) -> bool:
+        """Same rule as Cognition.can_edit: group admins for group cognitions, else the owner"""
+        if cognition.group_id is not None:
+            return self.is_admin(cognition.group_id)
+        return self.user is not None and cognition.user_id == self.user.pk
+
+    def can_view(self, cognition) -> bool:
+        if cognition.is_public or self.can_edit(cognition):
+            return True
+        return self.is_member(cognition.group_id)
+
+    def invalidate(self):
+        self._roles = None
+
+
+def authorization_for(request) -> AuthorizationContext:
+    """The request's AuthorizationContext, created on first use"""
+    context = getattr(request, '_authorization', None)
+    user = getattr(request, 'user', None)
+    if context is None or context.user is not user:
+        context = AuthorizationContext(user)
+        request._authorization = context
+    return context
@@ -0,0 +1,119 @@
+# api/fields.py
+"""
+Model fields with transparent compression of large text values
+"""
+import base64
+import zlib
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+# Stored values starting with this character carry a one-letter format code.
+# It never starts ordinary prose, and unlike NUL it is valid in every backend.
+MARKER = '\x01'
+PLAIN, ZLIB, ZSTD = 'p', 'z', 's'
+
+DEFAULT_ALGORITHM = 'zlib'
+DEFAULT_THRESHOLD = 2048  # bytes of UTF-8; smaller values are never worth compressing
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 6
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, str) and value[:1] == MARKER
+
+
+def compress_text(value, algorithm: str = DEFAULT_ALGORITHM, threshold: int = DEFAULT_THRESHOLD):
+    """
+    Encode a text value for storage.
+
+    Values of at least ``threshold`` bytes are compressed and base64-encoded
+    behind a format marker, but only when that actually saves space; anything
+    else is returned unchanged (or escaped, if it happens to start with the
+    marker character).
+    """
+    if not isinstance(value, str):
+        return value
+
+    raw = value.encode('utf-8')
+    if len(raw) >= threshold:
+        if algorithm == 'zstd' and zstandard is not None:
+            code, data = ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        else:
+            code, data = ZLIB, zlib.compress(raw, ZLIB_LEVEL)
+        encoded = MARKER + code + base64.b64encode(data).decode('ascii')
+        if len(encoded) < len(raw):
+            return encoded
+
+    return escape_plain(value)
+
+
+def escape_plain(value):
+    """Store a value uncompressed, escaping it if it happens to start with the marker"""
+    if isinstance(value, str) and value.startswith(MARKER):
+        return MARKER + PLAIN + value
+    return value
+
+
+def decompress_text(value):
+    """Inverse of compress_text; plain values pass through"""
+    if not is_compressed(value):
+        return value
+
+    code, payload = value[1:2], value[2:]
+    if code == PLAIN:
+        return payload
+    if code == ZLIB:
+        return zlib.decompress(base64.b64decode(payload)).decode('utf-8')
+    if code == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed text")
+        return zstandard.ZstdDecompressor().decompress(base64.b64decode(payload)).decode('utf-8')
+    return value
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField that can store large values compressed.
+
+    Reads always decompress, so compression can be switched on or off per
+    field without touching existing rows. It is enabled by listing the field
+    in settings.COMPRESSED_TEXT_FIELDS, e.g.
+
+        COMPRESSED_TEXT_FIELDS = {'api.Cognition.raw_content': {'algorithm': 'zlib', 'threshold': 4096}}
+
+    and existing rows are rewritten with the compress_text_fields command.
+    Database-side string operations (icontains, Substr, ordering) see the
+    stored form, so keep compression off for fields that are searched in SQL.
+    """
+
+    def field_label(self) -> str:
+        return f"{self.model._meta.label}.{self.name}"
+
+    def compression_options(self):
+        """This field's entry in COMPRESSED_TEXT_FIELDS, or None when compression is off"""
+        if not hasattr(self, 'model'):
+            return None
+        options = getattr(settings, 'COMPRESSED_TEXT_FIELDS', {}).get(self.field_label())
+        if options is None:
+            return None
+        return options or {}
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def get_db_prep_save(self, value, connection):
+        # Only writes are encoded; lookups compare against the stored form as-is
+        value = super().get_db_prep_save(value, connection)
+        options = self.compression_options()
+        if options is None:
+            return escape_plain(value)
+        return compress_text(
+            value,
+            algorithm=options.get('algorithm', DEFAULT_ALGORITHM),
+            threshold=options.get('threshold', DEFAULT_THRESHOLD),
+        )
@@ -0,0 +1,188 @@
+# api/follow_graph.py
+"""
+Cached adjacency for the follow graph and offline friend-of-friend suggestions
+"""
+from array import array
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import FollowSuggestion, UserProfile
+
+Follow = UserProfile.following.through
+
+DEFAULT_CACHE_TIMEOUT = 60
+PROFILE_ID_TIMEOUT = 60 * 60 * 24
+
+
+class FollowGraph:
+    """
+    Follower and following sets per profile, kept in the Django cache as
+    compact sorted int arrays and invalidated on follow/unfollow (see
+    api/signals.py).
+
+    The graph is a read path only: follow and unfollow always write the join
+    table. Invalidation reaches other workers only through a shared cache
+    backend (Redis, Memcached, database); with the default local-memory
+    cache, which is per process, another worker can serve a stale set for up
+    to FOLLOW_GRAPH_CACHE_TIMEOUT seconds, so keep that short unless the
+    cache is shared.
+
+    A set is read from the cache (or one indexed query on a miss) once per
+    request at most; the graph keeps a per-request memo of the decoded
+    frozensets, so membership checks after that are O(1). Callers that
+    live longer than a request should call forget() or use a fresh graph.
+    """
+
+    def __init__(self):
+        self._memo: Dict[Tuple[str, int], FrozenSet[int]] = {}
+
+    @staticmethod
+    def _key(direction: str, profile_id: int) -> str:
+        return f'follow-graph:{direction}:{profile_id}'
+
+    def _load(self, direction: str, profile_id: int) -> FrozenSet[int]:
+        memo_key = (direction, profile_id)
+        ids = self._memo.get(memo_key)
+        if ids is not None:
+            return ids
+
+        packed = cache.get(self._key(direction, profile_id))
+        if packed is None:
+            if direction == 'following':
+                rows = Follow.objects.filter(from_userprofile_id=profile_id).values_list('to_userprofile_id', flat=True)
+            else:
+                rows = Follow.objects.filter(to_userprofile_id=profile_id).values_list('from_userprofile_id', flat=True)
+            packed = array('q', sorted(rows)).tobytes()
+            cache.set(self._key(direction, profile_id), packed,
+                      getattr(settings, 'FOLLOW_GRAPH_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+
+        values = array('q')
+        values.frombytes(packed)
+        ids = self._memo[memo_key] = frozenset(values)
+        return ids
+
+    def following(self, profile_id: int) -> FrozenSet[int]:
+        """Profile ids this profile follows"""
+        return self._load('following', profile_id)
+
+    def followers(self, profile_id: int) -> FrozenSet[int]:
+        """Profile ids following this profile"""
+        return self._load('followers', profile_id)
+
+    def is_following(self, profile_id: int, other_id: int) -> bool:
+        return other_id in self.following(profile_id)
+
+    def invalidate(self, profile_ids: Iterable[int]):
+        """Drop the cached sets of profiles whose follows changed"""
+        keys = []
+        for profile_id in set(profile_ids):
+            for direction in ('following', 'followers'):
+                keys.append(self._key(direction, profile_id))
+                self._memo.pop((direction, profile_id), None)
+        cache.delete_many(keys)
+
+    def forget(self):
+        """Clear the per-request memo (the shared cache is untouched)"""
+        self._memo.clear()
+
+
+def follow_graph_for(request) -> FollowGraph:
+    """The request's FollowGraph, created on first use"""
+    graph = getattr(request, '_follow_graph', None)
+    if graph is None:
+        graph = request._follow_graph = FollowGraph()
+    return graph
+
+
+def profile_id_for(user) -> Optional[int]:
+    """The user's profile id, cached; the user/profile pairing never changes"""
+    key = f'follow-graph:profile-of:{user.pk}'
+    profile_id = cache.get(key)
+    if profile_id is None:
+        profile_id = UserProfile.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+        if profile_id is not None:
+            cache.set(key, profile_id, PROFILE_ID_TIMEOUT)
+    return profile_id
+
+
+class FollowSuggestionService:
+    """
+    Friend-of-friend suggestions over the whole follow graph.
+
+    With A the sparse adjacency matrix (A[i, j] = 1 when i follows j), row i
+    of A @ A counts, for every profile j, how many of the profiles i follows
+    follow j. Self-loops and profiles i already follows are removed and the
+    top ``limit`` per row are kept, ties broken by the smaller profile id.
+    Rows are multiplied in blocks so memory stays bounded on large graphs.
+    """
+
+    def __init__(self, block_size: int = 4096):
+        self.block_size = block_size
+
+    def compute(self, limit: int = 20, min_mutual: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(profile ids, suggested profile ids, mutual counts), grouped by profile, best first"""
+        edges = np.array(list(Follow.objects.values_list('from_userprofile_id', 'to_userprofile_id')), dtype=np.int64)
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(edges):
+            return empty, empty, empty
+
+        ids, dense = np.unique(edges, return_inverse=True)
+        dense = dense.reshape(edges.shape)
+        n = len(ids)
+        adjacency = sparse.csr_matrix(
+            (np.ones(len(edges), dtype=np.int32), (dense[:, 0], dense[:, 1])), shape=(n, n)
+        )
+        adjacency.sum_duplicates()
+        adjacency.data[:] = 1
+
+        rows_out, cols_out, counts_out = [], [], []
+        for start in range(0, n, self.block_size):
+            stop = min(start + self.block_size, n)
+            block = adjacency[start:stop]
+            # Drop existing follows (entries where A is one), then self-loops below
+            candidates = (block @ adjacency).tocsr()
+            candidates = candidates - candidates.multiply(block)
+            candidates.eliminate_zeros()
+            coo = candidates.tocoo()
+            keep = (coo.data >= min_mutual) & (coo.row + start != coo.col)
+            rows, cols, counts = coo.row[keep] + start, coo.col[keep], coo.data[keep]
+
+            # Best first within each row: sort by row, then count descending, then id
+            order = np.lexsort((ids[cols], -counts, rows))
+            rows, cols, counts = rows[order], cols[order], counts[order]
+            starts = np.searchsorted(rows, rows, side='left')
+            rank = np.arange(len(rows)) - starts
+            top = rank < limit
+            rows_out.append(rows[top])
+            cols_out.append(cols[top])
+            counts_out.append(counts[top])
+
+        rows = np.concatenate(rows_out)
+        return ids[rows], ids[np.concatenate(cols_out)], np.concatenate(counts_out).astype(np.int64)
+
+    def store(self, profile_ids: np.ndarray, suggested_ids: np.ndarray, counts: np.ndarray) -> int:
+        """Replace every stored suggestion with the computed ones"""
+        now = timezone.now()
+        with transaction.atomic():
+            FollowSuggestion.objects.all().delete()
+            FollowSuggestion.objects.bulk_create([
+                FollowSuggestion(profile_id=int(p), suggested_id=int(s), mutual_count=int(c), computed_at=now)
+                for p, s, c in zip(profile_ids, suggested_ids, counts)
+            ], batch_size=1000)
+        return len(counts)
+
+    def for_profile(self, profile_id: int, graph: FollowGraph, limit: int = 10) -> List[FollowSuggestion]:
+        """Stored suggestions, skipping profiles followed since they were computed"""
+        following = graph.following(profile_id)
+        suggestions = FollowSuggestion.objects.filter(profile_id=profile_id).select_related(
+            'suggested__user', 'suggested__stats'
+        )
+        return [s for s in suggestions if s.suggested_id not in following][:limit]
+
+
+# Global instance
+follow_suggestions = FollowSuggestionService()
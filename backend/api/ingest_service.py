@@ -0,0 +1,227 @@
+# api/ingest_service.py
+"""
+Bulk ingestion of many documents into cognitions with locally segmented nodes
+"""
+import json
+import logging
+import os
+import zipfile
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Cognition, Node, ProcessingJob
+from .profile_stats import profile_stats
+from .text_segmentation import split_into_paragraphs
+
+INGEST_FILE_EXTENSIONS = ('.txt', '.md', '.markdown')
+ENRICHMENT_OPERATIONS = ('toc',)
+DEFAULT_MAX_FILE_BYTES = 2 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class IngestError(Exception):
+    """Raised for a single document that cannot be ingested"""
+    pass
+
+
+class BulkIngestService:
+    """Creates cognitions and nodes for a stream of documents in bounded batches"""
+
+    def __init__(self, documents_per_batch: int = 25, batch_size: int = 500, max_document_chars: int = 500000):
+        self.documents_per_batch = documents_per_batch
+        self.batch_size = batch_size
+        self.max_document_chars = max_document_chars
+
+    # Document sources
+
+    def iter_ndjson_documents(self, lines: Iterable[bytes]) -> Iterator[Tuple[int, Any]]:
+        """
+        Yield (index, document) pairs from NDJSON lines.
+
+        Each line is {"title": ..., "content": ..., "is_public": false}. A line that
+        fails to parse is yielded as an IngestError so it can be reported without
+        aborting the rest of the upload.
+        """
+        index = 0
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+                if not isinstance(document, dict):
+                    raise IngestError('Each line must be a JSON object')
+            except (json.JSONDecodeError, IngestError) as e:
+                document = IngestError(f'Invalid document: {str(e)}')
+            yield index, document
+            index += 1
+
+    def iter_zip_documents(self, fileobj) -> Iterator[Tuple[int, Any]]:
+        """
+        (index, document) pairs for every text/markdown file in a zip archive.
+
+        The archive is opened here, so an invalid one raises IngestError before
+        the caller starts streaming; files are read as the iterator is consumed.
+        Files over settings.INGEST_MAX_FILE_BYTES uncompressed are reported as
+        errors without being read.
+        """
+        try:
+            archive = zipfile.ZipFile(fileobj)
+            entries = archive.infolist()
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+            raise IngestError(f'Uploaded file is not a valid zip archive: {str(e)}')
+        return self._zip_documents(archive, entries)
+
+    def _zip_documents(self, archive: zipfile.ZipFile, entries) -> Iterator[Tuple[int, Any]]:
+        max_bytes = getattr(settings, 'INGEST_MAX_FILE_BYTES', DEFAULT_MAX_FILE_BYTES)
+        index = 0
+        with archive:
+            for info in entries:
+                name = info.filename
+                if info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.'):
+                    continue
+                if not name.lower().endswith(INGEST_FILE_EXTENSIONS):
+                    continue
+                if info.file_size > max_bytes:
+                    document = IngestError(f'{name} is too large (max {max_bytes:,} bytes uncompressed)')
+                else:
+                    # zipfile stops decompressing at the declared file_size, so the cap holds
+                    try:
+                        content = archive.read(info).decode('utf-8')
+                        document = {'title': self._title_from_filename(name), 'content': content}
+                    except UnicodeDecodeError:
+                        document = IngestError(f'{name} is not UTF-8 text')
+                    except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError) as e:
+                        document = IngestError(f'{name} could not be extracted: {str(e)}')
+                yield index, document
+                index += 1
+
+    @staticmethod
+    def _title_from_filename(name: str) -> str:
+        base = os.path.splitext(os.path.basename(name))[0]
+        return base.replace('_', ' ').replace('-', ' ').strip() or 'Untitled'
+
+    # Ingestion
+
+    def ingest(self, documents: Iterable[Tuple[int, Any]], user) -> Iterator[Dict[str, Any]]:
+        """
+        Ingest documents for ``user``, yielding one progress event per document.
+
+        Documents are buffered into batches; each batch is written in its own
+        transaction with bulk_create, so a failing batch never rolls back
+        documents that were already reported as created.
+        """
+        batch: List[Tuple[int, Dict[str, Any]]] = []
+        for index, document in documents:
+            if isinstance(document, IngestError):
+                yield {'index': index, 'status': 'error', 'error': str(document)}
+                continue
+            try:
+                prepared = self._prepare(document)
+            except IngestError as e:
+                yield {'index': index, 'title': document.get('title'), 'status': 'error', 'error': str(e)}
+                continue
+            batch.append((index, prepared))
+            if len(batch) >= self.documents_per_batch:
+                yield from self._write_batch(batch, user)
+                batch = []
+
+        if batch:
+            yield from self._write_batch(batch, user)
+
+    def _prepare(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        content = document.get('content') or document.get('raw_content') or ''
+        if not isinstance(content, str) or not content.strip():
+            raise IngestError('Document content is empty')
+        if len(content) > self.max_document_chars:
+            raise IngestError(f'Document too long (max {self.max_document_chars:,} characters)')
+
+        title = document.get('title') or ''
+        if not isinstance(title, str):
+            raise IngestError('Document title must be a string')
+        title = title.strip() or content.strip().split('\n', 1)[0].lstrip('# ')
+
+        is_public = document.get('is_public', False)
+        if not isinstance(is_public, bool):
+            raise IngestError('is_public must be true or false')
+        return {
+            'title': title[:200],
+            'content': content,
+            'is_public': is_public,
+            'paragraphs': split_into_paragraphs(content),
+        }
+
+    def _write_batch(self, batch, user) -> Iterator[Dict[str, Any]]:
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                cognitions = Cognition.objects.bulk_create([
+                    Cognition(
+                        title=doc['title'],
+                        raw_content=doc['content'],
+                        is_public=doc['is_public'],
+                        share_date=now if doc['is_public'] else None,
+                        user=user,
+                    )
+                    for _, doc in batch
+                ])
+                nodes = [
+                    node
+                    for (_, doc), cognition in zip(batch, cognitions)
+                    for node in cognition.build_nodes(doc['paragraphs'])
+                ]
+                Node.objects.bulk_create(nodes, batch_size=self.batch_size)
+        except Exception as e:
+            logger.exception('Bulk ingest batch of %d documents failed', len(batch))
+            for index, doc in batch:
+                yield {'index': index, 'title': doc['title'], 'status': 'error', 'error': f'Failed to save document: {str(e)}'}
+            return
+
+        # bulk_create skips the post_save signals that keep the profile counters current
+        if any(doc['is_public'] for _, doc in batch):
+            profile_stats.refresh_cognitions(user.id)
+
+        for (index, doc), cognition in zip(batch, cognitions):
+            yield {
+                'index': index,
+                'title': doc['title'],
+                'status': 'created',
+                'cognition_id': cognition.id,
+                'nodes_created': len(doc['paragraphs']),
+            }
+
+    # Enrichment
+
+    def enrich(self, job: ProcessingJob, cognition_ids: List[int], operations: List[str]) -> Dict[str, Any]:
+        """
+        Run optional AI enrichment for ingested cognitions (ProcessingJob
+        function). Each LLM call is admitted against the owner's token bucket
+        first; a call refused for capacity is reported with its retry_after.
+        """
+        from .admission import admission, AdmissionDenied, estimate_toc_tokens
+        from .toc_processor import toc_processor
+
+        results = {}
+        cognitions = Cognition.objects.filter(id__in=cognition_ids).select_related('user').order_by('id')
+        for done, cognition in enumerate(cognitions, 1):
+            outcome = {}
+            if 'toc' in operations:
+                try:
+                    admission.acquire(cognition.user, estimate_toc_tokens(cognition))
+                    outcome['toc'] = toc_processor.generate_toc_for_cognition(cognition)
+                except AdmissionDenied as e:
+                    outcome['toc'] = {'error': str(e), 'retry_after': e.retry_after}
+                except Exception as e:
+                    outcome['toc'] = {'error': str(e)}
+            results[str(cognition.id)] = outcome
+            job.set_progress(done)
+
+        return {'cognitions': results}
+
+
+# Global instance
+ingest_service = BulkIngestService()
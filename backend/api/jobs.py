@@ -0,0 +1,77 @@
+# api/jobs.py
+"""
+Background execution of ProcessingJob work outside the request/response cycle
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .llm_ledger import llm_ledger
+from .models import ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """
+    Runs job functions on a small thread pool.
+
+    Job functions receive the ProcessingJob as their first argument, may call
+    job.set_progress() as they go, and return a JSON-serializable result dict.
+    With settings.PROCESSING_JOBS_EAGER the work runs inline instead, which is
+    what tests and management commands want.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or getattr(settings, 'PROCESSING_JOB_WORKERS', 4)
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='processing-job'
+            )
+        return self._executor
+
+    def create(self, user, job_type: str, total: int = 0, params: dict = None) -> ProcessingJob:
+        return ProcessingJob.objects.create(
+            user=user,
+            job_type=job_type,
+            progress_total=total,
+            params=params or {},
+        )
+
+    def submit(self, job: ProcessingJob, func: Callable[..., Any], *args, **kwargs):
+        if getattr(settings, 'PROCESSING_JOBS_EAGER', False):
+            self._run(job.id, func, args, kwargs)
+        else:
+            self.executor.submit(self._run, job.id, func, args, kwargs)
+        return job
+
+    def _run(self, job_id, func, args, kwargs):
+        close_old_connections()
+        try:
+            job = ProcessingJob.objects.get(id=job_id)
+            job.status = 'running'
+            job.save(update_fields=['status', 'updated_at'])
+            try:
+                with llm_ledger.attributed_to(job.user_id):
+                    result = func(job, *args, **kwargs)
+                job.status = 'completed'
+                job.result = result or {}
+            except Exception as e:
+                logger.exception("Processing job %s failed", job_id)
+                job.status = 'failed'
+                job.error = str(e)
+            job.finished_at = timezone.now()
+            job.save()
+        finally:
+            close_old_connections()
+
+
+# Global instance
+job_runner = JobRunner()
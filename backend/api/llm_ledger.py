@@ -0,0 +1,346 @@
+# api/llm_ledger.py
+"""
+Ledger of OpenAI calls: tokens, latency, truncation, cache hits and cost per call
+"""
+import atexit
+import contextvars
+import logging
+import math
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import Count, Q, Sum
+from django.utils.functional import LazyObject, empty
+from .models import LLMCall
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens as (prompt, completion); settings.LLM_PRICING overrides or extends it.
+# A dated model name ("gpt-4o-2024-08-06") is priced by its longest matching prefix.
+DEFAULT_PRICING = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o': (0.0025, 0.01),
+    'gpt-4o-mini': (0.00015, 0.0006),
+}
+
+_request = contextvars.ContextVar('llm_ledger_request', default=None)
+_user_id = contextvars.ContextVar('llm_ledger_user_id', default=None)
+_collector = contextvars.ContextVar('llm_ledger_collector', default=None)
+
+WRITE_ATTEMPTS = 4  # Tries per insert when SQLite reports the table locked by a concurrent writer
+WRITE_RETRY_DELAY = 0.05  # Seconds before the first retry; doubles on each one
+
+
+def pricing() -> Dict[str, tuple]:
+    return {**DEFAULT_PRICING, **getattr(settings, 'LLM_PRICING', {})}
+
+
+def cost_usd(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Decimal:
+    """What a call cost at the configured prices; zero for models without a price"""
+    table = pricing()
+    matches = [name for name in table if model and model.startswith(name)]
+    if not matches:
+        return Decimal(0)
+    prompt_price, completion_price = table[max(matches, key=len)]
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    return Decimal(str(round(cost, 6)))
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+class LLMLedger:
+    """
+    Records an LLMCall row for every chat completion made through
+    api.openai_service.create_completion (and create_completion_async), and
+    for every result single_flight shares with an identical waiting request
+    (cache_hit, no tokens or cost).
+
+    Calls are attributed to the user of the request they happen in (bound by
+    LLMCallAttributionMiddleware once DRF or async_api_view has
+    authenticated it) or of the ProcessingJob running them.
+
+    With LLM_LEDGER_ASYNC (the default), record() only queues the row: a
+    background thread inserts queued rows in batches of up to
+    LLM_LEDGER_BATCH_SIZE, at least every LLM_LEDGER_FLUSH_INTERVAL seconds,
+    so no request waits on a ledger write. Rows still queued when the process
+    is killed are lost. Without it rows are written as they are recorded,
+    which is what tests want.
+
+    Code that fans calls out to a thread pool records them inside
+    collected(), so the rows are written once, from the thread that owns the
+    job, instead of from several threads competing for the database.
+    """
+
+    def __init__(self):
+        self._queue: 'queue.Queue[LLMCall]' = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'LLM_LEDGER_ENABLED', True)
+
+    @property
+    def asynchronous(self) -> bool:
+        return getattr(settings, 'LLM_LEDGER_ASYNC', True)
+
+    @property
+    def batch_size(self) -> int:
+        return max(1, getattr(settings, 'LLM_LEDGER_BATCH_SIZE', 100))
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, 'LLM_LEDGER_FLUSH_INTERVAL', 2)
+
+    # Attribution
+
+    def bind_request(self, request) -> contextvars.Token:
+        return _request.set(request)
+
+    def unbind_request(self, token: contextvars.Token):
+        _request.reset(token)
+
+    @contextmanager
+    def attributed_to(self, user_id: Optional[int]):
+        """Attribute calls made inside the block to this user"""
+        token = _user_id.set(user_id)
+        try:
+            yield
+        finally:
+            _user_id.reset(token)
+
+    @contextmanager
+    def collected(self):
+        """
+        Hold rows recorded inside the block, including by threads running a
+        copy of its context, and store them from this thread when it exits
+        """
+        rows: List[LLMCall] = []
+        token = _collector.set(rows)
+        try:
+            yield
+        finally:
+            _collector.reset(token)
+            self._store(rows)
+
+    @staticmethod
+    def current_user_id() -> Optional[int]:
+        user_id = _user_id.get()
+        if user_id is not None:
+            return user_id
+        request = _request.get()
+        if request is None:
+            return None
+        # Only a user already resolved: loading a lazy session user here would
+        # query the database, which async callers cannot do
+        user = request.__dict__.get('user')
+        if isinstance(user, LazyObject):
+            user = None if user._wrapped is empty else user._wrapped
+        return user.pk if user is not None and user.is_authenticated else None
+
+    # Recording
+
+    def build(self, call: Dict[str, Any], cache_hit: bool = False) -> LLMCall:
+        """An unsaved LLMCall from a call record (see openai_service._llm_call)"""
+        prompt_tokens = call.get('prompt_tokens') or 0
+        completion_tokens = call.get('completion_tokens') or 0
+        return LLMCall(
+            user_id=self.current_user_id(),
+            operation=call['operation'][:50],
+            model=(call.get('model') or '')[:100],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=call['duration_ms'],
+            finish_reason=(call.get('finish_reason') or '')[:30],
+            cache_hit=cache_hit,
+            cost_usd=Decimal(0) if cache_hit else cost_usd(call.get('model'), prompt_tokens, completion_tokens),
+            error=call.get('error') or '',
+        )
+
+    def record(self, call: Dict[str, Any], cache_hit: bool = False):
+        if not self.enabled:
+            return
+        row = self.build(call, cache_hit)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(row)
+        else:
+            self._store([row])
+
+    async def record_async(self, call: Dict[str, Any], cache_hit: bool = False):
+        """record() for async callers; a synchronous write runs in a thread"""
+        if not self.enabled:
+            return
+        row = self.build(call, cache_hit)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(row)
+        elif self.asynchronous:
+            self._enqueue(row)
+        else:
+            await sync_to_async(self._write_quietly)([row])
+
+    def record_cache_hit(self, operation: str, started: float):
+        """A single-flight result shared with a request that waited since ``started``"""
+        self.record(self._cache_hit(operation, started), cache_hit=True)
+
+    async def record_cache_hit_async(self, operation: str, started: float):
+        await self.record_async(self._cache_hit(operation, started), cache_hit=True)
+
+    @staticmethod
+    def _cache_hit(operation: str, started: float) -> Dict[str, Any]:
+        return {'operation': operation, 'duration_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+    @staticmethod
+    def write(rows: List[LLMCall]):
+        """Insert rows, retrying while SQLite reports a concurrent writer's lock"""
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                LLMCall.objects.bulk_create(rows)
+                return
+            except OperationalError as e:
+                # Inside a transaction the failed statement has already spoiled it; let the caller see that
+                if 'locked' not in str(e) or connection.in_atomic_block or attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                time.sleep(WRITE_RETRY_DELAY * 2 ** attempt)
+
+    def _store(self, rows: List[LLMCall]):
+        """Queue rows for the background writer, or write them now"""
+        if not rows:
+            return
+        if self.asynchronous:
+            for row in rows:
+                self._enqueue(row)
+        else:
+            self._write_quietly(rows)
+
+    def _write_quietly(self, rows: List[LLMCall]):
+        """write() for the call path: a ledger failure is logged, never raised into the LLM call"""
+        try:
+            self.write(rows)
+        except Exception:
+            logger.exception("LLM ledger write of %d calls failed", len(rows))
+
+    # Background writer
+
+    def _enqueue(self, row: LLMCall):
+        self._queue.put(row)
+        if self._writer is None or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_loop, name='llm-ledger', daemon=True)
+                    self._writer.start()
+
+    def _take_batch(self, block: bool) -> List[LLMCall]:
+        """Up to batch_size queued rows; when ``block``, wait for the first and give others flush_interval to arrive"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if not block:
+                    batch.append(self._queue.get_nowait())
+                elif deadline is None:
+                    batch.append(self._queue.get())
+                    deadline = time.monotonic() + self.flush_interval
+                else:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._take_batch(block=True)
+            close_old_connections()
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception("LLM ledger write of %d calls failed", len(batch))
+            finally:
+                close_old_connections()
+
+    def flush(self) -> int:
+        """Write every queued row now, from this thread; returns how many were written"""
+        written = 0
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return written
+            self.write(batch)
+            written += len(batch)
+
+    # Reporting
+
+    def report(self, since: datetime, by: str = 'operation', user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Totals of calls made since ``since``, overall and per ``by``
+        ('operation', 'user' or 'model'), most expensive first: calls, cache
+        hits, errors, truncations, tokens, cost and the latency percentiles
+        of calls that reached OpenAI
+        """
+        key = {'operation': 'operation', 'user': 'user__username', 'model': 'model'}[by]
+        calls = LLMCall.objects.filter(created_at__gte=since)
+        if user_id is not None:
+            calls = calls.filter(user_id=user_id)
+
+        totals = {
+            'calls': Count('id'),
+            'cache_hits': Count('id', filter=Q(cache_hit=True)),
+            'errors': Count('id', filter=~Q(error='')),
+            'truncated': Count('id', filter=Q(finish_reason='length')),
+            'prompt_tokens': Sum('prompt_tokens'),
+            'completion_tokens': Sum('completion_tokens'),
+            'cost_usd': Sum('cost_usd'),
+        }
+        groups = {group.pop(key): group for group in calls.values(key).annotate(**totals).order_by()}
+
+        # Percentiles need the values themselves: only latencies of calls that reached OpenAI
+        latencies = defaultdict(list)
+        reached = calls.filter(cache_hit=False).values_list(key, 'latency_ms').order_by()
+        for name, latency_ms in reached.iterator(chunk_size=5000):
+            latencies[name].append(latency_ms)
+
+        rows = [{by: name, **_row(group, latencies[name])} for name, group in groups.items()]
+        return {
+            'since': since.isoformat(),
+            'by': by,
+            'total': _row(
+                {name: sum(group[name] or 0 for group in groups.values()) for name in totals},
+                [value for values in latencies.values() for value in values]
+            ),
+            'rows': sorted(rows, key=lambda row: (-row['cost_usd'], -row['calls'], str(row[by]))),
+        }
+
+
+def _row(totals: Dict[str, Any], latencies: List[float]) -> Dict[str, Any]:
+    """One report row from its SQL aggregates and the latencies behind its percentiles"""
+    return {
+        'calls': totals['calls'],
+        'cache_hits': totals['cache_hits'],
+        'errors': totals['errors'],
+        'truncated': totals['truncated'],
+        'prompt_tokens': totals['prompt_tokens'] or 0,
+        'completion_tokens': totals['completion_tokens'] or 0,
+        'cost_usd': float(round(Decimal(str(totals['cost_usd'] or 0)), 6)),
+        'p50_latency_ms': percentile(latencies, 50),
+        'p95_latency_ms': percentile(latencies, 95),
+    }
+
+
+# Global instance
+llm_ledger = LLMLedger()
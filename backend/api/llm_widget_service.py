@@ -0,0 +1,178 @@
+# api/llm_widget_service.py
+"""
+OpenAI-backed generation of widget content for single nodes and whole cognitions
+"""
+import contextvars
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+import openai
+from django.conf import settings
+from django.db import transaction
+from .llm_ledger import llm_ledger
+from .models import Node, ProcessingJob, Widget
+
+
+class LLMWidgetService:
+    """Builds prompts for LLM widget presets and generates their content"""
+
+    model = "gpt-3.5-turbo"
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self) -> openai.OpenAI:
+        # One client (and its connection pool) shared by every request and worker thread
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+
+    def build_prompts(self, llm_preset: Optional[str], content: str, custom_prompt: str = '') -> Tuple[str, str]:
+        """Return (system_prompt, user_prompt) for a preset"""
+        if llm_preset == 'quiz':
+            system_prompt = """You are an expert educator. Create a thoughtful quiz question based on the provided text content. The question should test understanding of key concepts or ideas."""
+            user_prompt = f"Create a quiz question for this content:\n\n{content}\n\nCustom instructions: {custom_prompt}"
+        elif llm_preset == 'summary':
+            system_prompt = """You are an expert at creating concise summaries. Create a brief, accurate summary of the provided content."""
+            user_prompt = f"Summarize this content:\n\n{content}\n\nCustom instructions: {custom_prompt}"
+        elif llm_preset == 'analysis':
+            system_prompt = """You are an expert analyst. Provide insightful analysis of the provided content, highlighting key themes, implications, or significance."""
+            user_prompt = f"Analyze this content:\n\n{content}\n\nCustom instructions: {custom_prompt}"
+        elif llm_preset == 'discussion':
+            system_prompt = """You are a discussion facilitator. Create thought-provoking discussion points or questions to help readers engage deeply with the content."""
+            user_prompt = f"Create discussion points for this content:\n\n{content}\n\nCustom instructions: {custom_prompt}"
+        else:
+            # Custom prompt
+            system_prompt = "You are a helpful assistant that creates educational content based on provided text."
+            user_prompt = f"Content: {content}\n\nTask: {custom_prompt}"
+        return system_prompt, user_prompt
+
+    def generate(self, content: str, llm_preset: Optional[str], custom_prompt: str = '') -> str:
+        from .openai_service import create_completion
+
+        system_prompt, user_prompt = self.build_prompts(llm_preset, content, custom_prompt)
+        response = create_completion(
+            self.client, 'llm_widget',
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7,
+            max_tokens=500
+        )
+        return response.choices[0].message.content.strip()
+
+    async def generate_async(self, content: str, llm_preset: Optional[str], custom_prompt: str = '') -> str:
+        """Async variant of generate for the ASGI views"""
+        from .openai_service import create_completion_async, get_async_client
+
+        system_prompt, user_prompt = self.build_prompts(llm_preset, content, custom_prompt)
+        response = await create_completion_async(
+            get_async_client(), 'llm_widget',
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.7,
+            max_tokens=500
+        )
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    def widget_fields(widget_type: str, llm_preset: Optional[str], generated_content: str) -> Dict[str, Any]:
+        """Map generated text onto the widget fields for its type"""
+        fields = {}
+        if 'quiz' in widget_type:
+            fields['quiz_question'] = generated_content
+        else:
+            fields['content'] = generated_content
+
+        if 'remark' in widget_type:
+            fields['title'] = f"AI-Generated {(llm_preset or 'custom').title()}"
+        return fields
+
+    def generate_for_nodes(
+        self,
+        job: ProcessingJob,
+        user,
+        cognition_id: int,
+        widget_type: str,
+        llm_preset: Optional[str],
+        custom_prompt: str = '',
+        node_ids: Optional[List[int]] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate one widget per node of a cognition (ProcessingJob function).
+
+        Nodes with identical content share one LLM call, calls run with bounded
+        concurrency, and all widgets are written with a single bulk_create.
+        """
+        max_concurrency = max_concurrency or getattr(settings, 'LLM_BATCH_MAX_CONCURRENCY', 8)
+
+        nodes = Node.objects.filter(cognition_id=cognition_id, node_type='content').order_by('position')
+        if node_ids:
+            nodes = nodes.filter(id__in=node_ids)
+        nodes = list(nodes.with_text().only('id', 'content', 'source_start', 'source_end'))
+
+        # Dedupe identical node contents so each distinct text costs one call
+        by_digest: Dict[str, List[Node]] = {}
+        for node in nodes:
+            if not node.text.strip():
+                continue
+            digest = hashlib.sha256(node.text.encode('utf-8')).hexdigest()
+            by_digest.setdefault(digest, []).append(node)
+
+        # Progress counts LLM calls: one per distinct non-empty text
+        job.set_progress(0, total=len(by_digest))
+
+        generated: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+        done = 0
+        # Pool threads hand their ledger rows back to be written from this thread
+        with llm_ledger.collected():
+            with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-widget') as pool:
+                futures = {
+                    pool.submit(contextvars.copy_context().run, self.generate, group[0].text, llm_preset, custom_prompt): digest
+                    for digest, group in by_digest.items()
+                }
+                for future in as_completed(futures):
+                    digest = futures[future]
+                    try:
+                        generated[digest] = future.result()
+                    except Exception as e:
+                        errors[digest] = str(e)
+                    done += 1
+                    job.set_progress(done)
+
+        widgets = []
+        failed_nodes = {}
+        for digest, group in by_digest.items():
+            for node in group:
+                if digest in generated:
+                    widgets.append(Widget(
+                        node_id=node.id,
+                        user=user,
+                        widget_type=widget_type,
+                        **self.widget_fields(widget_type, llm_preset, generated[digest])
+                    ))
+                else:
+                    failed_nodes[str(node.id)] = errors[digest]
+
+        with transaction.atomic():
+            widgets = Widget.objects.bulk_create(widgets, batch_size=500)
+
+        return {
+            'widgets_created': len(widgets),
+            'widget_ids': [widget.id for widget in widgets],
+            'llm_calls': len(by_digest),
+            'failed_nodes': failed_nodes,
+        }
+
+
+# Global instance
+llm_widget_service = LLMWidgetService()
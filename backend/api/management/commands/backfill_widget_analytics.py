@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Cognition
+from api.widget_analytics import TRACKED_WIDGET_TYPES, widget_analytics
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the widget analytics rollups (WidgetStats, CognitionEngagementStats) from '
+        'WidgetInteraction for cognitions with author quiz or LLM widgets'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cognition',
+            type=int,
+            action='append',
+            dest='cognitions',
+            help='Cognition id to rebuild (repeatable; default: every cognition with tracked widgets)',
+        )
+
+    def handle(self, *args, **options):
+        cognitions = Cognition.objects.filter(
+            nodes__widgets__widget_type__in=TRACKED_WIDGET_TYPES
+        ).distinct().order_by('id')
+        if options['cognitions']:
+            cognitions = Cognition.objects.filter(id__in=options['cognitions']).order_by('id')
+            missing = set(options['cognitions']) - set(cognitions.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Unknown cognition ids: {', '.join(map(str, sorted(missing)))}")
+
+        widgets = readers = rebuilt = 0
+        for cognition in cognitions.only('id', 'title'):
+            counts = widget_analytics.rebuild(cognition)
+            widgets += counts['widgets']
+            readers += counts['readers']
+            rebuilt += 1
+            self.stdout.write(f"{cognition.id}: {counts['widgets']} widgets, {counts['readers']} readers")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt analytics for {rebuilt} cognitions ({widgets} widgets, {readers} reader funnels)'
+        ))
@@ -0,0 +1,84 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models.functions import Cast
+from api.fields import CompressedTextField, decompress_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite CompressedTextField columns to match COMPRESSED_TEXT_FIELDS: compress rows of '
+        'enabled fields, store rows of disabled fields as plain text again'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--field',
+            action='append',
+            dest='fields',
+            help='Field label such as api.Cognition.raw_content (repeatable; default: every compressed text field)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read and rewritten per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report the size change without writing')
+
+    def handle(self, *args, **options):
+        fields = self._fields(options['fields'])
+        for field in fields:
+            self._rewrite(field, options['batch_size'], options['dry_run'])
+
+    def _fields(self, labels):
+        found = {
+            f'{model._meta.label}.{field.name}': field
+            for model in apps.get_models()
+            for field in model._meta.concrete_fields
+            if isinstance(field, CompressedTextField)
+        }
+        if not labels:
+            return list(found.values())
+        missing = [label for label in labels if label not in found]
+        if missing:
+            raise CommandError(f"Not compressed text fields: {', '.join(missing)}")
+        return [found[label] for label in labels]
+
+    def _rewrite(self, field, batch_size, dry_run):
+        model = field.model
+        # Cast to a plain TextField so rows come back exactly as stored
+        stored_rows = model.objects.annotate(
+            _stored=Cast(field.name, models.TextField())
+        ).values_list('pk', '_stored').order_by('pk')
+
+        rows = changed = before = after = 0
+        last_pk = None
+        while True:
+            batch = stored_rows.filter(pk__gt=last_pk) if last_pk is not None else stored_rows
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            updates = []
+            for pk, stored in batch:
+                rows += 1
+                if stored is None:
+                    continue
+                text = decompress_text(stored)
+                target = field.get_db_prep_save(text, connection)
+                before += len(stored.encode('utf-8'))
+                after += len(target.encode('utf-8'))
+                if target != stored:
+                    instance = model(pk=pk)
+                    setattr(instance, field.attname, text)
+                    updates.append(instance)
+
+            changed += len(updates)
+            if updates and not dry_run:
+                with transaction.atomic():
+                    model.objects.bulk_update(updates, [field.name], batch_size=batch_size)
+
+        state = 'enabled' if field.compression_options() is not None else 'disabled'
+        verb = 'Would rewrite' if dry_run else 'Rewrote'
+        ratio = f' ({after / before:.1%} of original)' if before else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{field.field_label()} [{state}]: {verb} {changed} of {rows} rows, '
+            f'{before} -> {after} bytes{ratio}'
+        ))
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.follow_graph import follow_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute "people you may know" suggestions for every profile from friend-of-friend '
+        'counts over the whole follow graph (sparse matrix product, no per-user queries)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Suggestions kept per profile')
+        parser.add_argument('--min-mutual', type=int, default=1, help='Minimum followed profiles in common')
+        parser.add_argument('--block-size', type=int, default=4096, help='Adjacency rows multiplied at once')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without storing')
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1 or options['min_mutual'] < 1 or options['block_size'] < 1:
+            raise CommandError('--limit, --min-mutual and --block-size must be positive')
+        follow_suggestions.block_size = options['block_size']
+
+        start_time = time.time()
+        profile_ids, suggested_ids, counts = follow_suggestions.compute(
+            limit=options['limit'], min_mutual=options['min_mutual']
+        )
+        elapsed = time.time() - start_time
+        profiles = len(set(profile_ids.tolist()))
+        self.stdout.write(f'Computed {len(counts)} suggestions for {profiles} profiles in {elapsed:.2f}s')
+
+        if options['dry_run']:
+            for profile_id, suggested_id, count in list(zip(profile_ids, suggested_ids, counts))[:20]:
+                self.stdout.write(f'  {profile_id} -> {suggested_id} ({count} in common)')
+            return
+
+        stored = follow_suggestions.store(profile_ids, suggested_ids, counts)
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} suggestions'))
@@ -0,0 +1,50 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Cognition
+from api.similarity_service import similarity_service
+
+
+class Command(BaseCommand):
+    help = 'Compute similarity arcs between nodes from local TF-IDF scores (no network access)'
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--cognition', type=int, help='Compare nodes within one cognition')
+        scope.add_argument('--user', help="Compare nodes across all of a user's cognitions")
+        parser.add_argument('--top-k', type=int, default=5, help='Neighbours kept per node')
+        parser.add_argument('--min-score', type=float, default=0.2, help='Minimum cosine similarity')
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            help='Create or refresh the arcs instead of only listing proposals',
+        )
+
+    def handle(self, *args, **options):
+        if options['cognition']:
+            try:
+                nodes = similarity_service.scope_nodes(cognition=Cognition.objects.get(id=options['cognition']))
+            except Cognition.DoesNotExist:
+                raise CommandError(f"Cognition {options['cognition']} does not exist")
+        else:
+            try:
+                nodes = similarity_service.scope_nodes(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        start_time = time.time()
+        proposals = similarity_service.propose(nodes, top_k=options['top_k'], min_score=options['min_score'])
+        elapsed = time.time() - start_time
+
+        self.stdout.write(f'Scored {nodes.count()} nodes in {elapsed:.2f}s, {len(proposals)} pairs above threshold')
+        for proposal in proposals[:20]:
+            self.stdout.write(
+                f"  {proposal['source_node']} <-> {proposal['target_node']}: "
+                f"{proposal['score']:.3f} (strength {proposal['strength']})"
+            )
+        if len(proposals) > 20:
+            self.stdout.write(f'  ... and {len(proposals) - 20} more')
+
+        if options['create']:
+            created = similarity_service.create_arcs(proposals)
+            self.stdout.write(self.style.SUCCESS(f'Created or updated {created} similarity arcs'))
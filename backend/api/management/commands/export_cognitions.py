@@ -0,0 +1,62 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Cognition
+from api.transfer_service import CognitionTransferService, EXPORT_LAYOUTS
+
+
+class Command(BaseCommand):
+    help = 'Export cognitions with their nodes, widgets, arcs and analysis as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write to (defaults to stdout)',
+        )
+        parser.add_argument(
+            '--user',
+            help='Only export cognitions owned by this username',
+        )
+        parser.add_argument(
+            '--ids',
+            help='Comma separated list of cognition ids to export',
+        )
+        parser.add_argument(
+            '--layout',
+            choices=EXPORT_LAYOUTS,
+            default='ndjson',
+            help='Record layout; "columnar" stores node content as one block with offsets',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50,
+            help='Cognitions fetched per database round trip',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Cognition.objects.all()
+
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+            queryset = queryset.filter(user=user)
+
+        if options['ids']:
+            queryset = queryset.filter(id__in=[int(i) for i in options['ids'].split(',') if i.strip()])
+
+        service = CognitionTransferService(chunk_size=options['chunk_size'])
+        out = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+
+        count = 0
+        try:
+            for line in service.iter_ndjson(queryset, options['layout']):
+                out.write(line)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} cognitions'))
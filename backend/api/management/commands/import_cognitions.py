@@ -0,0 +1,60 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.transfer_service import CognitionTransferService, TransferError
+
+
+class Command(BaseCommand):
+    help = 'Import cognitions from a newline-delimited JSON export using batched bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='Export file to read ("-" for stdin)',
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username that will own the imported cognitions',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows per bulk_create statement',
+        )
+        parser.add_argument(
+            '--records-per-batch',
+            type=int,
+            default=50,
+            help='Cognitions written per transaction',
+        )
+        parser.add_argument(
+            '--map-usernames',
+            action='store_true',
+            help='Give widgets to the accounts with their exported authors\' usernames '
+                 '(default: the importing user); only for databases that share accounts',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        service = CognitionTransferService(batch_size=options['batch_size'])
+        source = sys.stdin if options['input'] == '-' else open(options['input'], encoding='utf-8')
+
+        try:
+            stats = service.import_records(source, user, records_per_batch=options['records_per_batch'],
+                                           map_usernames=options['map_usernames'])
+        except TransferError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['cognitions']} cognitions, {stats['nodes']} nodes, "
+            f"{stats['widgets']} widgets, {stats['arcs']} arcs, {stats['segments']} segments"
+        ))
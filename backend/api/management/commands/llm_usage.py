@@ -0,0 +1,44 @@
+import json
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.llm_ledger import llm_ledger
+
+
+class Command(BaseCommand):
+    help = 'Report LLM spend, tokens, truncations and latency from the LLMCall ledger, per operation, user or model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Report calls from the last N days (default: 7)')
+        parser.add_argument('--by', choices=['operation', 'user', 'model'], default='operation')
+        parser.add_argument('--user', help='Only calls attributed to this username')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        user_id = None
+        if options['user']:
+            user_id = User.objects.filter(username=options['user']).values_list('id', flat=True).first()
+            if user_id is None:
+                raise CommandError(f"Unknown user: {options['user']}")
+
+        # Rows still queued by this process's background writer belong in the report
+        llm_ledger.flush()
+        report = llm_ledger.report(timezone.now() - timedelta(days=options['days']), options['by'], user_id)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        by = options['by']
+        header = f"{by:<28} {'calls':>7} {'cached':>7} {'errors':>7} {'trunc':>6} {'prompt':>10} {'compl':>9} {'cost $':>11} {'p95 ms':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in report['rows'] + [{by: 'TOTAL', **report['total']}]:
+            p95 = row['p95_latency_ms']
+            self.stdout.write(
+                f"{str(row[by] or '-')[:28]:<28} {row['calls']:>7} {row['cache_hits']:>7} {row['errors']:>7} "
+                f"{row['truncated']:>6} {row['prompt_tokens']:>10} {row['completion_tokens']:>9} "
+                f"{row['cost_usd']:>11.4f} {'-' if p95 is None else f'{p95:.0f}':>9}"
+            )
@@ -1,3 +1,7 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
 class CustomCORSMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -8,7 +12,8 @@ class CustomCORSMiddleware:
             response = self.get_response(request)
             response["Access-Control-Allow-Origin"] = "http://localhost:3000"
             response["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
+            profile_header = getattr(settings, 'REQUEST_PROFILE_HEADER', 'X-Profile')
+            response["Access-Control-Allow-Headers"] = f"Content-Type, Authorization, X-Requested-With, {profile_header}"
             response["Access-Control-Allow-Credentials"] = "true"
             return response
         
@@ -24,4 +29,71 @@ class CustomCORSMiddleware:
         response["X-XSS-Protection"] = "1; mode=block"
         response["X-Frame-Options"] = "DENY"
         
-        return response
\ No newline at end of file
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile requests staff users ask for (see api/request_profiler.py).
+
+    WSGI only: the sampler and the query hooks watch the request's thread,
+    but under ASGI the view runs on the event loop and its queries in
+    executor threads. The async path therefore passes requests through
+    unprofiled, without making Django adapt the handler to sync.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        from .request_profiler import request_profiler
+
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        if request_profiler.enabled and request_profiler.requested(request):
+            user = request_profiler.staff_user(request)
+            if user is not None:
+                return request_profiler.profile(self.get_response, request, user)
+        return self.get_response(request)
+
+
+class LLMCallAttributionMiddleware:
+    """
+    Attribute LLM calls made while handling a request to its user (see
+    api/llm_ledger.py). Runs natively under ASGI so async views don't hold a
+    thread for their LLM calls.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        from .llm_ledger import llm_ledger
+
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        token = llm_ledger.bind_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            llm_ledger.unbind_request(token)
+
+    async def _acall(self, request):
+        from .llm_ledger import llm_ledger
+
+        token = llm_ledger.bind_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            llm_ledger.unbind_request(token)
+
@@ -0,0 +1,149 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cognition',
+            name='table_of_contents',
+            field=models.JSONField(default=list, help_text='Structured TOC data with sections and navigation'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='node_type',
+            field=models.CharField(choices=[('content', 'Content'), ('toc', 'Table of Contents')], default='content', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='widget',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='widget',
+            name='llm_preset',
+            field=models.CharField(blank=True, choices=[('simplify', 'Simplify this node'), ('analogy', 'Provide analogy'), ('bullets', 'Make bulleted list'), ('summary', 'Summarize'), ('questions', 'Generate questions'), ('explain', 'Provide detailed explanation'), ('examples', 'Give practical examples'), ('context', 'Add background context'), ('connections', 'Show concept relationships'), ('deeper_dive', 'Expand with advanced details'), ('clarify', 'Clarify potential confusion'), ('applications', 'Show real-world applications')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='widget',
+            name='widget_type',
+            field=models.CharField(choices=[('author_remark', 'Author Remark'), ('author_quiz', 'Author Quiz'), ('author_dialog', 'Author Dialog'), ('author_llm', 'Author AI Response'), ('reader_llm', 'Reader AI Response'), ('reader_remark', 'Reader Remark')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='DocumentAnalysisResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(choices=[('academic_paper', 'Academic Paper'), ('tutorial', 'Tutorial'), ('article', 'Article'), ('story', 'Story'), ('reference', 'Reference'), ('essay', 'Essay'), ('manual', 'Manual'), ('blog_post', 'Blog Post'), ('news', 'News'), ('other', 'Other')], max_length=50)),
+                ('overall_summary', models.TextField()),
+                ('main_themes', models.JSONField(default=list)),
+                ('target_audience', models.CharField(max_length=200)),
+                ('complexity_level', models.CharField(choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced'), ('expert', 'Expert')], max_length=20)),
+                ('estimated_total_read_time', models.PositiveIntegerField(help_text='Total reading time in seconds')),
+                ('overall_coherence_score', models.FloatField()),
+                ('segmentation_confidence', models.FloatField()),
+                ('table_of_contents', models.JSONField(default=list)),
+                ('reading_flow', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processing_time_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('openai_model_used', models.CharField(default='gpt-4o', max_length=50)),
+                ('cognition', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analysis', to='api.cognition')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Group',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, help_text="Description of the group's purpose")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_public', models.BooleanField(default=True, help_text='Whether group is discoverable and joinable')),
+                ('founder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='founded_groups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cognition',
+            name='group',
+            field=models.ForeignKey(blank=True, help_text='Group that owns this cognition', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cognitions', to='api.group'),
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress_current', models.PositiveIntegerField(default=0)),
+                ('progress_total', models.PositiveIntegerField(default=0)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processing_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupInvitation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField(blank=True, help_text='Optional invitation message')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('expired', 'Expired')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('responded_at', models.DateTimeField(blank=True, null=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invitations', to='api.group')),
+                ('invitee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_invitations', to=settings.AUTH_USER_MODEL)),
+                ('inviter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_invitations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'invitee')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('member', 'Member'), ('admin', 'Admin')], default='member', max_length=20)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SemanticSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_position', models.PositiveIntegerField()),
+                ('end_position', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('summary', models.TextField(max_length=500)),
+                ('topic_keywords', models.JSONField(default=list)),
+                ('importance_level', models.CharField(choices=[('primary', 'Primary'), ('secondary', 'Secondary'), ('supporting', 'Supporting')], max_length=20)),
+                ('estimated_reading_time', models.PositiveIntegerField(help_text='Reading time in seconds')),
+                ('semantic_coherence_score', models.FloatField()),
+                ('sequence_order', models.PositiveIntegerField(help_text='Order in the document')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='api.documentanalysisresult')),
+                ('node', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='semantic_segment', to='api.node')),
+            ],
+            options={
+                'ordering': ['sequence_order'],
+                'unique_together': {('analysis', 'sequence_order')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_cognition_table_of_contents_node_node_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentanalysisresult',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the raw_content that was analyzed', max_length=64),
+        ),
+    ]
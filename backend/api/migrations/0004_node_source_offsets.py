@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_documentanalysisresult_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='source_end',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='source_start',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:06
+
+import api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_node_source_offsets'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cognition',
+            name='raw_content',
+            field=api.fields.CompressedTextField(help_text='The original, unprocessed text'),
+        ),
+        migrations.AlterField(
+            model_name='node',
+            name='content',
+            field=api.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='widget',
+            name='content',
+            field=api.fields.CompressedTextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_compressed_text_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cognition',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented on every change to the node list'),
+        ),
+    ]
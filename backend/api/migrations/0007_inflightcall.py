@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_cognition_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InFlightCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of operation, object id and content hash', max_length=64, unique=True)),
+                ('operation', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('error_type', models.CharField(blank=True, help_text='Exception class re-raised for waiting requests', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
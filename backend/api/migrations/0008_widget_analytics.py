@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_inflightcall'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CognitionEngagementStats',
+            fields=[
+                ('cognition', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='engagement_stats', serialize=False, to='api.cognition')),
+                ('completion_histogram', models.JSONField(blank=True, default=dict, help_text='Completed widget count -> number of readers who have started')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WidgetStats',
+            fields=[
+                ('widget', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.widget')),
+                ('readers', models.PositiveIntegerField(default=0, help_text='Readers with an interaction on this widget')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Interaction events recorded')),
+                ('completions', models.PositiveIntegerField(default=0, help_text='Readers whose interaction is marked completed')),
+                ('answer_counts', models.JSONField(blank=True, default=dict, help_text='Current quiz answer -> number of readers')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cognition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='widget_stats', to='api.cognition')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_widget_analytics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReaderProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField(help_text='Cognition revision the progress was computed against')),
+                ('required_total', models.PositiveIntegerField(default=0)),
+                ('required_completed', models.PositiveIntegerField(default=0)),
+                ('blocking_position', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('blocking_node', models.ForeignKey(blank=True, help_text='Furthest unlocked node: the first one with an incomplete required widget (null: nothing blocks)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.node')),
+                ('cognition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reader_progress', to='api.cognition')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('cognition', 'user')},
+            },
+        ),
+    ]
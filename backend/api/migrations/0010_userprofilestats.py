@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_profile_stats(apps, schema_editor):
+    UserProfile = apps.get_model('api', 'UserProfile')
+    UserProfileStats = apps.get_model('api', 'UserProfileStats')
+    Cognition = apps.get_model('api', 'Cognition')
+    Follow = UserProfile.following.through
+
+    followers = dict(Follow.objects.values('to_userprofile_id').annotate(n=models.Count('id')).values_list('to_userprofile_id', 'n'))
+    following = dict(Follow.objects.values('from_userprofile_id').annotate(n=models.Count('id')).values_list('from_userprofile_id', 'n'))
+    public = {
+        row['user_id']: row for row in Cognition.objects.filter(is_public=True).values('user_id').annotate(
+            n=models.Count('id'), latest=models.Max('updated_at')
+        )
+    }
+    UserProfileStats.objects.bulk_create([
+        UserProfileStats(
+            profile_id=profile_id,
+            follower_count=followers.get(profile_id, 0),
+            following_count=following.get(profile_id, 0),
+            public_cognitions_count=public.get(user_id, {}).get('n', 0),
+            last_public_activity=public.get(user_id, {}).get('latest'),
+        )
+        for profile_id, user_id in UserProfile.objects.values_list('id', 'user_id')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_readerprogress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfileStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.userprofile')),
+                ('follower_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+                ('public_cognitions_count', models.PositiveIntegerField(default=0)),
+                ('last_public_activity', models.DateTimeField(blank=True, help_text='Latest updated_at of a public cognition', null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cognition',
+            index=models.Index(fields=['user', 'is_public', '-updated_at'], name='cognition_user_public_recent'),
+        ),
+        migrations.RunPython(create_profile_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_userprofilestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual_count', models.PositiveIntegerField(help_text='Followed profiles that follow the suggestion')),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_suggestions', to='api.userprofile')),
+                ('suggested', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.userprofile')),
+            ],
+            options={
+                'ordering': ['-mutual_count', 'suggested_id'],
+                'unique_together': {('profile', 'suggested')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_followsuggestion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('duration_ms', models.FloatField()),
+                ('sample_interval_ms', models.FloatField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('collapsed_stacks', models.TextField(blank=True, help_text="Sampled stacks, one 'frame;frame;frame count' line each")),
+                ('sql_count', models.PositiveIntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('sql_queries', models.JSONField(default=list, help_text='[{sql, duration_ms, origin}] in execution order')),
+                ('llm_count', models.PositiveIntegerField(default=0)),
+                ('llm_ms', models.FloatField(default=0)),
+                ('llm_calls', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
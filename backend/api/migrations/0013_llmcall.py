@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_requestprofile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(help_text='Call site, e.g. toc, quick_segmentation, llm_widget', max_length=50)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.FloatField()),
+                ('finish_reason', models.CharField(blank=True, help_text="'length' when the completion was truncated", max_length=30)),
+                ('cache_hit', models.BooleanField(default=False)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at', 'operation'], name='llmcall_created_operation'), models.Index(fields=['user', 'created_at'], name='llmcall_user_created')],
+            },
+        ),
+    ]
@@ -1,11 +1,31 @@
 # api/models.py
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
+from .fields import CompressedTextField, MARKER
+import hashlib
 import json
 
+def _related_count(model, column):
+    """Correlated count of ``model`` rows whose ``column`` is the outer row"""
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(**{column: models.OuterRef('pk')}).order_by()
+            .values(column).annotate(n=models.Count('id')).values('n')
+        ),
+        0
+    )
+
+
+class CognitionQuerySet(models.QuerySet):
+    def with_nodes_count(self):
+        """Annotate nodes_total, so serializers don't count each cognition's nodes separately"""
+        return self.annotate(nodes_total=_related_count(Node, 'cognition'))
+
 class Cognition(models.Model):
     title = models.CharField(max_length=200)
-    raw_content = models.TextField(help_text="The original, unprocessed text")
+    raw_content = CompressedTextField(help_text="The original, unprocessed text")
     is_starred = models.BooleanField(default=False, help_text="Indicates if this cognition is starred for quick access")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -14,10 +34,25 @@ class Cognition(models.Model):
     is_public = models.BooleanField(default=False, help_text="Whether this cognition is shared publicly")
     share_date = models.DateTimeField(null=True, blank=True, help_text="When this cognition was shared")
     table_of_contents = models.JSONField(default=list, help_text="Structured TOC data with sections and navigation")
+    revision = models.PositiveIntegerField(default=0, help_text="Incremented on every change to the node list")
+    
+    objects = CognitionQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Profile pages: a user's most recently updated public cognitions
+            models.Index(fields=['user', 'is_public', '-updated_at'], name='cognition_user_public_recent'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def bump_revision(self):
+        """Increment the node-list revision in the database and return the new value"""
+        Cognition.objects.filter(pk=self.pk).update(revision=models.F('revision') + 1)
+        self.revision = Cognition.objects.filter(pk=self.pk).values_list('revision', flat=True).get()
+        return self.revision
+    
     def total_characters(self):
         return sum(node.character_count for node in self.nodes.all())
     
@@ -39,6 +74,145 @@ class Cognition(models.Model):
         if self.group:
             return self.group.name
         return self.user.username
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored text so save() can tell when it changes
+        if 'raw_content' in field_names:
+            instance._loaded_raw_content = instance.raw_content
+        # ...and whether it was public, so profile stats know when to recount
+        if 'is_public' in field_names:
+            instance._loaded_is_public = instance.is_public
+        return instance
+    
+    def save(self, *args, **kwargs):
+        from django.db import transaction
+        
+        loaded = getattr(self, '_loaded_raw_content', None)
+        with transaction.atomic():
+            if self.pk and loaded is not None and loaded != self.raw_content:
+                # Offset-backed nodes point into the old text; give them their own copy first
+                self.materialize_nodes(loaded)
+            super().save(*args, **kwargs)
+        self._loaded_raw_content = self.raw_content
+        self._loaded_is_public = self.is_public
+    
+    def materialize_nodes(self, raw_content=None):
+        """Copy the text of offset-backed nodes into their content column"""
+        raw_content = self.raw_content if raw_content is None else raw_content
+        nodes = list(self.nodes.filter(source_start__isnull=False).only('id', 'source_start', 'source_end'))
+        for node in nodes:
+            node.content = raw_content[node.source_start:node.source_end]
+            node.source_start = node.source_end = None
+        Node.objects.bulk_update(nodes, ['content', 'source_start', 'source_end'], batch_size=500)
+        return len(nodes)
+    
+    def build_nodes(self, contents, start_position=0):
+        """
+        Unsaved content nodes for the given strings, in order.
+        
+        With settings.NODE_OFFSET_STORAGE, strings that are verbatim slices of
+        raw_content are stored as (start, end) offsets instead of a copy.
+        """
+        from django.conf import settings
+        from .text_segmentation import locate_spans
+        
+        contents = [content for content in contents if content.strip()]
+        if getattr(settings, 'NODE_OFFSET_STORAGE', False):
+            spans = locate_spans(self.raw_content, contents)
+        else:
+            spans = [None] * len(contents)
+        
+        nodes = []
+        for i, (content, span) in enumerate(zip(contents, spans)):
+            node = Node(
+                cognition=self,
+                position=start_position + i,
+                character_count=len(content)
+            )
+            if span is None:
+                node.content = content
+            else:
+                node.content = ''
+                node.source_start, node.source_end = span
+            nodes.append(node)
+        return nodes
+    
+    def replace_nodes(self, contents):
+        """Replace all nodes with one content node per string, in order"""
+        from django.db import transaction
+        
+        nodes = self.build_nodes(contents)
+        with transaction.atomic():
+            self.nodes.all().delete()
+            Node.objects.bulk_create(nodes)
+            self.bump_revision()
+        return len(nodes)
+
+# Added to positions to move nodes out of the sequence while it is rewritten
+PARKED_POSITION_OFFSET = 2 ** 30
+
+class NodeQuerySet(models.QuerySet):
+    def with_text(self):
+        """
+        Annotate resolved_text with each node's text, sliced in the database
+        for offset-backed nodes so only the slice is transferred.
+        """
+        from django.db.models.functions import Substr
+        
+        return self.annotate(resolved_text=models.Case(
+            # A compressed raw_content can't be sliced in SQL; fetch it whole and slice in text
+            models.When(
+                source_start__isnull=False,
+                cognition__raw_content__startswith=MARKER,
+                then=models.F('cognition__raw_content')
+            ),
+            models.When(
+                source_start__isnull=False,
+                then=Substr(
+                    'cognition__raw_content',
+                    models.F('source_start') + 1,
+                    models.F('source_end') - models.F('source_start')
+                )
+            ),
+            default=models.F('content'),
+            output_field=CompressedTextField()
+        ))
+    
+    def with_widgets(self, user):
+        """
+        Prefetch the widgets NodeSerializer shows ``user`` as visible_widgets:
+        the author's widgets and the user's own reader widgets, each with the
+        user's interactions as user_interactions.
+        """
+        visible = models.Q(user=models.F('node__cognition__user'))
+        interactions = WidgetInteraction.objects.none()
+        if user.is_authenticated:
+            visible |= models.Q(user=user, widget_type__startswith='reader_')
+            interactions = WidgetInteraction.objects.filter(user=user).order_by('pk')
+        widgets = Widget.objects.filter(visible).select_related('user').order_by('position', 'created_at').prefetch_related(
+            models.Prefetch('interactions', queryset=interactions, to_attr='user_interactions')
+        )
+        return self.prefetch_related(models.Prefetch('widgets', queryset=widgets, to_attr='visible_widgets'))
+    
+    def park(self):
+        """Move these nodes out of the position sequence, keeping their order"""
+        return self.update(position=models.F('position') + PARKED_POSITION_OFFSET)
+    
+    def shift(self, delta):
+        """
+        Move these nodes ``delta`` positions in three queries however many
+        there are. They are parked first, so no intermediate state trips
+        unique(cognition, position).
+        """
+        ids = list(self.values_list('id', flat=True))
+        if ids:
+            self.model.objects.filter(id__in=ids).park()
+            self.model.objects.filter(id__in=ids).update(
+                position=models.F('position') - PARKED_POSITION_OFFSET + delta
+            )
+        return len(ids)
 
 class Node(models.Model):
     NODE_TYPE_CHOICES = [
@@ -47,13 +221,20 @@ class Node(models.Model):
     ]
     
     cognition = models.ForeignKey(Cognition, related_name='nodes', on_delete=models.CASCADE)
-    content = models.TextField()
+    content = CompressedTextField()
     position = models.PositiveIntegerField()
     character_count = models.PositiveIntegerField()
     is_illuminated = models.BooleanField(default=False)
     node_type = models.CharField(max_length=20, choices=NODE_TYPE_CHOICES, default='content')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Offset storage: an untouched node stores no content of its own and is
+    # cognition.raw_content[source_start:source_end] instead
+    source_start = models.PositiveIntegerField(null=True, blank=True)
+    source_end = models.PositiveIntegerField(null=True, blank=True)
+    
+    objects = NodeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['position']
         unique_together = ['cognition', 'position']
@@ -61,6 +242,36 @@ class Node(models.Model):
     def __str__(self):
         return f"{self.cognition.title} - Node {self.position}"
     
+    @property
+    def is_offset_backed(self):
+        return self.source_start is not None
+    
+    @property
+    def text(self):
+        """The node's text, whether stored as its own content or as offsets"""
+        if not self.is_offset_backed:
+            return self.content
+        if hasattr(self, 'resolved_text'):
+            if len(self.resolved_text) != self.source_end - self.source_start:
+                # Whole document, from a compressed raw_content
+                return self.resolved_text[self.source_start:self.source_end]
+            return self.resolved_text
+        return self.cognition.raw_content[self.source_start:self.source_end]
+    
+    @text.setter
+    def text(self, value):
+        self.content = value
+        self.source_start = self.source_end = None
+    
+    def save(self, *args, **kwargs):
+        # Assigning content to an offset-backed node is an edit: it now owns its text
+        if self.is_offset_backed and self.content:
+            self.source_start = self.source_end = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'source_start', 'source_end'}
+        super().save(*args, **kwargs)
+    
     # author_synthesis property removed - synthesis functionality replaced by widget system
 
 class PresetResponse(models.Model):
@@ -135,7 +346,7 @@ class Widget(models.Model):
     
     # Content fields
     title = models.CharField(max_length=200, blank=True)
-    content = models.TextField(blank=True)  # Allow blank for quiz widgets and others with specific fields
+    content = CompressedTextField(blank=True)  # Allow blank for quiz widgets and others with specific fields
     
     # Quiz-specific fields
     quiz_question = models.TextField(blank=True)
@@ -203,6 +414,82 @@ class WidgetInteraction(models.Model):
     def __str__(self):
         return f"{self.user.username} interaction with {self.widget}"
 
+class WidgetStats(models.Model):
+    """
+    Running engagement totals for one author quiz or LLM widget, kept up to
+    date as interactions are recorded (see api/widget_analytics.py).
+    """
+    widget = models.OneToOneField(Widget, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    cognition = models.ForeignKey(Cognition, related_name='widget_stats', on_delete=models.CASCADE)
+    readers = models.PositiveIntegerField(default=0, help_text="Readers with an interaction on this widget")
+    attempts = models.PositiveIntegerField(default=0, help_text="Interaction events recorded")
+    completions = models.PositiveIntegerField(default=0, help_text="Readers whose interaction is marked completed")
+    answer_counts = models.JSONField(default=dict, blank=True, help_text="Current quiz answer -> number of readers")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for widget {self.widget_id}"
+
+    def correct_rate(self, correct_answer):
+        """Share of answering readers whose current answer is correct_answer"""
+        answered = sum(self.answer_counts.values())
+        if not answered or not correct_answer:
+            return None
+        return self.answer_counts.get(correct_answer, 0) / answered
+
+class ReaderProgress(models.Model):
+    """
+    Cached progress of one reader through a cognition's required author
+    widgets (see api/reader_progress.py). The first node holding a required
+    widget the reader has not completed is as far as they may read.
+    """
+    cognition = models.ForeignKey(Cognition, related_name='reader_progress', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='reading_progress', on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField(help_text="Cognition revision the progress was computed against")
+    required_total = models.PositiveIntegerField(default=0)
+    required_completed = models.PositiveIntegerField(default=0)
+    blocking_node = models.ForeignKey(
+        Node, null=True, blank=True, related_name='+', on_delete=models.SET_NULL,
+        help_text="Furthest unlocked node: the first one with an incomplete required widget (null: nothing blocks)"
+    )
+    blocking_position = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['cognition', 'user']
+
+    def __str__(self):
+        return f"{self.user.username} progress in {self.cognition_id}"
+
+    @property
+    def completion_percentage(self):
+        if not self.required_total:
+            return 100.0
+        return round(100.0 * self.required_completed / self.required_total, 1)
+
+class CognitionEngagementStats(models.Model):
+    """
+    Reader funnel for a cognition's author quiz and LLM widgets: how many
+    readers have completed how many of them, maintained incrementally.
+    """
+    cognition = models.OneToOneField(Cognition, primary_key=True, related_name='engagement_stats', on_delete=models.CASCADE)
+    completion_histogram = models.JSONField(
+        default=dict, blank=True,
+        help_text="Completed widget count -> number of readers who have started"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Engagement for {self.cognition_id}"
+
+    @property
+    def readers(self):
+        return sum(self.completion_histogram.values())
+
+    def readers_completing(self, at_least):
+        """Readers who have completed at least this many widgets"""
+        return sum(count for completed, count in self.completion_histogram.items() if int(completed) >= at_least)
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(blank=True, null=True)
@@ -227,6 +514,38 @@ class UserProfile(models.Model):
     def get_following(self):
         return self.following.all()
 
+class FollowSuggestion(models.Model):
+    """
+    An offline "people you may know" result: a profile the owner does not
+    follow yet, scored by how many of the people they follow follow it
+    (see the compute_follow_suggestions command)
+    """
+    profile = models.ForeignKey(UserProfile, related_name='follow_suggestions', on_delete=models.CASCADE)
+    suggested = models.ForeignKey(UserProfile, related_name='+', on_delete=models.CASCADE)
+    mutual_count = models.PositiveIntegerField(help_text="Followed profiles that follow the suggestion")
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['profile', 'suggested']
+        ordering = ['-mutual_count', 'suggested_id']
+
+    def __str__(self):
+        return f"Suggest {self.suggested_id} to {self.profile_id} ({self.mutual_count})"
+
+class UserProfileStats(models.Model):
+    """
+    Denormalized counters for profile pages, kept current on follow,
+    unfollow and cognition create/share/delete (see api/profile_stats.py)
+    """
+    profile = models.OneToOneField(UserProfile, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    public_cognitions_count = models.PositiveIntegerField(default=0)
+    last_public_activity = models.DateTimeField(null=True, blank=True, help_text="Latest updated_at of a public cognition")
+
+    def __str__(self):
+        return f"Stats for {self.profile_id}"
+
 class DocumentAnalysisResult(models.Model):
     """Stores the results of semantic document analysis"""
     
@@ -274,6 +593,7 @@ class DocumentAnalysisResult(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     processing_time_ms = models.PositiveIntegerField(null=True, blank=True)
     openai_model_used = models.CharField(max_length=50, default='gpt-4o')
+    content_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the raw_content that was analyzed")
     
     def __str__(self):
         return f"Analysis for {self.cognition.title} ({self.document_type})"
@@ -286,6 +606,10 @@ class DocumentAnalysisResult(models.Model):
         """Return suggested reading order"""
         return self.reading_flow.get('segment_order', [])
 
+    def is_current_for(self, raw_content):
+        """Whether this analysis was computed from the given text"""
+        return self.content_hash == hashlib.sha256(raw_content.encode('utf-8')).hexdigest()
+
 class SemanticSegment(models.Model):
     """Individual semantic segments identified by AI analysis"""
     
@@ -335,6 +659,15 @@ class SemanticSegment(models.Model):
         return self.end_position - self.start_position
 
 
+class GroupQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate member_total and cognition_total for Group.member_count/cognition_count"""
+        return self.annotate(
+            member_total=_related_count(GroupMembership, 'group'),
+            cognition_total=_related_count(Cognition, 'group'),
+        )
+
+
 class Group(models.Model):
     """Groups allow multiple users to collaborate on cognitions"""
     name = models.CharField(max_length=100)
@@ -344,6 +677,8 @@ class Group(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_public = models.BooleanField(default=True, help_text="Whether group is discoverable and joinable")
     
+    objects = GroupQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
@@ -378,10 +713,15 @@ class Group(models.Model):
     
     @property
     def member_count(self):
+        # Annotated by GroupQuerySet.with_counts() on list and detail views
+        if hasattr(self, 'member_total'):
+            return self.member_total
         return self.memberships.count()
     
     @property
     def cognition_count(self):
+        if hasattr(self, 'cognition_total'):
+            return self.cognition_total
         return self.cognitions.count()
 
 
@@ -425,4 +765,128 @@ class GroupInvitation(models.Model):
         unique_together = ['group', 'invitee']
     
     def __str__(self):
-        return f"Invitation to {self.invitee.username} for {self.group.name} ({self.status})"
\ No newline at end of file
+        return f"Invitation to {self.invitee.username} for {self.group.name} ({self.status})"
+
+class ProcessingJob(models.Model):
+    """Tracks long-running work (bulk ingestion enrichment, batch generation) run off the request"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='processing_jobs')
+    job_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress_current = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.job_type} job {self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def set_progress(self, current, total=None):
+        """Persist progress without touching the other columns"""
+        self.progress_current = current
+        update_fields = ['progress_current', 'updated_at']
+        if total is not None:
+            self.progress_total = total
+            update_fields.append('progress_total')
+        self.save(update_fields=update_fields)
+
+
+class InFlightCall(models.Model):
+    """
+    Advisory row for one coalesced LLM-bound operation (see api/single_flight.py).
+
+    The row's unique key is claimed by the first request for an
+    (operation, object, content) triple; identical requests poll it and share
+    its stored result instead of repeating the work.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of operation, object id and content hash")
+    operation = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    error_type = models.CharField(max_length=100, blank=True, help_text="Exception class re-raised for waiting requests")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.operation} {self.key[:12]} ({self.status})"
+
+
+class RequestProfile(models.Model):
+    """
+    One profiled request, captured on demand for a staff user (see
+    api/request_profiler.py): sampled call stacks, every SQL query and every
+    LLM call it made
+    """
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL, related_name='request_profiles')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration_ms = models.FloatField()
+    sample_interval_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    collapsed_stacks = models.TextField(blank=True, help_text="Sampled stacks, one 'frame;frame;frame count' line each")
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    sql_queries = models.JSONField(default=list, help_text="[{sql, duration_ms, origin}] in execution order")
+    llm_count = models.PositiveIntegerField(default=0)
+    llm_ms = models.FloatField(default=0)
+    llm_calls = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+class LLMCall(models.Model):
+    """
+    One OpenAI chat completion, or one result shared from an identical
+    in-flight call (cache_hit), with its usage and cost (see api/llm_ledger.py)
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='llm_calls')
+    operation = models.CharField(max_length=50, help_text="Call site, e.g. toc, quick_segmentation, llm_widget")
+    model = models.CharField(max_length=100, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.FloatField()
+    finish_reason = models.CharField(max_length=30, blank=True, help_text="'length' when the completion was truncated")
+    cache_hit = models.BooleanField(default=False)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'operation'], name='llmcall_created_operation'),
+            models.Index(fields=['user', 'created_at'], name='llmcall_user_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.model} ({self.prompt_tokens}+{self.completion_tokens} tokens)"
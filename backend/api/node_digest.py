@@ -0,0 +1,89 @@
+# api/node_digest.py
+"""
+Compact local digests of node content (heading, leading sentence, keywords),
+used to build tables of contents for documents too large for one prompt
+"""
+import hashlib
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from .similarity_service import tokenize
+
+HEADING_RE = re.compile(r'^#{1,6}\s+(.+?)\s*#*$')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+KEYWORD_COUNT = 5
+LEAD_CHARS = 200
+HEADING_CHARS = 80
+
+
+def digest_text(text: str) -> Dict[str, object]:
+    """
+    Summarize a node without any network calls.
+
+    The heading is a leading markdown header, or a short first line without
+    closing punctuation that is followed by more text. The lead is the first
+    sentence of the rest, and keywords are the most frequent non-stop-words.
+    """
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    heading: Optional[str] = None
+    body = lines
+    if lines:
+        match = HEADING_RE.match(lines[0])
+        if match:
+            heading, body = match.group(1), lines[1:]
+        elif len(lines) > 1 and len(lines[0]) <= HEADING_CHARS and not lines[0].endswith(('.', ',', ';', ':')):
+            heading, body = lines[0].strip('*_ '), lines[1:]
+
+    body_text = ' '.join(body)
+    lead = SENTENCE_END_RE.split(body_text, 1)[0] if body_text else ''
+    if len(lead) > LEAD_CHARS:
+        lead = lead[:LEAD_CHARS].rsplit(' ', 1)[0] + '...'
+
+    keywords = [term for term, _ in Counter(tokenize(text)).most_common(KEYWORD_COUNT)]
+    return {'heading': heading, 'lead': lead, 'keywords': keywords}
+
+
+def digest_line(digest: Dict[str, object]) -> str:
+    """One-line prompt form of a digest"""
+    parts = []
+    if digest['heading']:
+        parts.append(f"# {digest['heading']}")
+    if digest['lead']:
+        parts.append(digest['lead'])
+    if digest['keywords']:
+        parts.append(f"[{', '.join(digest['keywords'])}]")
+    return ' '.join(parts)
+
+
+class NodeDigestCache:
+    """
+    In-process cache of node digests, recomputed only when a node's content
+    hash changes. Deleted nodes are evicted through a post_delete signal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # node_id -> (content hash, digest)
+        self._entries: Dict[int, Tuple[str, Dict[str, object]]] = {}
+
+    def digests(self, nodes: Iterable[Tuple[int, str]]) -> List[Dict[str, object]]:
+        """Digests for the given (node_id, content) pairs, in order"""
+        result = []
+        with self._lock:
+            for node_id, content in nodes:
+                content_hash = hashlib.md5(content.encode('utf-8')).hexdigest()
+                entry = self._entries.get(node_id)
+                if entry is None or entry[0] != content_hash:
+                    entry = self._entries[node_id] = (content_hash, digest_text(content))
+                result.append(entry[1])
+        return result
+
+    def evict(self, node_id: int):
+        with self._lock:
+            self._entries.pop(node_id, None)
+
+
+# Global instance
+node_digests = NodeDigestCache()
@@ -0,0 +1,256 @@
+# api/node_ops.py
+"""
+Applies an ordered batch of editor operations to a cognition's nodes in one transaction
+"""
+from typing import Any, Dict, List, Optional
+from django.db import models, transaction
+from .models import Cognition, Node
+from .toc_processor import toc_processor
+
+OPERATIONS = ('update', 'insert', 'delete', 'split', 'merge_with_next', 'move', 'toggle_illumination', 'set_illumination')
+STRUCTURAL_OPERATIONS = ('insert', 'delete', 'split', 'merge_with_next', 'move')
+MAX_OPERATIONS = 500
+
+
+class NodeOperationError(Exception):
+    """Raised when an operation in a batch cannot be applied; the whole batch is rolled back"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+class RevisionConflict(Exception):
+    """Raised when the client's base revision is not the cognition's current revision"""
+
+    def __init__(self, current: int):
+        super().__init__(f"Cognition is at revision {current}")
+        self.current = current
+
+
+class NodeOperationService:
+    """
+    Applies split, merge, move, insert, delete, update and illumination
+    operations to an in-memory copy of the node list, then writes the result
+    with one delete, one position shift, one bulk_update and one bulk_create.
+
+    A generated TOC is re-anchored to the new node list in the same
+    transaction (see TOCProcessor.sync_toc).
+
+    Operations refer to existing nodes by id. Inserted nodes may carry a
+    client-chosen "ref" string, which later operations in the same batch can
+    use in place of an id; the response maps each ref to the id it received.
+    """
+
+    def apply(self, cognition: Cognition, operations: List[Dict[str, Any]],
+              base_revision: Optional[int] = None) -> Dict[str, Any]:
+        if not isinstance(operations, list) or not operations:
+            raise NodeOperationError(0, 'operations must be a non-empty list')
+        if len(operations) > MAX_OPERATIONS:
+            raise NodeOperationError(0, f'At most {MAX_OPERATIONS} operations per batch')
+
+        with transaction.atomic():
+            locked = Cognition.objects.select_for_update().only('id', 'revision').get(pk=cognition.pk)
+            if base_revision is not None:
+                try:
+                    base_revision = int(base_revision)
+                except (TypeError, ValueError):
+                    raise NodeOperationError(0, 'base_revision must be an integer')
+                if base_revision != locked.revision:
+                    raise RevisionConflict(locked.revision)
+
+            nodes = list(Node.objects.filter(cognition=cognition).order_by('position'))
+            for node in nodes:
+                node.cognition = cognition
+            original_positions = {node.id: node.position for node in nodes}
+
+            state = _BatchState(cognition, nodes)
+            for index, operation in enumerate(operations):
+                if not isinstance(operation, dict):
+                    raise NodeOperationError(index, 'Each operation must be an object')
+                op = operation.get('op')
+                if op not in OPERATIONS:
+                    raise NodeOperationError(index, f"Unknown op '{op}'; expected one of {', '.join(OPERATIONS)}")
+                getattr(state, f'op_{op}')(index, operation)
+
+            self._write(cognition, state, original_positions)
+            revision = cognition.bump_revision()
+            toc = toc_processor.sync_toc(cognition, state.nodes)
+
+        return {
+            'revision': revision,
+            'structural': any(op.get('op') in STRUCTURAL_OPERATIONS for op in operations),
+            'created': {ref: node.id for ref, node in state.refs.items() if node.pk is not None},
+            'deleted': sorted(state.deleted_ids),
+            'nodes': state.nodes,
+            'toc': toc,
+        }
+
+    @staticmethod
+    def _write(cognition: Cognition, state: '_BatchState', original_positions: Dict[int, int]):
+        if state.deleted_ids:
+            Node.objects.filter(id__in=state.deleted_ids).delete()
+
+        for position, node in enumerate(state.nodes):
+            node.position = position
+        existing = [node for node in state.nodes if node.pk is not None]
+        moved = any(original_positions[node.id] != node.position for node in existing)
+
+        if moved:
+            # Park every surviving node above the final range so the final positions
+            # can be written in any order without tripping unique(cognition, position)
+            offset = max(original_positions.values(), default=0) + len(state.nodes) + 1
+            Node.objects.filter(cognition=cognition).update(position=models.F('position') + offset)
+            # Every parked node needs its final position written back
+            changed = existing
+        else:
+            changed = [node for node in existing if node.id in state.dirty_ids]
+        if changed:
+            Node.objects.bulk_update(
+                changed,
+                ['content', 'character_count', 'is_illuminated', 'position', 'source_start', 'source_end'],
+                batch_size=500,
+            )
+
+        new_nodes = [node for node in state.nodes if node.pk is None]
+        if new_nodes:
+            Node.objects.bulk_create(new_nodes, batch_size=500)
+
+
+class _BatchState:
+    """The node list as the batch has left it so far"""
+
+    def __init__(self, cognition: Cognition, nodes: List[Node]):
+        self.cognition = cognition
+        self.nodes = nodes
+        self.refs: Dict[str, Node] = {}
+        self.dirty_ids = set()
+        self.deleted_ids = set()
+
+    # Lookups
+
+    def index_of(self, index: int, operation: Dict[str, Any], key: str = 'node_id') -> int:
+        target = operation.get(key)
+        if target is None:
+            raise NodeOperationError(index, f'{key} is required')
+        if isinstance(target, str) and target in self.refs:
+            node = self.refs[target]
+            for i, candidate in enumerate(self.nodes):
+                if candidate is node:
+                    return i
+        else:
+            try:
+                target = int(target)
+            except (TypeError, ValueError):
+                raise NodeOperationError(index, f'Unknown node reference {target!r}')
+            for i, candidate in enumerate(self.nodes):
+                if candidate.pk == target:
+                    return i
+        raise NodeOperationError(index, f'Node {target!r} is not in this cognition')
+
+    def position_arg(self, index: int, operation: Dict[str, Any], key: str, upper: int) -> int:
+        try:
+            position = int(operation.get(key))
+        except (TypeError, ValueError):
+            raise NodeOperationError(index, f'{key} must be an integer')
+        if not 0 <= position <= upper:
+            raise NodeOperationError(index, f'Invalid {key}. Must be between 0 and {upper}')
+        return position
+
+    def content_arg(self, index: int, operation: Dict[str, Any], key: str = 'content') -> str:
+        content = operation.get(key)
+        if not isinstance(content, str) or not content.strip():
+            raise NodeOperationError(index, f'{key} must be a non-empty string')
+        return content
+
+    def set_text(self, node: Node, content: str):
+        node.text = content
+        node.character_count = len(content)
+        if node.pk is not None:
+            self.dirty_ids.add(node.pk)
+
+    def new_node(self, content: str, ref=None) -> Node:
+        node = Node(cognition=self.cognition, content=content, character_count=len(content), position=0)
+        if ref is not None:
+            self.refs[str(ref)] = node
+        return node
+
+    def remove(self, i: int) -> Node:
+        node = self.nodes.pop(i)
+        if node.pk is not None:
+            self.deleted_ids.add(node.pk)
+            self.dirty_ids.discard(node.pk)
+        return node
+
+    # Operations
+
+    def op_update(self, index, operation):
+        """Replace a node's content (add_or_update_node)"""
+        self.set_text(self.nodes[self.index_of(index, operation)], self.content_arg(index, operation))
+
+    def op_insert(self, index, operation):
+        """Insert a new content node at ``position`` (default: the end)"""
+        content = self.content_arg(index, operation)
+        position = len(self.nodes)
+        if operation.get('position') is not None:
+            position = self.position_arg(index, operation, 'position', len(self.nodes))
+        ref = operation.get('ref')
+        if ref is not None and str(ref) in self.refs:
+            raise NodeOperationError(index, f'ref {ref!r} is already used in this batch')
+        self.nodes.insert(position, self.new_node(content, ref))
+
+    def op_delete(self, index, operation):
+        self.remove(self.index_of(index, operation))
+
+    def op_split(self, index, operation):
+        """Split a node at ``split_position``; the second half becomes a new node after it"""
+        i = self.index_of(index, operation)
+        node = self.nodes[i]
+        content = node.text
+        try:
+            split_position = int(operation.get('split_position'))
+        except (TypeError, ValueError):
+            raise NodeOperationError(index, 'split_position must be an integer')
+        if split_position <= 0 or split_position >= len(content):
+            raise NodeOperationError(index, 'Invalid split position')
+
+        before_content = content[:split_position].strip()
+        after_content = content[split_position:].strip()
+        if not before_content or not after_content:
+            raise NodeOperationError(index, 'Split would create empty node')
+
+        self.set_text(node, before_content)
+        new_node = self.new_node(after_content, operation.get('ref'))
+        self.nodes.insert(i + 1, new_node)
+
+    def op_merge_with_next(self, index, operation):
+        i = self.index_of(index, operation)
+        if i + 1 >= len(self.nodes):
+            raise NodeOperationError(index, 'No next node to merge with')
+        separator = operation.get('separator', ' ')
+        node, next_node = self.nodes[i], self.nodes[i + 1]
+        self.set_text(node, node.text + separator + next_node.text)
+        self.remove(i + 1)
+
+    def op_move(self, index, operation):
+        """Move a node to ``new_position`` (reorder_position)"""
+        i = self.index_of(index, operation)
+        new_position = self.position_arg(index, operation, 'new_position', len(self.nodes) - 1)
+        self.nodes.insert(new_position, self.nodes.pop(i))
+
+    def op_toggle_illumination(self, index, operation):
+        node = self.nodes[self.index_of(index, operation)]
+        node.is_illuminated = not node.is_illuminated
+        if node.pk is not None:
+            self.dirty_ids.add(node.pk)
+
+    def op_set_illumination(self, index, operation):
+        node = self.nodes[self.index_of(index, operation)]
+        node.is_illuminated = bool(operation.get('is_illuminated', True))
+        if node.pk is not None:
+            self.dirty_ids.add(node.pk)
+
+
+# Global instance
+node_operations = NodeOperationService()
@@ -1,17 +1,119 @@
 # api/openai_service.py
+import asyncio
+import contextvars
 import openai
 import os
 import json
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
+from django.conf import settings
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Return an AsyncOpenAI client for the running event loop.
+
+    The async client's connection pool is tied to the loop it was created on,
+    so one client is kept per loop rather than one per process.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return client
+
+
+def _llm_call(operation: str, request: Dict[str, Any], response, started: float, error: Exception = None) -> Dict[str, Any]:
+    usage = getattr(response, 'usage', None)
+    choices = getattr(response, 'choices', None) or []
+    return {
+        'operation': operation,
+        'model': getattr(response, 'model', None) or request.get('model'),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'finish_reason': choices[0].finish_reason if choices else None,
+        'error': f'{type(error).__name__}: {error}' if error is not None else None,
+    }
+
+
+def create_completion(client, operation: str, **request):
+    """
+    client.chat.completions.create(**request), recorded under ``operation``
+    in the LLM call ledger and on the request profile when the request is
+    being profiled. Every chat completion goes through this or
+    create_completion_async.
+    """
+    from .llm_ledger import llm_ledger
+    from .request_profiler import record_llm_call
+    
+    started = time.perf_counter()
+    response = error = None
+    try:
+        response = client.chat.completions.create(**request)
+        return response
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        call = _llm_call(operation, request, response, started, error)
+        record_llm_call(dict(call))
+        llm_ledger.record(call)
+
+
+async def create_completion_async(client, operation: str, **request):
+    """Async variant of create_completion"""
+    from .llm_ledger import llm_ledger
+    from .request_profiler import record_llm_call
+    
+    started = time.perf_counter()
+    response = error = None
+    try:
+        response = await client.chat.completions.create(**request)
+        return response
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        call = _llm_call(operation, request, response, started, error)
+        record_llm_call(dict(call))
+        await llm_ledger.record_async(call)
+
+
+TOC_MODES = ('auto', 'flat', 'hierarchical')
 
 
 class OpenAITOCService:
-    """OpenAI service specifically for Table of Contents generation"""
+    """
+    OpenAI service specifically for Table of Contents generation.
+    
+    Small documents go to the LLM in one prompt ("flat" mode). Larger ones
+    are built bottom-up ("hierarchical" mode): each node is reduced to a
+    local digest, consecutive digests are grouped into sections by
+    bounded-size calls, and those sections are grouped again until a handful
+    remain. Calls within a level run concurrently, so latency grows with the
+    number of levels, which is logarithmic in the node count.
+    """
+    
+    flat_max_nodes = 60       # "auto" switches to hierarchical above this
+    reduce_fan_in = 40        # Items per hierarchical reduce call
+    reduce_max_chars = 12000  # Prompt characters per hierarchical reduce call
+    max_top_sections = 6
     
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._client = None
     
-    def generate_table_of_contents(self, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    @property
+    def client(self) -> openai.OpenAI:
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+    
+    def generate_table_of_contents(self, nodes: List[Dict[str, Any]], mode: str = 'auto') -> Dict[str, Any]:
         """
         Generate a table of contents from a list of node data.
         
@@ -20,6 +122,7 @@ class OpenAITOCService:
                   - id: Node ID
                   - position: Node position
                   - content: Node content text
+            mode: "flat", "hierarchical" or "auto" (hierarchical above flat_max_nodes)
         
         Returns:
             Dictionary with TOC structure matching the specification
@@ -28,35 +131,267 @@ class OpenAITOCService:
         if len(nodes) < 2:
             raise ValueError("Minimum 2 nodes required for TOC generation")
         
-        # Prepare content for analysis
-        content_summary = self._prepare_content_for_analysis(nodes)
-        
-        # Generate TOC using OpenAI
-        system_prompt = self._get_toc_system_prompt()
-        user_prompt = self._get_toc_user_prompt(content_summary)
+        if self._use_hierarchical(nodes, mode):
+            return self.generate_hierarchical_table_of_contents(nodes)
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
-            
-            toc_data = json.loads(response.choices[0].message.content)
-            
-            # Validate and clean the response
-            return self._validate_and_clean_toc_data(toc_data, len(nodes))
+            response = create_completion(self.client, 'toc', **self._toc_request(nodes))
+            return self._parse_toc_response(response, nodes)
             
         except Exception as e:
             print(f"OpenAI TOC generation error: {str(e)}")
             # Fallback to basic section creation
             return self._create_fallback_toc(nodes)
     
+    async def generate_table_of_contents_async(self, nodes: List[Dict[str, Any]], mode: str = 'auto') -> Dict[str, Any]:
+        """Async variant of generate_table_of_contents for the ASGI views"""
+        
+        if len(nodes) < 2:
+            raise ValueError("Minimum 2 nodes required for TOC generation")
+        
+        if self._use_hierarchical(nodes, mode):
+            return await self.generate_hierarchical_table_of_contents_async(nodes)
+        
+        try:
+            response = await create_completion_async(get_async_client(), 'toc', **self._toc_request(nodes))
+            return self._parse_toc_response(response, nodes)
+            
+        except Exception as e:
+            print(f"OpenAI TOC generation error: {str(e)}")
+            return self._create_fallback_toc(nodes)
+    
+    def _use_hierarchical(self, nodes: List[Dict[str, Any]], mode: str) -> bool:
+        if mode not in TOC_MODES:
+            raise ValueError(f"Unknown TOC mode '{mode}'; expected one of {', '.join(TOC_MODES)}")
+        return mode == 'hierarchical' or (mode == 'auto' and len(nodes) > self.flat_max_nodes)
+    
+    def generate_hierarchical_table_of_contents(self, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Tree-reduce TOC generation over node digests (see class docstring)"""
+        
+        from .llm_ledger import llm_ledger
+        
+        items = self._digest_items(nodes)
+        levels = []
+        calls = 0
+        max_workers = getattr(settings, 'LLM_BATCH_MAX_CONCURRENCY', 8)
+        # Pool threads hand their ledger rows back to be written from this thread
+        with llm_ledger.collected(), ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='toc-reduce') as pool:
+            while True:
+                chunks = self._reduce_chunks(items)
+                # Each call runs in a copy of this context, so a request profile sees its LLM call
+                grouped = [future.result() for future in [
+                    pool.submit(contextvars.copy_context().run, self._reduce_chunk, chunk) for chunk in chunks
+                ]]
+                calls += sum(1 for chunk in chunks if len(chunk) > 1)
+                items, finished = self._next_level(items, chunks, grouped, levels)
+                if finished:
+                    break
+        
+        return self._hierarchical_result(levels, calls)
+    
+    async def generate_hierarchical_table_of_contents_async(self, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Async variant of generate_hierarchical_table_of_contents"""
+        
+        items = self._digest_items(nodes)
+        levels = []
+        calls = 0
+        semaphore = asyncio.Semaphore(getattr(settings, 'LLM_BATCH_MAX_CONCURRENCY', 8))
+        
+        async def reduce(chunk):
+            async with semaphore:
+                return await self._reduce_chunk_async(chunk)
+        
+        while True:
+            chunks = self._reduce_chunks(items)
+            grouped = await asyncio.gather(*(reduce(chunk) for chunk in chunks))
+            calls += sum(1 for chunk in chunks if len(chunk) > 1)
+            items, finished = self._next_level(items, chunks, grouped, levels)
+            if finished:
+                break
+        
+        return self._hierarchical_result(levels, calls)
+    
+    def _digest_items(self, nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Level-0 items: one per node, described by its cached digest"""
+        from .node_digest import node_digests, digest_line
+        
+        digests = node_digests.digests((node['id'], node['content']) for node in nodes)
+        return [
+            {
+                'start': ordinal,
+                'end': ordinal,
+                'title': digest['heading'] or '',
+                'content': digest_line(digest) or node['content'][:200],
+            }
+            for ordinal, (node, digest) in enumerate(zip(nodes, digests), 1)
+        ]
+    
+    def _reduce_chunks(self, items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split a level into consecutive runs that each fit one reduce prompt"""
+        chunks, chunk, size = [], [], 0
+        for item in items:
+            length = len(item['content']) + 16
+            if chunk and (len(chunk) >= self.reduce_fan_in or size + length > self.reduce_max_chars):
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(item)
+            size += length
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+    
+    def _reduce_chunk(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if len(chunk) == 1:
+            return self._single_item_sections(chunk)
+        try:
+            response = create_completion(self.client, 'toc_reduce', **self._reduce_request(chunk))
+            return self._parse_toc_response(response, chunk)['sections']
+        except Exception as e:
+            print(f"OpenAI TOC reduce error: {str(e)}")
+            return self._create_fallback_toc(chunk)['sections']
+    
+    async def _reduce_chunk_async(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if len(chunk) == 1:
+            return self._single_item_sections(chunk)
+        try:
+            response = await create_completion_async(get_async_client(), 'toc_reduce', **self._reduce_request(chunk))
+            return self._parse_toc_response(response, chunk)['sections']
+        except Exception as e:
+            print(f"OpenAI TOC reduce error: {str(e)}")
+            return self._create_fallback_toc(chunk)['sections']
+    
+    @staticmethod
+    def _single_item_sections(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        item = chunk[0]
+        return [{
+            'title': item.get('title') or item['content'][:60],
+            'description': item.get('description', ''),
+            'start_node': 1,
+            'end_node': 1,
+            'importance': item.get('importance', 'secondary'),
+        }]
+    
+    def _reduce_request(self, chunk: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Chat completion arguments for grouping one run of consecutive items"""
+        lines = "\n".join(f"ITEM {i}: {item['content']}" for i, item in enumerate(chunk, 1))
+        return dict(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": self._get_reduce_system_prompt(len(chunk))},
+                {"role": "user", "content": f"""Group the following consecutive items into sections. start_node and end_node are ITEM numbers.
+
+{lines}
+
+Ensure all items are included in exactly one section."""}
+            ],
+            temperature=0.3,
+            max_tokens=2000,
+            response_format={"type": "json_object"}
+        )
+    
+    def _get_reduce_system_prompt(self, item_count: int) -> str:
+        """System prompt for one hierarchical reduce call"""
+        target = max(2, min(8, item_count // 5))
+        return f"""You are an expert at creating structured table of contents for educational and informational documents.
+
+Your task is to group a run of consecutive items from a long document into sections. Each item is either a passage, summarized as an optional heading, its opening sentence and [keywords], or a section already built from several passages.
+
+Guidelines:
+- Create about {target} sections of consecutive items
+- Start a new section where the topic changes; headings are strong hints
+- Provide clear, descriptive section titles
+- Include brief descriptions that summarize what readers will learn
+- Assign importance levels: "primary" for main topics, "secondary" for supporting topics, "supporting" for background/examples
+- Ensure sections cover all items without gaps or overlaps
+
+Return ONLY a JSON object with this exact structure:
+{{
+  "sections": [
+    {{
+      "title": "Section Name",
+      "description": "Brief section summary (1-2 sentences)",
+      "start_node": 1,
+      "end_node": 3,
+      "importance": "primary"
+    }}
+  ]
+}}"""
+    
+    def _next_level(self, items, chunks, grouped, levels):
+        """Turn each chunk's sections into the items of the next level; (items, finished)"""
+        next_items = []
+        for chunk, sections in zip(chunks, grouped):
+            for section in sections:
+                first, last = chunk[section['start_node'] - 1], chunk[section['end_node'] - 1]
+                next_items.append({
+                    'start': first['start'],
+                    'end': last['end'],
+                    'title': section['title'],
+                    'description': section.get('description', ''),
+                    'importance': section.get('importance', 'secondary'),
+                    'content': f"{section['title']}: {section.get('description', '')}".strip(': '),
+                })
+        
+        # A level that does not shrink would never converge
+        if len(next_items) >= len(items) and levels:
+            return items, True
+        levels.append(next_items)
+        return next_items, len(chunks) == 1 or len(next_items) <= self.max_top_sections
+    
+    @staticmethod
+    def _hierarchical_result(levels: List[List[Dict[str, Any]]], calls: int) -> Dict[str, Any]:
+        """
+        Sections are the second-highest level of the tree, each tagged with the
+        title of the top-level group it falls in; one level gives a flat TOC.
+        """
+        top = levels[-1]
+        leaves = levels[-2] if len(levels) > 1 else top
+        
+        sections = []
+        for leaf in leaves:
+            section = {
+                'title': leaf['title'],
+                'description': leaf['description'],
+                'start_node': leaf['start'],
+                'end_node': leaf['end'],
+                'importance': leaf['importance'],
+            }
+            if leaves is not top:
+                group = next(item for item in top if item['start'] <= leaf['start'] <= item['end'])
+                section['group'] = group['title']
+            sections.append(section)
+        
+        return {
+            'title': "Table of Contents",
+            'mode': 'hierarchical',
+            'depth': len(levels),
+            'llm_calls': calls,
+            'sections': sections,
+        }
+    
+    def _toc_request(self, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Chat completion arguments for TOC generation"""
+        
+        # Prepare content for analysis
+        content_summary = self._prepare_content_for_analysis(nodes)
+        
+        return dict(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": self._get_toc_system_prompt()},
+                {"role": "user", "content": self._get_toc_user_prompt(content_summary)}
+            ],
+            temperature=0.3,
+            max_tokens=2000,
+            response_format={"type": "json_object"}
+        )
+    
+    def _parse_toc_response(self, response, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        toc_data = json.loads(response.choices[0].message.content)
+        
+        # Validate and clean the response
+        return self._validate_and_clean_toc_data(toc_data, nodes)
+    
     def _prepare_content_for_analysis(self, nodes: List[Dict[str, Any]]) -> str:
         """Prepare node content for OpenAI analysis"""
         content_parts = []
@@ -105,9 +440,11 @@ Return ONLY a JSON object with this exact structure:
 
 Create logical sections that group related content. Ensure all nodes are included in exactly one section."""
     
-    def _validate_and_clean_toc_data(self, toc_data: Dict[str, Any], total_nodes: int) -> Dict[str, Any]:
+    def _validate_and_clean_toc_data(self, toc_data: Dict[str, Any], nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Validate and clean the TOC data from OpenAI"""
         
+        total_nodes = len(nodes)
+        
         # Ensure basic structure
         if "sections" not in toc_data:
             raise ValueError("Invalid TOC structure: missing sections")
@@ -260,5 +597,89 @@ Create logical sections that group related content. Ensure all nodes are include
             return f"Section ({node_range})"
 
 
-# Global instance
-toc_service = OpenAITOCService()
\ No newline at end of file
+class MarkdownConversionService:
+    """OpenAI service for converting raw text into formatted markdown"""
+    
+    model = "gpt-3.5-turbo"
+    max_input_chars = 50000
+    
+    def __init__(self):
+        self._client = None
+    
+    @property
+    def client(self) -> openai.OpenAI:
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+    
+    def convert(self, raw_text: str) -> Dict[str, Any]:
+        response = create_completion(self.client, 'markdown_conversion', **self._conversion_request(raw_text))
+        return self._conversion_result(raw_text, response)
+    
+    async def convert_async(self, raw_text: str) -> Dict[str, Any]:
+        response = await create_completion_async(get_async_client(), 'markdown_conversion', **self._conversion_request(raw_text))
+        return self._conversion_result(raw_text, response)
+    
+    def _conversion_request(self, raw_text: str) -> Dict[str, Any]:
+        system_prompt = """You are an expert at converting raw text into well-formatted markdown.
+
+Your task is to take raw, unformatted text and convert it into clean, readable markdown with appropriate structure.
+
+Guidelines:
+- Add proper headers (# ## ###) where appropriate to create document structure
+- Format lists, both numbered and bulleted, correctly
+- Add emphasis (*italic*, **bold**) where it improves readability
+- Create proper paragraph breaks
+- Format code blocks with ``` if any code is present
+- Add horizontal rules (---) to separate major sections if appropriate
+- Preserve the original meaning and content exactly
+- Don't add new information or content
+- Don't remove any important information
+- Make the text more readable and well-structured
+
+Return only the formatted markdown, no explanations or additional text."""
+
+        user_prompt = f"Convert this raw text to well-formatted markdown:\n\n{raw_text}"
+        
+        # Calculate appropriate max_tokens based on input length
+        # Input tokens ~= chars/4, leave room for system prompt and formatting expansion
+        estimated_input_tokens = len(raw_text) // 4 + 500  # +500 for system prompt
+        # Allow output to be 1.5x input size (for markdown formatting) + buffer
+        max_output_tokens = min(16000, max(8000, int(len(raw_text) // 2.5)))
+        
+        print(f"Markdown conversion: input_chars={len(raw_text)}, estimated_input_tokens={estimated_input_tokens}, max_output_tokens={max_output_tokens}")
+        
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=max_output_tokens
+        )
+    
+    def _conversion_result(self, raw_text: str, response) -> Dict[str, Any]:
+        markdown_text = response.choices[0].message.content.strip()
+        
+        # Check if response was truncated
+        finish_reason = response.choices[0].finish_reason
+        if finish_reason == 'length':
+            print(f"Warning: OpenAI response was truncated (finish_reason: {finish_reason})")
+            # Could fallback to original text here, but let's try with the partial result
+        
+        # Basic validation - check if result looks reasonable
+        if len(markdown_text) < len(raw_text) * 0.3:  # Result is suspiciously short
+            print(f"Warning: Markdown result seems too short (original: {len(raw_text)}, result: {len(markdown_text)})")
+        
+        return {
+            'markdown_text': markdown_text,
+            'original_length': len(raw_text),
+            'formatted_length': len(markdown_text),
+            'finish_reason': finish_reason
+        }
+
+
+# Global instances
+toc_service = OpenAITOCService()
+markdown_service = MarkdownConversionService()
\ No newline at end of file
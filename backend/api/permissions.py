@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .authorization import authorization_for
 
 class AllowAnyPermission(permissions.BasePermission):
     """
@@ -11,11 +12,21 @@ class AllowAnyPermission(permissions.BasePermission):
 class IsOwnerOrReadOnlyIfPublic(permissions.BasePermission):
     """
     Custom permission to only allow owners of an object to edit it.
-    Others can view only if it's public.
+    Others can view only if it's public. For group-owned objects, group
+    admins may also edit and members may view; roles come from the request's
+    AuthorizationContext, so checking many objects costs one query.
     """
     def has_object_permission(self, request, view, obj):
         # Always allow GET, HEAD or OPTIONS requests to public items
         if request.method in permissions.SAFE_METHODS and getattr(obj, "is_public", False):
             return True
         # Allow access if the user owns the cognition
-        return getattr(obj, "user", None) == request.user
\ No newline at end of file
+        if getattr(obj, "user_id", None) == request.user.pk:
+            return True
+        group_id = getattr(obj, "group_id", None)
+        if group_id is None:
+            return False
+        authorization = authorization_for(request)
+        if request.method in permissions.SAFE_METHODS:
+            return authorization.is_member(group_id)
+        return authorization.is_admin(group_id)
\ No newline at end of file
@@ -0,0 +1,76 @@
+# api/profile_stats.py
+"""
+Maintenance of the denormalized UserProfileStats counters
+"""
+from typing import Iterable
+from django.db import models
+from django.db.models.functions import Coalesce
+from .models import Cognition, UserProfile, UserProfileStats
+
+Follow = UserProfile.following.through
+
+
+def _follow_count(column: str):
+    """Correlated count of follow rows whose ``column`` is the stats row's profile"""
+    return Coalesce(
+        models.Subquery(
+            Follow.objects.filter(**{column: models.OuterRef('profile_id')})
+            .values(column).annotate(n=models.Count('id')).values('n')
+        ),
+        0
+    )
+
+
+class ProfileStatsService:
+    """
+    Keeps UserProfileStats in step with follows and public cognitions.
+
+    Every refresh recounts rather than increments, so the counters stay exact
+    through repeated or no-op follows, and costs one UPDATE (plus one
+    aggregate for cognitions). Signals in api/signals.py call these on
+    follow/unfollow and on cognition create, share, unshare and delete.
+    """
+
+    def ensure(self, profile: UserProfile) -> UserProfileStats:
+        """The profile's stats row, created and counted if missing"""
+        stats, created = UserProfileStats.objects.get_or_create(profile=profile)
+        if created:
+            self.refresh_follows([profile.pk])
+            self.refresh_cognitions(profile.user_id)
+            stats.refresh_from_db()
+        return stats
+
+    def refresh_follows(self, profile_ids: Iterable[int]):
+        profile_ids = set(profile_ids)
+        if profile_ids:
+            UserProfileStats.objects.filter(profile_id__in=profile_ids).update(
+                follower_count=_follow_count('to_userprofile_id'),
+                following_count=_follow_count('from_userprofile_id'),
+            )
+
+    def refresh_cognitions(self, user_id: int):
+        public = Cognition.objects.filter(user_id=user_id, is_public=True).aggregate(
+            count=models.Count('id'), latest=models.Max('updated_at')
+        )
+        UserProfileStats.objects.filter(profile__user_id=user_id).update(
+            public_cognitions_count=public['count'],
+            last_public_activity=public['latest'],
+        )
+
+    def refresh_cognitions_many(self, user_ids: Iterable[int]):
+        """refresh_cognitions for several users in one UPDATE, e.g. after a group delete"""
+        user_ids = set(user_ids)
+        if user_ids:
+            public = Cognition.objects.filter(
+                user__profile=models.OuterRef('profile_id'), is_public=True
+            ).order_by().values('user_id')
+            UserProfileStats.objects.filter(profile__user_id__in=user_ids).update(
+                public_cognitions_count=Coalesce(
+                    models.Subquery(public.annotate(n=models.Count('id')).values('n')), 0
+                ),
+                last_public_activity=models.Subquery(public.annotate(latest=models.Max('updated_at')).values('latest')),
+            )
+
+
+# Global instance
+profile_stats = ProfileStatsService()
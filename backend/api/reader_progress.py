@@ -0,0 +1,121 @@
+# api/reader_progress.py
+"""
+Server-side reader progress through a cognition's required widgets
+"""
+from typing import Any, Dict, List
+from django.db import models, transaction
+from .models import Cognition, ReaderProgress, Widget
+
+
+def required_widgets(cognition_id: int):
+    """Author widgets that block progression past their node"""
+    return Widget.objects.filter(node__cognition_id=cognition_id, is_required=True, widget_type__startswith='author_')
+
+
+class ReaderProgressService:
+    """
+    Computes how far a reader may go in a cognition and how many of its
+    required widgets they have completed.
+
+    A reader may read up to and including the first node that holds a
+    required author widget they have not completed; with no such node,
+    everything is unlocked. The computation is one aggregate over the
+    required widgets, joined only to this reader's interactions, and its
+    result is cached in a ReaderProgress row. The row is adjusted in place
+    when the reader completes or un-completes a required widget, recomputed
+    when the blocking node itself is cleared, and discarded when the node
+    list (Cognition.revision) or the author widgets change.
+    """
+
+    def compute(self, cognition_id: int, user) -> Dict[str, Any]:
+        per_node = required_widgets(cognition_id).annotate(
+            mine=models.FilteredRelation('interactions', condition=models.Q(interactions__user=user)),
+        ).values('node_id', 'node__position').annotate(
+            required=models.Count('id'),
+            completed=models.Count('mine__id', filter=models.Q(mine__completed=True)),
+        ).order_by('node__position')
+
+        progress = {'required_total': 0, 'required_completed': 0, 'blocking_node_id': None, 'blocking_position': None}
+        for row in per_node:
+            progress['required_total'] += row['required']
+            progress['required_completed'] += row['completed']
+            if progress['blocking_node_id'] is None and row['completed'] < row['required']:
+                progress['blocking_node_id'] = row['node_id']
+                progress['blocking_position'] = row['node__position']
+        return progress
+
+    def get(self, cognition: Cognition, user) -> ReaderProgress:
+        """The reader's progress, from the cached row when it is current"""
+        progress = ReaderProgress.objects.filter(cognition=cognition, user=user).first()
+        if progress is not None and progress.revision == cognition.revision:
+            return progress
+        return self.refresh(cognition.id, cognition.revision, user)
+
+    def refresh(self, cognition_id: int, revision: int, user) -> ReaderProgress:
+        """Recompute and store the reader's progress"""
+        progress = ReaderProgress(cognition_id=cognition_id, user=user, revision=revision, **self.compute(cognition_id, user))
+        ReaderProgress.objects.bulk_create(
+            [progress],
+            update_conflicts=True,
+            unique_fields=['cognition', 'user'],
+            update_fields=['revision', 'required_total', 'required_completed', 'blocking_node',
+                           'blocking_position', 'updated_at'],
+        )
+        return progress
+
+    def record(self, changes: List[Any], widgets: Dict[int, Dict[str, Any]]):
+        """
+        Adjust cached progress rows for written interactions (InteractionChange
+        objects). Readers without a cached row are computed on their next read.
+        """
+        for change in changes:
+            interaction = change.interaction
+            meta = widgets[interaction.widget_id]
+            if not (meta['is_required'] and meta['widget_type'].startswith('author_')):
+                continue
+            was_completed = bool(change.previous and change.previous[0])
+            if bool(interaction.completed) == was_completed:
+                continue
+
+            with transaction.atomic():
+                progress = ReaderProgress.objects.select_for_update().filter(
+                    cognition_id=meta['cognition_id'], user_id=interaction.user_id
+                ).first()
+                if progress is None:
+                    continue
+                if progress.revision != meta['revision']:
+                    progress.delete()
+                    continue
+
+                if interaction.completed:
+                    if progress.blocking_position == meta['node_position']:
+                        # The gate may have opened; only the aggregate knows what blocks next
+                        self.refresh(meta['cognition_id'], meta['revision'], interaction.user)
+                        continue
+                    progress.required_completed = min(progress.required_completed + 1, progress.required_total)
+                else:
+                    progress.required_completed = max(progress.required_completed - 1, 0)
+                    if progress.blocking_position is None or meta['node_position'] < progress.blocking_position:
+                        progress.blocking_node_id = meta['node_id']
+                        progress.blocking_position = meta['node_position']
+                progress.save()
+
+    def invalidate(self, node_id: int):
+        """Drop cached progress for the cognition holding this node, e.g. after its widgets change"""
+        ReaderProgress.objects.filter(cognition__nodes__id=node_id).delete()
+
+    @staticmethod
+    def as_dict(progress: ReaderProgress) -> Dict[str, Any]:
+        return {
+            'cognition_id': progress.cognition_id,
+            'required_total': progress.required_total,
+            'required_completed': progress.required_completed,
+            'completion_percentage': progress.completion_percentage,
+            'furthest_unlocked_node_id': progress.blocking_node_id,
+            'furthest_unlocked_position': progress.blocking_position,
+            'all_unlocked': progress.blocking_node_id is None,
+        }
+
+
+# Global instance
+reader_progress = ReaderProgressService()
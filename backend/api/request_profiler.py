@@ -0,0 +1,209 @@
+# api/request_profiler.py
+"""
+On-demand profiling of single requests for staff users
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.db import connections
+
+_active = contextvars.ContextVar('profile_capture', default=None)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames left out of query and LLM call origins: the profiler and its middleware
+_PROFILER_FILES = {os.path.abspath(__file__), os.path.join(BACKEND_DIR, 'api', 'middleware.py')}
+
+
+def _short_path(filename: str) -> str:
+    """Our files relative to the backend directory, installed packages from their package directory"""
+    if filename.startswith(BACKEND_DIR + os.sep):
+        return os.path.relpath(filename, BACKEND_DIR)
+    _, marker, rest = filename.rpartition('site-packages' + os.sep)
+    return rest if marker else filename
+
+
+def _app_origin(limit: int = 4) -> List[str]:
+    """The innermost frames of our own code on the current stack, outermost first"""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(BACKEND_DIR + os.sep) and os.path.abspath(frame.filename) not in _PROFILER_FILES
+    ]
+    return [f'{_short_path(frame.filename)}:{frame.lineno} in {frame.name}' for frame in frames[-limit:]]
+
+
+class Sampler(threading.Thread):
+    """
+    Samples one thread's Python stack every ``interval`` seconds and counts
+    identical stacks, which is the collapsed ("folded") format flame-graph
+    tools read: flamegraph.pl, speedscope, inferno.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+class ProfileCapture:
+    """What one request did: its samples, SQL queries and LLM calls"""
+
+    def __init__(self, sample_interval: float, max_queries: int):
+        self.sample_interval = sample_interval
+        self.max_queries = max_queries
+        self.queries: List[Dict[str, Any]] = []
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.sampler: Optional[Sampler] = None
+        self.started = None
+        self.duration_ms = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: time the query and note where it came from"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.sql_count += 1
+            self.sql_ms += duration_ms
+            if len(self.queries) < self.max_queries:
+                self.queries.append({
+                    'sql': sql,
+                    'duration_ms': round(duration_ms, 3),
+                    'many': many,
+                    'origin': _app_origin(),
+                })
+
+    def record_llm(self, call: Dict[str, Any]):
+        call['origin'] = _app_origin()
+        self.llm_calls.append(call)
+
+    def run(self, get_response, request):
+        self.started = time.perf_counter()
+        self.sampler = Sampler(threading.get_ident(), self.sample_interval)
+        token = _active.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                self.sampler.start()
+                try:
+                    return get_response(request)
+                finally:
+                    self.sampler.stop()
+        finally:
+            _active.reset(token)
+            self.duration_ms = (time.perf_counter() - self.started) * 1000
+
+
+class RequestProfiler:
+    """
+    Profiles a request when a staff user asks for it, with the
+    REQUEST_PROFILE_HEADER header or REQUEST_PROFILE_QUERY_PARAM query
+    parameter set to a true value.
+
+    The request thread is sampled every REQUEST_PROFILE_SAMPLE_INTERVAL
+    seconds, every SQL query is timed with the app frames that issued it,
+    and LLM calls made through api.openai_service.create_completion are
+    recorded with their latency and token usage. The result is stored as a
+    RequestProfile, whose id is returned in the X-Request-Profile response
+    header; the admin serves its stacks as a flame-graph file. A streaming
+    response is profiled up to the point its iterator is returned. Only
+    WSGI requests are profiled; see RequestProfilingMiddleware.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'REQUEST_PROFILING_ENABLED', True)
+
+    def requested(self, request) -> bool:
+        header = getattr(settings, 'REQUEST_PROFILE_HEADER', 'X-Profile')
+        param = getattr(settings, 'REQUEST_PROFILE_QUERY_PARAM', '_profile')
+        value = request.headers.get(header) or request.GET.get(param)
+        return bool(value) and value.lower() not in ('0', 'false', 'no')
+
+    @staticmethod
+    def staff_user(request):
+        """The requesting user if staff, from the session or an API token (DRF authenticates later)"""
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            from rest_framework.exceptions import AuthenticationFailed
+            from .token_auth import ExpiringTokenAuthentication
+            try:
+                authenticated = ExpiringTokenAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return None
+            user = authenticated[0] if authenticated else None
+        return user if user is not None and user.is_active and user.is_staff else None
+
+    def profile(self, get_response, request, user):
+        profile = ProfileCapture(
+            sample_interval=getattr(settings, 'REQUEST_PROFILE_SAMPLE_INTERVAL', 0.002),
+            max_queries=getattr(settings, 'REQUEST_PROFILE_MAX_QUERIES', 5000),
+        )
+        response = profile.run(get_response, request)
+        stored = self.store(profile, request, user, response)
+        response['X-Request-Profile'] = str(stored.pk)
+        return response
+
+    @staticmethod
+    def store(profile: ProfileCapture, request, user, response):
+        from .models import RequestProfile
+        return RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status_code=getattr(response, 'status_code', None),
+            duration_ms=round(profile.duration_ms, 3),
+            sample_interval_ms=profile.sample_interval * 1000,
+            sample_count=profile.sampler.samples,
+            collapsed_stacks=profile.sampler.collapsed(),
+            sql_count=profile.sql_count,
+            sql_ms=round(profile.sql_ms, 3),
+            sql_queries=profile.queries,
+            llm_count=len(profile.llm_calls),
+            llm_ms=round(sum(call['duration_ms'] for call in profile.llm_calls), 3),
+            llm_calls=profile.llm_calls,
+        )
+
+
+def record_llm_call(call: Dict[str, Any]):
+    """Add an LLM call to the current request's profile, if it is being profiled"""
+    profile = _active.get()
+    if profile is not None:
+        profile.record_llm(call)
+
+
+# Global instance
+request_profiler = RequestProfiler()
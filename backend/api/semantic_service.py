@@ -8,6 +8,7 @@ import time
 import json
 from typing import Tuple, Optional, Union
 from django.conf import settings
+from .openai_service import create_completion, create_completion_async, get_async_client
 from .semantic_models import (
     DocumentAnalysis, 
     QuickSegmentationResult, 
@@ -56,7 +57,8 @@ class SemanticAnalysisService:
             prompt = self._build_analysis_prompt(text, preferences)
             
             # Call OpenAI with JSON mode (fallback due to schema generation issues)
-            response = openai.chat.completions.create(
+            response = create_completion(
+                openai, 'analyze_document',
                 model=self.model,
                 messages=[
                     {
@@ -109,36 +111,41 @@ class SemanticAnalysisService:
         start_time = time.time()
         
         try:
-            prompt = self._build_quick_prompt(text, max_segments)
-            
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",  # Use faster model for quick analysis
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self._get_quick_system_prompt() + "\n\nPlease respond with valid JSON that matches the QuickSegmentationResult structure."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=2000,
-                temperature=0.1
-            )
+            response = create_completion(openai, 'quick_segmentation', **self._quick_request(text, max_segments))
             
             processing_time = int((time.time() - start_time) * 1000)
             
-            content = response.choices[0].message.content
-            if not content:
-                raise SemanticAnalysisError("Empty response from AI model")
-                
-            result_data = json.loads(content)
-            result = QuickSegmentationResult(**result_data)
+            return self._parse_quick_response(response), processing_time
+            
+        except SemanticAnalysisError:
+            raise
+        except openai.OpenAIError as e:
+            raise SemanticAnalysisError(f"OpenAI API error: {str(e)}")
+        except json.JSONDecodeError as e:
+            raise SemanticAnalysisError(f"Failed to parse AI response: {str(e)}")
+        except Exception as e:
+            raise SemanticAnalysisError(f"Unexpected error during quick analysis: {str(e)}")
+    
+    async def quick_segmentation_async(
+        self,
+        text: str,
+        max_segments: Optional[int] = None
+    ) -> Tuple[QuickSegmentationResult, int]:
+        """Async variant of quick_segmentation for the ASGI views"""
+        if not text.strip():
+            raise SemanticAnalysisError("Text content is empty")
+        
+        start_time = time.time()
+        
+        try:
+            response = await create_completion_async(get_async_client(), 'quick_segmentation', **self._quick_request(text, max_segments))
             
-            return result, processing_time
+            processing_time = int((time.time() - start_time) * 1000)
             
+            return self._parse_quick_response(response), processing_time
+            
+        except SemanticAnalysisError:
+            raise
         except openai.OpenAIError as e:
             raise SemanticAnalysisError(f"OpenAI API error: {str(e)}")
         except json.JSONDecodeError as e:
@@ -146,6 +153,33 @@ class SemanticAnalysisService:
         except Exception as e:
             raise SemanticAnalysisError(f"Unexpected error during quick analysis: {str(e)}")
     
+    def _quick_request(self, text: str, max_segments: Optional[int]) -> dict:
+        """Chat completion arguments for quick segmentation"""
+        return dict(
+            model="gpt-4o-mini",  # Use faster model for quick analysis
+            messages=[
+                {
+                    "role": "system",
+                    "content": self._get_quick_system_prompt() + "\n\nPlease respond with valid JSON that matches the QuickSegmentationResult structure."
+                },
+                {
+                    "role": "user",
+                    "content": self._build_quick_prompt(text, max_segments)
+                }
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=2000,
+            temperature=0.1
+        )
+    
+    def _parse_quick_response(self, response) -> QuickSegmentationResult:
+        content = response.choices[0].message.content
+        if not content:
+            raise SemanticAnalysisError("Empty response from AI model")
+            
+        result_data = json.loads(content)
+        return QuickSegmentationResult(**result_data)
+    
     def _get_system_prompt(self) -> str:
         """System prompt for comprehensive document analysis"""
         return """
@@ -285,18 +319,9 @@ Provide segmentation following the QuickSegmentationResult schema.
             output_tokens = 500   # Estimated for quick analysis
             model = "gpt-4o-mini"
         
-        # OpenAI pricing (approximate, as of 2024)
-        pricing = {
-            "gpt-4o": {"input": 0.005, "output": 0.015},  # per 1K tokens
-            "gpt-4o-mini": {"input": 0.0001, "output": 0.0004}
-        }
-        
-        if model in pricing:
-            input_cost = (input_tokens / 1000) * pricing[model]["input"]
-            output_cost = (output_tokens / 1000) * pricing[model]["output"]
-            total_cost = input_cost + output_cost
-        else:
-            total_cost = 0.0
+        # Priced like actual calls in the LLM ledger, so estimates and spend are comparable
+        from .llm_ledger import cost_usd
+        total_cost = float(cost_usd(model, input_tokens, output_tokens))
         
         estimated_time_seconds = 10 if analysis_type == "full" else 3
         
@@ -3,10 +3,20 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
     Cognition, Node, PresetResponse, Arc, UserProfile, Widget, WidgetInteraction,
-    DocumentAnalysisResult, SemanticSegment, Group, GroupMembership, GroupInvitation
+    DocumentAnalysisResult, SemanticSegment, Group, GroupMembership, GroupInvitation,
+    ProcessingJob, UserProfileStats
 )
+from .authorization import authorization_for
 # Synthesis and SynthesisPresetLink removed - functionality consolidated into widgets
 
+def _profile_stats(profile):
+    """The profile's UserProfileStats row; select_related('stats') avoids a query per profile"""
+    try:
+        return profile.stats
+    except UserProfileStats.DoesNotExist:
+        from .profile_stats import profile_stats
+        return profile_stats.ensure(profile)
+
 class UserProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     follower_count = serializers.SerializerMethodField()
@@ -18,16 +28,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'bio', 'follower_count', 'following_count', 'is_following']
     
     def get_follower_count(self, obj):
-        return obj.followers.count()
+        return _profile_stats(obj).follower_count
     
     def get_following_count(self, obj):
-        return obj.following.count()
+        return _profile_stats(obj).following_count
     
     def get_is_following(self, obj):
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.profile.following.filter(pk=obj.pk).exists()
-        return False
+        if not (request and request.user.is_authenticated) or obj.user_id == request.user.id:
+            return False
+        from .follow_graph import follow_graph_for, profile_id_for
+        return follow_graph_for(request).is_following(profile_id_for(request.user), obj.pk)
 
 class UserProfileDetailSerializer(UserProfileSerializer):
     join_date = serializers.DateTimeField(source='user.date_joined', read_only=True)
@@ -43,22 +54,21 @@ class UserProfileDetailSerializer(UserProfileSerializer):
                   'recent_activity', 'recent_cognitions', 'is_own_profile']
     
     def get_public_cognitions_count(self, obj):
-        return obj.user.cognitions.filter(is_public=True).count()
+        return _profile_stats(obj).public_cognitions_count
     
     def get_recent_activity(self, obj):
-        # Get the most recent public cognition date
-        recent_cognition = obj.user.cognitions.filter(is_public=True).order_by('-updated_at').first()
-        return recent_cognition.updated_at if recent_cognition else obj.user.date_joined
+        # The most recent public cognition date, kept on the stats row
+        return _profile_stats(obj).last_public_activity or obj.user.date_joined
     
     def get_recent_cognitions(self, obj):
-        # Get 3 most recent public cognitions
-        recent = obj.user.cognitions.filter(is_public=True).order_by('-updated_at')[:3]
-        return [{'id': c.id, 'title': c.title, 'created_at': c.created_at} for c in recent]
+        # 3 most recent public cognitions, from the (user, is_public, -updated_at) index
+        recent = Cognition.objects.filter(user_id=obj.user_id, is_public=True).order_by('-updated_at')
+        return list(recent.values('id', 'title', 'created_at')[:3])
     
     def get_is_own_profile(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         return False
 
 class CognitionCollectiveSerializer(serializers.ModelSerializer):
@@ -71,7 +81,7 @@ class CognitionCollectiveSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at', 'nodes_count']
     
     def get_nodes_count(self, obj):
-        return obj.nodes.count()
+        return obj.nodes_total if hasattr(obj, 'nodes_total') else obj.nodes.count()
 
 class PresetResponseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -83,6 +93,15 @@ class WidgetInteractionSerializer(serializers.ModelSerializer):
         model = WidgetInteraction
         fields = ['id', 'completed', 'quiz_answer', 'interaction_data', 'created_at']
 
+class InteractionInputSerializer(serializers.Serializer):
+    """Validates one interaction event before it reaches the write path"""
+    completed = serializers.BooleanField(default=False)
+    quiz_answer = serializers.CharField(max_length=1, allow_blank=True, default='')
+    interaction_data = serializers.JSONField(default=dict)
+
+class InteractionEventSerializer(InteractionInputSerializer):
+    widget_id = serializers.IntegerField()
+
 class WidgetSerializer(serializers.ModelSerializer):
     user_interaction = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
@@ -105,7 +124,12 @@ class WidgetSerializer(serializers.ModelSerializer):
         if not request or not request.user.is_authenticated:
             return None
         
-        interaction = obj.interactions.filter(user=request.user).first()
+        # Prefetched by Node.objects.with_widgets() and WidgetViewSet
+        interactions = getattr(obj, 'user_interactions', None)
+        if interactions is not None:
+            interaction = interactions[0] if interactions else None
+        else:
+            interaction = obj.interactions.filter(user=request.user).first()
         if interaction:
             return WidgetInteractionSerializer(interaction).data
         return None
@@ -123,6 +147,8 @@ class WidgetSerializer(serializers.ModelSerializer):
 class NodeSerializer(serializers.ModelSerializer):
     # syntheses field removed - consolidated into widgets
     widgets = serializers.SerializerMethodField()
+    # Resolves offset-backed nodes; writing it gives the node its own content
+    content = serializers.CharField(source='text')
 
     class Meta:
         model = Node
@@ -140,9 +166,17 @@ class NodeSerializer(serializers.ModelSerializer):
         
         user = request.user
         
+        widgets = getattr(obj, 'visible_widgets', None)
+        if widgets is not None:
+            # Prefetched by Node.objects.with_widgets(), already in position order
+            owner_id = obj.cognition.user_id
+            author_widgets = [w for w in widgets if w.user_id == owner_id]
+            reader_widgets = [w for w in widgets if w.user_id == user.pk and w.widget_type.startswith('reader_')]
+            return WidgetSerializer(author_widgets + reader_widgets, many=True, context=self.context).data
+        
         # Get author widgets (visible to all)
         author_widgets = obj.widgets.filter(
-            user=obj.cognition.user
+            user_id=obj.cognition.user_id
         ).order_by('position', 'created_at')
         
         # Get reader widgets (only current user's)
@@ -158,6 +192,12 @@ class NodeSerializer(serializers.ModelSerializer):
         return WidgetSerializer(all_widgets, many=True, context=self.context).data
 
 class SemanticSegmentSerializer(serializers.ModelSerializer):
+    """
+    Segment text is sliced from the cognition's raw_content. Pass it in the
+    context as 'raw_content' to avoid loading the cognition per segment, and
+    set 'segment_content' to 'offsets' to leave the text out entirely so the
+    client slices it from raw_content itself.
+    """
     content = serializers.SerializerMethodField()
     length = serializers.ReadOnlyField()
     
@@ -171,12 +211,21 @@ class SemanticSegmentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'content', 'length']
     
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('segment_content') == 'offsets':
+            fields.pop('content')
+        return fields
+    
     def get_content(self, obj):
         """Return the actual text content for this segment"""
-        return obj.get_content()
+        raw_content = self.context.get('raw_content')
+        if raw_content is None:
+            return obj.get_content()
+        return raw_content[obj.start_position:obj.end_position]
 
 class DocumentAnalysisResultSerializer(serializers.ModelSerializer):
-    segments = SemanticSegmentSerializer(many=True, read_only=True)
+    segments = serializers.SerializerMethodField()
     processing_time_seconds = serializers.SerializerMethodField()
     
     class Meta:
@@ -194,6 +243,19 @@ class DocumentAnalysisResultSerializer(serializers.ModelSerializer):
             'segments'
         ]
     
+    def get_segments(self, obj):
+        """
+        Serialize segments against a single copy of the document text.
+        
+        ?segment_content=offsets on the request returns positions only.
+        """
+        request = self.context.get('request')
+        mode = request.query_params.get('segment_content', 'full') if request else 'full'
+        context = dict(self.context, segment_content=mode)
+        if mode != 'offsets':
+            context['raw_content'] = obj.cognition.raw_content
+        return SemanticSegmentSerializer(obj.segments.all(), many=True, context=context).data
+    
     def get_processing_time_seconds(self, obj):
         """Convert processing time to seconds for easier frontend use"""
         if obj.processing_time_ms:
@@ -215,16 +277,18 @@ class CognitionSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'raw_content', 'is_starred', 'created_at',
                   'updated_at', 'nodes_count', 'table_of_contents', 'is_public',
                   'username', 'user_id', 'group_name', 'group_id', 'group',
-                  'is_group_cognition', 'owner_display', 'can_edit']
+                  'is_group_cognition', 'owner_display', 'can_edit', 'revision']
+        read_only_fields = ['revision']
     
     def get_can_edit(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.can_edit(request.user)
+            return authorization_for(request).can_edit(obj)
         return False
     
     def get_nodes_count(self, obj):
-        return obj.nodes.count()
+        # Annotated by Cognition.objects.with_nodes_count() on list views
+        return obj.nodes_total if hasattr(obj, 'nodes_total') else obj.nodes.count()
 
 class CognitionDetailSerializer(CognitionSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
@@ -278,20 +342,19 @@ class GroupSerializer(serializers.ModelSerializer):
     def get_is_member(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.is_member(request.user)
+            return authorization_for(request).is_member(obj.id)
         return False
     
     def get_is_admin(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.is_admin(request.user)
+            return authorization_for(request).is_admin(obj.id)
         return False
     
     def get_user_role(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            membership = obj.memberships.filter(user=request.user).first()
-            return membership.role if membership else None
+            return authorization_for(request).role(obj.id)
         return None
 
 
@@ -304,7 +367,7 @@ class GroupDetailSerializer(GroupSerializer):
     
     def get_recent_cognitions(self, obj):
         # Get 5 most recent group cognitions
-        recent = obj.cognitions.order_by('-created_at')[:5]
+        recent = obj.cognitions.select_related('user', 'group').with_nodes_count().order_by('-created_at')[:5]
         return CognitionSerializer(recent, many=True, context=self.context).data
 
 
@@ -320,4 +383,14 @@ class GroupInvitationSerializer(serializers.ModelSerializer):
             'invitee', 'invitee_username', 'message', 'status',
             'created_at', 'responded_at'
         ]
-        read_only_fields = ['inviter', 'created_at', 'responded_at']
\ No newline at end of file
+        read_only_fields = ['inviter', 'created_at', 'responded_at']
+
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProcessingJob
+        fields = [
+            'id', 'job_type', 'status', 'progress_current', 'progress_total',
+            'params', 'result', 'error', 'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = fields
@@ -1,17 +1,87 @@
 
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import Cognition, Group, UserProfile, UserProfileStats, Node, Widget
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create a UserProfile when a new User is created"""
     if created:
-        UserProfile.objects.create(user=instance)
+        profile = UserProfile.objects.create(user=instance)
+        UserProfileStats.objects.create(profile=profile)
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """Save the UserProfile when the User is updated"""
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+@receiver(post_delete, sender=Node)
+def evict_node_from_similarity_index(sender, instance, **kwargs):
+    """Drop cached term counts for deleted nodes"""
+    from .similarity_service import similarity_service
+    similarity_service.index.evict(instance.id)
+
+@receiver(post_delete, sender=Node)
+def evict_node_digest(sender, instance, **kwargs):
+    """Drop the cached TOC digest for deleted nodes"""
+    from .node_digest import node_digests
+    node_digests.evict(instance.id)
+
+@receiver(post_save, sender=Widget)
+@receiver(post_delete, sender=Widget)
+def invalidate_reader_progress(sender, instance, origin=None, **kwargs):
+    """Required author widgets gate reader progress; recompute it after they change"""
+    if origin is not None and getattr(origin, 'model', type(origin)) is not Widget:
+        # Cascaded from a node or cognition delete, which bumps the revision progress is keyed on
+        return
+    if instance.widget_type.startswith('author_'):
+        from .reader_progress import reader_progress
+        reader_progress.invalidate(instance.node_id)
+
+@receiver(m2m_changed, sender=UserProfile.following.through)
+def refresh_follow_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recount follower/following totals and drop cached adjacency for both ends of changed follows"""
+    from .profile_stats import profile_stats
+    if action == 'pre_clear':
+        # The cleared ids are gone by post_clear; remember them
+        related = instance.followers if reverse else instance.following
+        instance._cleared_follow_ids = set(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_follow_ids', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    from .follow_graph import FollowGraph
+    changed = {instance.pk} | set(pk_set or ())
+    profile_stats.refresh_follows(changed)
+    FollowGraph().invalidate(changed)
+
+@receiver(post_save, sender=Cognition)
+def refresh_public_cognition_stats(sender, instance, created, **kwargs):
+    """Public cognitions feed the owner's profile counters and last activity"""
+    if instance.is_public or getattr(instance, '_loaded_is_public', False):
+        from .profile_stats import profile_stats
+        profile_stats.refresh_cognitions(instance.user_id)
+
+@receiver(post_delete, sender=Cognition)
+def refresh_public_cognition_stats_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Group) or getattr(origin, 'model', None) is Group:
+        # Refreshed once per owner by refresh_group_cognition_stats below
+        return
+    if instance.is_public:
+        from .profile_stats import profile_stats
+        profile_stats.refresh_cognitions(instance.user_id)
+
+@receiver(pre_delete, sender=Group)
+def collect_group_cognition_owners(sender, instance, **kwargs):
+    """Deleting a group cascades to its cognitions; note whose public counts will change"""
+    instance._public_cognition_owners = set(
+        instance.cognitions.filter(is_public=True).values_list('user_id', flat=True)
+    )
+
+@receiver(post_delete, sender=Group)
+def refresh_group_cognition_stats(sender, instance, **kwargs):
+    from .profile_stats import profile_stats
+    profile_stats.refresh_cognitions_many(getattr(instance, '_public_cognition_owners', ()))
@@ -0,0 +1,212 @@
+# api/similarity_service.py
+"""
+Offline TF-IDF similarity between nodes, used to propose and create 'similarity' arcs
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from .models import Arc, Node
+
+DEFAULT_INDEX_MAX_NODES = 50000
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its itself
+just me more most my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves also may might must
+shall one two us
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+
+class NodeTermIndex:
+    """
+    In-process LRU cache of per-node term counts.
+
+    Tokenizing is the expensive part of TF-IDF, so counts are kept per node and
+    only recomputed when the node's content hash changes. At most
+    settings.SIMILARITY_INDEX_MAX_NODES nodes are kept, least recently used
+    first out; deleted nodes are evicted through a post_delete signal. Term
+    columns are assigned per matrix, so nothing outlives its nodes.
+    """
+
+    def __init__(self, max_nodes: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._max_nodes = max_nodes
+        # node_id -> (content hash, terms, term counts)
+        self._entries: 'OrderedDict[int, Tuple[str, Tuple[str, ...], np.ndarray]]' = OrderedDict()
+
+    @property
+    def max_nodes(self) -> int:
+        if self._max_nodes is not None:
+            return self._max_nodes
+        return getattr(settings, 'SIMILARITY_INDEX_MAX_NODES', DEFAULT_INDEX_MAX_NODES)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def refresh(self, nodes: Iterable[Tuple[int, str]]) -> List[Tuple[int, Tuple[str, ...], np.ndarray]]:
+        """Bring the given (node_id, content) pairs up to date; return their (node_id, terms, counts) in order"""
+        rows = []
+        with self._lock:
+            for node_id, content in nodes:
+                digest = hashlib.md5(content.encode('utf-8')).hexdigest()
+                entry = self._entries.get(node_id)
+                if entry is None or entry[0] != digest:
+                    counts = Counter(tokenize(content))
+                    values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+                    entry = self._entries[node_id] = (digest, tuple(counts), values)
+                else:
+                    self._entries.move_to_end(node_id)
+                rows.append((node_id, entry[1], entry[2]))
+                while len(self._entries) > self.max_nodes:
+                    self._entries.popitem(last=False)
+        return rows
+
+    def evict(self, node_id: int):
+        with self._lock:
+            self._entries.pop(node_id, None)
+
+    @staticmethod
+    def matrix(rows: List[Tuple[int, Tuple[str, ...], np.ndarray]]) -> sparse.csr_matrix:
+        """L2-normalized TF-IDF matrix, one row per refresh() row"""
+        vocabulary: Dict[str, int] = {}
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(terms) for _, terms, _ in rows], out=indptr[1:])
+        indices = np.fromiter(
+            (vocabulary.setdefault(term, len(vocabulary)) for _, terms, _ in rows for term in terms),
+            dtype=np.int64, count=int(indptr[-1]),
+        )
+        tf = np.concatenate([counts for _, _, counts in rows]) if rows else np.zeros(0)
+        width = max(len(vocabulary), 1)
+
+        matrix = sparse.csr_matrix((1.0 + np.log(tf), indices, indptr), shape=(len(rows), width))
+
+        # Smoothed inverse document frequency, as in scikit-learn
+        df = np.bincount(indices, minlength=width)
+        idf = np.log((1.0 + len(rows)) / (1.0 + df)) + 1.0
+        matrix = matrix @ sparse.diags(idf)
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        # float32 halves memory traffic in the similarity products; scores don't need more precision
+        return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+
+class SimilarityArcService:
+    """Computes top-k cosine similarities between nodes without any network calls"""
+
+    def __init__(self, block_size: int = 512):
+        # Rows of the similarity matrix materialized at once; bounds memory to block_size x n
+        self.block_size = block_size
+        self.index = NodeTermIndex()
+
+    def scope_nodes(self, cognition=None, user=None):
+        nodes = Node.objects.filter(node_type='content')
+        if cognition is not None:
+            nodes = nodes.filter(cognition=cognition)
+        elif user is not None:
+            nodes = nodes.filter(cognition__user=user)
+        else:
+            raise ValueError("Either a cognition or a user is required")
+        return nodes
+
+    def propose(self, nodes, top_k: int = 5, min_score: float = 0.2) -> List[Dict]:
+        """
+        Return similarity proposals for the given node queryset.
+
+        Each unordered node pair appears once, as
+        {'source_node': id, 'target_node': id, 'score': float, 'strength': 1-10}.
+        """
+        rows = self.index.refresh(
+            (node.id, node.text)
+            for node in nodes.with_text().only('id', 'content', 'source_start', 'source_end').iterator()
+        )
+        if len(rows) < 2:
+            return []
+
+        node_ids = [node_id for node_id, _, _ in rows]
+        matrix = self.index.matrix(rows)
+        transposed = matrix.T.tocsr()
+        k = min(top_k, len(node_ids) - 1)
+        ids = np.asarray(node_ids, dtype=np.int64)
+        sources, targets, found = [], [], []
+
+        for start in range(0, len(node_ids), self.block_size):
+            stop = min(start + self.block_size, len(node_ids))
+            block = (matrix[start:stop] @ transposed).toarray()
+            block[np.arange(stop - start), np.arange(start, stop)] = 0.0  # ignore self-similarity
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(block, top, axis=1)
+            keep = scores >= min_score
+            rows = np.broadcast_to(np.arange(start, stop)[:, None], top.shape)
+
+            sources.append(ids[rows[keep]])
+            targets.append(ids[top[keep]])
+            found.append(scores[keep])
+
+        if not found:
+            return []
+        sources, targets, found = np.concatenate(sources), np.concatenate(targets), np.concatenate(found)
+
+        # Each unordered pair once, lower node id as the source
+        low, high = np.minimum(sources, targets), np.maximum(sources, targets)
+        _, first = np.unique(np.stack([low, high], axis=1), axis=0, return_index=True)
+        order = first[np.argsort(-found[first], kind='stable')]
+
+        return [
+            {
+                'source_node': int(low[i]),
+                'target_node': int(high[i]),
+                'score': round(float(found[i]), 4),
+                'strength': self.strength_for_score(float(found[i])),
+            }
+            for i in order
+        ]
+
+    @staticmethod
+    def strength_for_score(score: float) -> int:
+        """Map a cosine score in [0, 1] onto Arc.strength (1-10)"""
+        return max(1, min(10, int(math.ceil(score * 10))))
+
+    def create_arcs(self, proposals: List[Dict]) -> int:
+        """Create or refresh 'similarity' arcs for the given proposals"""
+        arcs = [
+            Arc(
+                source_node_id=p['source_node'],
+                target_node_id=p['target_node'],
+                arc_type='similarity',
+                description=f"Computed similarity {p['score']:.2f}",
+                strength=p['strength'],
+            )
+            for p in proposals
+        ]
+        with transaction.atomic():
+            Arc.objects.bulk_create(
+                arcs,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['source_node', 'target_node', 'arc_type'],
+                update_fields=['description', 'strength'],
+            )
+        return len(arcs)
+
+
+# Global instance
+similarity_service = SimilarityArcService()
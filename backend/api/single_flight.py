@@ -0,0 +1,203 @@
+# api/single_flight.py
+"""
+Single-flight coalescing of identical LLM-bound requests across workers
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import InFlightCall
+
+PURGE_AFTER = timedelta(hours=1)
+
+
+class SingleFlightError(Exception):
+    """The shared call failed, or did not finish within SINGLE_FLIGHT_TIMEOUT"""
+    pass
+
+
+class SingleFlightPending(Exception):
+    """An identical request is still running after SINGLE_FLIGHT_SYNC_WAIT; retry after ``retry_after`` seconds"""
+
+    def __init__(self, operation: str, retry_after: int = 1):
+        self.retry_after = retry_after
+        super().__init__(f'An identical {operation} request is in progress; retry shortly for its result')
+
+
+class SingleFlight:
+    """
+    Runs an operation once for all concurrent identical requests.
+
+    Requests are identified by (operation, object id, content hash). The first
+    one inserts an InFlightCall row under that key and does the work; the
+    unique constraint makes the claim atomic across processes and hosts.
+    Requests that find the row running poll it with backoff and return the
+    stored result, or re-raise the leader's error when its class is listed
+    in ``shared_errors``.
+
+    A synchronous follower holds a worker thread while it polls, so run()
+    only waits SINGLE_FLIGHT_SYNC_WAIT seconds before raising
+    SingleFlightPending, which views answer with 202 and Retry-After; the
+    retry picks up the shared result. run_async does not hold a thread and
+    waits up to SINGLE_FLIGHT_TIMEOUT.
+
+    A completed result keeps being shared for SINGLE_FLIGHT_RESULT_TTL seconds
+    (a double-click that lands just after the first call returns, or a
+    follower's retry), so keep it above the Retry-After. A failed
+    row, or a running row older than SINGLE_FLIGHT_TIMEOUT whose worker has
+    presumably died, is taken over by the next request.
+    """
+
+    poll_interval = 0.05
+    max_poll_interval = 0.5
+
+    @property
+    def timeout(self) -> float:
+        return getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 120)
+
+    @property
+    def sync_wait(self) -> float:
+        return getattr(settings, 'SINGLE_FLIGHT_SYNC_WAIT', 3)
+
+    @property
+    def result_ttl(self) -> float:
+        return getattr(settings, 'SINGLE_FLIGHT_RESULT_TTL', 5)
+
+    @staticmethod
+    def content_hash(*parts) -> str:
+        """Stable hash of JSON-serializable request inputs (text, parameters, revisions)"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_key(operation: str, object_id, content_hash: str) -> str:
+        return hashlib.sha256(f'{operation}:{object_id}:{content_hash}'.encode('utf-8')).hexdigest()
+
+    def run(self, operation: str, object_id, content_hash: str, func: Callable[[], Any],
+            shared_errors: Tuple[Type[Exception], ...] = ()) -> Any:
+        """Return func()'s JSON-serializable result, computed once per key; may raise SingleFlightPending"""
+        from .llm_ledger import llm_ledger
+        
+        key = self.make_key(operation, object_id, content_hash)
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.sync_wait
+        delay = self.poll_interval
+        while True:
+            leader, row = self._claim(key, operation, waiting=delay > self.poll_interval)
+            if leader:
+                return self._lead(key, func, shared_errors)
+            if row is not None:
+                outcome = self._outcome(row, shared_errors)
+                if outcome is not None:
+                    llm_ledger.record_cache_hit(operation, started)
+                    return outcome[0]
+            if time.monotonic() > deadline:
+                raise SingleFlightPending(operation)
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def run_async(self, operation: str, object_id, content_hash: str, func: Callable[[], Awaitable[Any]],
+                        shared_errors: Tuple[Type[Exception], ...] = ()) -> Any:
+        """Async variant of run; func is a coroutine function"""
+        from .llm_ledger import llm_ledger
+        
+        key = self.make_key(operation, object_id, content_hash)
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        delay = self.poll_interval
+        while True:
+            leader, row = await sync_to_async(self._claim)(key, operation, waiting=delay > self.poll_interval)
+            if leader:
+                try:
+                    result = await func()
+                except Exception as e:
+                    await sync_to_async(self._fail)(key, e, shared_errors)
+                    raise
+                await sync_to_async(self._complete)(key, result)
+                return result
+            if row is not None:
+                outcome = self._outcome(row, shared_errors)
+                if outcome is not None:
+                    await llm_ledger.record_cache_hit_async(operation, started)
+                    return outcome[0]
+            if time.monotonic() > deadline:
+                raise SingleFlightError(f'Timed out waiting for an identical {operation} request')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    def _claim(self, key: str, operation: str, waiting: bool = False) -> Tuple[bool, Optional[InFlightCall]]:
+        """
+        (True, None) when this request is the leader, else (False, current row or None).
+        A failure is shared with requests that were already waiting on it.
+        """
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                InFlightCall.objects.create(key=key, operation=operation, updated_at=now)
+        except IntegrityError:
+            pass
+        else:
+            # Finished rows are only useful for a few seconds; sweep old ones on the way out
+            InFlightCall.objects.filter(updated_at__lt=now - PURGE_AFTER).exclude(status='running').delete()
+            return True, None
+
+        row = InFlightCall.objects.filter(key=key).first()
+        if row is None:
+            return False, None
+
+        age = (now - row.updated_at).total_seconds()
+        stale = (
+            (row.status == 'failed' and not waiting)
+            or (row.status == 'completed' and age > self.result_ttl)
+            or (row.status == 'running' and age > self.timeout)
+        )
+        if stale:
+            taken = InFlightCall.objects.filter(pk=row.pk, updated_at=row.updated_at).update(
+                status='running', result=None, error='', error_type='', updated_at=now
+            )
+            if taken:
+                return True, None
+        return False, row
+
+    def _lead(self, key: str, func: Callable[[], Any], shared_errors) -> Any:
+        try:
+            result = func()
+        except Exception as e:
+            self._fail(key, e, shared_errors)
+            raise
+        self._complete(key, result)
+        return result
+
+    @staticmethod
+    def _complete(key: str, result: Any):
+        InFlightCall.objects.filter(key=key).update(status='completed', result=result, updated_at=timezone.now())
+
+    @staticmethod
+    def _fail(key: str, error: Exception, shared_errors):
+        InFlightCall.objects.filter(key=key).update(
+            status='failed',
+            error=str(error),
+            error_type=type(error).__name__ if isinstance(error, shared_errors) else '',
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def _outcome(row: InFlightCall, shared_errors) -> Optional[Tuple[Any]]:
+        """(result,) once the leader has finished, None while it is still running"""
+        if row.status == 'completed':
+            return (row.result,)
+        if row.status == 'failed':
+            for error_class in shared_errors:
+                if error_class.__name__ == row.error_type:
+                    raise error_class(row.error)
+            raise SingleFlightError(row.error or 'The shared request failed')
+        return None
+
+
+# Global instance
+single_flight = SingleFlight()
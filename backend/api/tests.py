@@ -1,3 +1,1085 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+from collections import Counter
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.generators import PASSWORD, create_cognitions, create_users, paragraph
+
+from .models import (
+    Arc, Cognition, DocumentAnalysisResult, FollowSuggestion, Group, GroupInvitation, GroupMembership,
+    LLMCall, Node, PresetResponse, ProcessingJob, SemanticSegment, UserProfile, Widget, WidgetInteraction,
+    WidgetStats,
+)
+
+# Fixture sizes; every endpoint must cost the same number of queries at each
+SIZES = (3, 6)
+
+_fake_openai = None
+
+
+def setUpModule():
+    # The LLM services build their OpenAI clients on first use, which happens on
+    # the first request; point them at a local fake, with a key that is no one's
+    global _fake_openai
+    _fake_openai = FakeOpenAIServer(latency=0).start()
+    os.environ['OPENAI_BASE_URL'] = _fake_openai.base_url
+    os.environ['OPENAI_API_KEY'] = 'test'
+
+
+def tearDownModule():
+    _fake_openai.shutdown()
+
+
+class BudgetFixture:
+    """
+    A cognition with ``size`` nodes, widgets, readers, followers, group
+    members, invitations and so on: every collection an endpoint might loop
+    over has ``size`` entries.
+
+    owner writes the cognition ``doc`` and founds ``group``; reader follows
+    owner, belongs to the group, interacts with doc's widgets and has
+    pending invitations; outsider has no relation to either.
+    """
+
+    def __init__(self, size):
+        users = create_users(size + 3, prefix=f'budget{size}_')
+        self.owner, self.reader, self.outsider = users[:3]
+        self.others = users[3:]
+        self.tokens = {user.pk: user.auth_token.key for user in users}
+
+        self.doc = create_cognitions([self.owner], 1, nodes=size, public_share=1)[0]
+        self.doc.raw_content = '\n\n'.join(paragraph(random.Random(i)) for i in range(size))
+        self.doc.save()
+        self.cognitions = create_cognitions([self.owner] + self.others, size, nodes=size, public_share=1)
+        self.nodes = list(self.doc.nodes.order_by('position'))
+
+        self.widgets = []
+        for node in self.nodes:
+            self.widgets += [
+                Widget.objects.create(node=node, user=self.owner, widget_type='author_quiz', is_required=True,
+                                      quiz_question='Which?', quiz_choices=['A', 'B'], quiz_correct_answer='A'),
+                Widget.objects.create(node=node, user=self.owner, widget_type='author_remark', content='Note.'),
+                Widget.objects.create(node=node, user=self.reader, widget_type='reader_remark', content='Mine.'),
+            ]
+        WidgetInteraction.objects.bulk_create([
+            WidgetInteraction(widget=widget, user=self.reader, completed=True, quiz_answer='A')
+            for widget in self.widgets if widget.widget_type == 'author_quiz'
+        ])
+        Arc.objects.bulk_create([
+            Arc(source_node=source, target_node=target, arc_type='similarity')
+            for source, target in zip(self.nodes, self.nodes[1:])
+        ])
+
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user__in=users)}
+        self.owner_profile = profiles[self.owner.pk]
+        self.reader_profile = profiles[self.reader.pk]
+        self.outsider_profile = profiles[self.outsider.pk]
+        for other in self.others:
+            profiles[other.pk].follow(self.owner_profile)
+            self.owner_profile.follow(profiles[other.pk])
+            self.reader_profile.follow(profiles[other.pk])
+        self.reader_profile.follow(self.owner_profile)
+        FollowSuggestion.objects.bulk_create([
+            FollowSuggestion(profile=self.reader_profile, suggested=profiles[other.pk], mutual_count=1)
+            for other in self.others
+        ])
+
+        self.group = Group.objects.create(name='Budget group', founder=self.owner)
+        GroupMembership.objects.bulk_create(
+            [GroupMembership(group=self.group, user=self.owner, role='admin'),
+             GroupMembership(group=self.group, user=self.reader)]
+            + [GroupMembership(group=self.group, user=other) for other in self.others]
+        )
+        Cognition.objects.filter(pk__in=[c.pk for c in self.cognitions[:size]]).update(group=self.group)
+        self.invitations = [
+            GroupInvitation.objects.create(
+                group=Group.objects.create(name=f'Invite {i}', founder=self.owner),
+                inviter=self.owner, invitee=self.reader,
+            )
+            for i in range(size)
+        ]
+
+        self.analysis = DocumentAnalysisResult.objects.create(
+            cognition=self.doc, document_type='article', overall_summary='Summary', main_themes=['theme'],
+            target_audience='Readers', complexity_level='beginner', estimated_total_read_time=60,
+            overall_coherence_score=0.9, segmentation_confidence=0.9,
+        )
+        SemanticSegment.objects.bulk_create([
+            SemanticSegment(
+                analysis=self.analysis, node=node, start_position=0, end_position=10, title=f'Segment {i}',
+                summary='Summary', topic_keywords=['k'], importance_level='primary', estimated_reading_time=10,
+                semantic_coherence_score=0.9, sequence_order=i,
+            )
+            for i, node in enumerate(self.nodes)
+        ])
+        PresetResponse.objects.bulk_create([
+            PresetResponse(title=f'Preset {i}', content='Text', category=f'Category {i % 2}') for i in range(size)
+        ])
+        self.preset = PresetResponse.objects.first()
+        ProcessingJob.objects.bulk_create([
+            ProcessingJob(user=self.owner, job_type='batch_widget_generation') for _ in range(size)
+        ])
+        self.job = ProcessingJob.objects.filter(user=self.owner).first()
+        LLMCall.objects.bulk_create([
+            LLMCall(user=self.owner, operation=f'operation {i % 2}', model='gpt-3.5-turbo', prompt_tokens=100,
+                    completion_tokens=20, latency_ms=100 + i, finish_reason='stop')
+            for i in range(size)
+        ])
+
+
+class Endpoint:
+    """
+    One (route name, HTTP method) pair with its query budget. ``args``,
+    ``data`` and ``query`` are functions of the BudgetFixture; ``user`` names
+    the fixture user making the request.
+    """
+
+    def __init__(self, name, method, budget, args=None, data=None, query=None, user='owner',
+                 content_type=None, statuses=None):
+        self.name = name
+        self.method = method
+        self.budget = budget
+        self.args = args
+        self.data = data
+        self.query = query
+        self.user = user
+        self.content_type = content_type
+        self.statuses = statuses
+
+    def __str__(self):
+        return f'{self.method.upper()} {self.name}'
+
+    def call(self, client, fixture):
+        path = reverse(self.name, args=self.args(fixture) if self.args else None)
+        if self.query:
+            path += '?' + self.query(fixture)
+        user = getattr(fixture, self.user) if self.user else None
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {fixture.tokens[user.pk]}')
+        data = self.data(fixture) if self.data else None
+        if self.content_type:
+            return getattr(client, self.method)(path, data, content_type=self.content_type)
+        if self.method == 'get':
+            return client.get(path)
+        return getattr(client, self.method)(path, data, format='json')
+
+
+def _doc(f):
+    return [f.doc.pk]
+
+
+def _node(f):
+    return [f.nodes[0].pk]
+
+
+def _quiz(f):
+    return [f.widgets[0].pk]
+
+
+def _group(f):
+    return [f.group.pk]
+
+
+ENDPOINTS = [
+    # Function views
+    Endpoint('hello_world', 'get', 2),
+    Endpoint('create_cognition', 'post', 6, data=lambda f: {'title': 'New', 'raw_content': 'Text.'}),
+    Endpoint('add_or_update_node', 'post', 8, data=lambda f: {'node_id': f.nodes[0].pk, 'content': 'Updated.'}),
+    Endpoint('register', 'post', 9, user=None, data=lambda f: {'username': 'newcomer', 'password': PASSWORD}),
+    Endpoint('login', 'post', 2, user=None, data=lambda f: {'username': f.owner.username, 'password': PASSWORD}),
+    Endpoint('logout', 'post', 3),
+    Endpoint('user_info', 'get', 2),
+    Endpoint('refresh_token', 'post', 7),
+    Endpoint('convert_text_to_markdown', 'post', 3, data=lambda f: {'raw_text': 'Some text to format.'}),
+    Endpoint('llm_usage', 'get', 4, query=lambda f: 'days=7&by=operation'),
+    Endpoint('async_process_text', 'post', 18, args=_doc, data=lambda f: {}),
+    Endpoint('async_quick_segment', 'post', 23, args=_doc, data=lambda f: {}),
+    Endpoint('async_generate_toc', 'post', 28, args=_doc, data=lambda f: {}),
+    Endpoint('async_create_llm_widget', 'post', 12,
+             data=lambda f: {'node_id': f.nodes[0].pk, 'widget_type': 'author_remark', 'llm_preset': 'summary'}),
+    Endpoint('async_convert_text_to_markdown', 'post', 3, data=lambda f: {'raw_text': 'Some text to format.'}),
+
+    # Cognitions
+    Endpoint('cognition-list', 'get', 4),
+    Endpoint('cognition-list', 'post', 6, data=lambda f: {'title': 'New', 'raw_content': 'Text.'}),
+    Endpoint('cognition-detail', 'get', 7, args=_doc, user='reader'),
+    Endpoint('cognition-detail', 'put', 13, args=_doc, data=lambda f: {'title': 'Renamed', 'raw_content': 'New text.'}),
+    Endpoint('cognition-detail', 'patch', 14, args=_doc, data=lambda f: {'title': 'Renamed'}),
+    Endpoint('cognition-detail', 'delete', 23, args=_doc),
+    Endpoint('cognition-star', 'post', 8, args=_doc),
+    Endpoint('cognition-duplicate', 'post', 8, args=_doc),
+    Endpoint('cognition-toggle-share', 'post', 9, args=_doc),
+    Endpoint('cognition-process-text', 'post', 18, args=_doc),
+    Endpoint('cognition-analytics', 'get', 5, args=_doc),
+    Endpoint('cognition-progress', 'get', 6, args=_doc, user='reader'),
+    Endpoint('cognition-quick-segment', 'post', 24, args=_doc),
+    Endpoint('cognition-bulk-create-nodes', 'post', 11, args=_doc, data=lambda f: {'paragraphs': ['One.', 'Two.']}),
+    Endpoint('cognition-generate-toc', 'post', 29, args=_doc),
+    Endpoint('cognition-analyze', 'get', 4, args=_doc),
+    Endpoint('cognition-analyze', 'post', 24, args=_doc, data=lambda f: {'force': True}),
+    Endpoint('cognition-node-ops', 'post', 13, args=_doc, data=lambda f: {'operations': [
+        {'op': 'update', 'node_id': f.nodes[0].pk, 'content': 'Updated.'},
+        {'op': 'move', 'node_id': f.nodes[0].pk, 'new_position': len(f.nodes) - 1},
+        {'op': 'insert', 'content': 'Inserted.', 'position': 0},
+    ]}),
+    Endpoint('cognition-similarity-arcs', 'post', 8, args=_doc, data=lambda f: {'create': True}),
+    Endpoint('cognition-export', 'get', 7),
+    Endpoint('cognition-bulk-ingest', 'post', 6, content_type='application/x-ndjson', data=lambda f: '\n'.join(
+        json.dumps({'title': f'Ingested {i}', 'content': 'First paragraph.\n\nSecond paragraph.'}) for i in range(2)
+    )),
+    Endpoint('cognition-collective', 'get', 4, user='reader'),
+
+    # Nodes
+    Endpoint('node-list', 'get', 5),
+    Endpoint('node-list', 'post', 10, data=lambda f: {'cognition': f.doc.pk, 'content': 'New node.',
+                                                     'position': len(f.nodes), 'character_count': 9}),
+    Endpoint('node-detail', 'get', 6, args=_node, user='reader'),
+    Endpoint('node-detail', 'patch', 17, args=_node, data=lambda f: {'content': 'Edited.'}),
+    Endpoint('node-detail', 'delete', 22, args=_node),
+    Endpoint('node-toggle-illumination', 'post', 9, args=_node),
+    Endpoint('node-merge-with-next', 'post', 24, args=_node),
+    Endpoint('node-split-node', 'post', 16, args=_node, data=lambda f: {'split_position': 10}),
+    Endpoint('node-reorder-position', 'post', 17, args=_node, data=lambda f: {'new_position': len(f.nodes) - 1}),
+
+    # Preset responses
+    Endpoint('presetresponse-list', 'get', 3),
+    Endpoint('presetresponse-list', 'post', 3, data=lambda f: {'title': 'New', 'content': 'Text', 'category': 'A'}),
+    Endpoint('presetresponse-by-category', 'get', 3),
+    Endpoint('presetresponse-detail', 'get', 3, args=lambda f: [f.preset.pk]),
+    Endpoint('presetresponse-detail', 'put', 4, args=lambda f: [f.preset.pk],
+             data=lambda f: {'title': 'Renamed', 'content': 'Text', 'category': 'A'}),
+    Endpoint('presetresponse-detail', 'patch', 4, args=lambda f: [f.preset.pk], data=lambda f: {'title': 'Renamed'}),
+    Endpoint('presetresponse-detail', 'delete', 4, args=lambda f: [f.preset.pk]),
+
+    # Arcs
+    Endpoint('arc-list', 'get', 3),
+    Endpoint('arc-list', 'post', 6, data=lambda f: {'source_node': f.nodes[-1].pk, 'target_node': f.nodes[0].pk,
+                                                    'arc_type': 'similarity'}),
+    Endpoint('arc-detail', 'get', 4, args=lambda f: [f.nodes[0].outgoing_arcs.get().pk]),
+    Endpoint('arc-detail', 'put', 10, args=lambda f: [f.nodes[0].outgoing_arcs.get().pk],
+             data=lambda f: {'source_node': f.nodes[0].pk, 'target_node': f.nodes[1].pk, 'arc_type': 'contrast'}),
+    Endpoint('arc-detail', 'patch', 7, args=lambda f: [f.nodes[0].outgoing_arcs.get().pk],
+             data=lambda f: {'strength': 7}),
+    Endpoint('arc-detail', 'delete', 5, args=lambda f: [f.nodes[0].outgoing_arcs.get().pk]),
+    Endpoint('arc-neighborhood', 'get', 6, query=lambda f: f'node={f.nodes[0].pk}&depth=2'),
+    Endpoint('arc-path', 'get', 5, query=lambda f: f'source={f.nodes[0].pk}&target={f.nodes[1].pk}'),
+    Endpoint('arc-subgraph', 'get', 6, query=lambda f: f'cognition={f.doc.pk}'),
+
+    # Profiles
+    Endpoint('profile-list', 'get', 5, user='reader'),
+    Endpoint('profile-detail', 'get', 6, args=lambda f: [f.owner_profile.pk], user='reader'),
+    Endpoint('profile-me', 'get', 4),
+    Endpoint('profile-my-profile', 'get', 3),
+    Endpoint('profile-search-users', 'get', 5, user='reader', query=lambda f: 'q=budget'),
+    Endpoint('profile-suggestions', 'get', 5, user='reader'),
+    Endpoint('profile-cognitions', 'get', 4, args=lambda f: [f.owner_profile.pk], user='reader'),
+    Endpoint('profile-follow', 'post', 9, args=lambda f: [f.outsider_profile.pk], user='reader'),
+    Endpoint('profile-unfollow', 'post', 8, args=lambda f: [f.owner_profile.pk], user='reader'),
+    Endpoint('profile-followers', 'get', 7, args=lambda f: [f.owner_profile.pk], user='reader'),
+    Endpoint('profile-following', 'get', 7, args=lambda f: [f.owner_profile.pk], user='reader'),
+    Endpoint('profile-update-bio', 'patch', 4, args=lambda f: [f.owner_profile.pk], data=lambda f: {'bio': 'Hi'}),
+
+    # Widgets
+    Endpoint('widget-list', 'get', 4, user='reader'),
+    Endpoint('widget-list', 'post', 8, data=lambda f: {'node': f.nodes[0].pk, 'widget_type': 'author_remark',
+                                                       'content': 'Remark.'}),
+    Endpoint('widget-detail', 'get', 4, args=_quiz, user='reader'),
+    Endpoint('widget-detail', 'put', 7, args=_quiz, data=lambda f: {
+        'node': f.nodes[0].pk, 'widget_type': 'author_quiz', 'quiz_question': 'Which one?',
+        'quiz_choices': ['A', 'B'], 'quiz_correct_answer': 'B'}),
+    Endpoint('widget-detail', 'patch', 6, args=_quiz, data=lambda f: {'quiz_question': 'Which one?'}),
+    Endpoint('widget-detail', 'delete', 8, args=_quiz),
+    Endpoint('widget-interact', 'post', 22, args=_quiz, user='reader', data=lambda f: {'quiz_answer': 'B'}),
+    Endpoint('widget-interact-batch', 'post', 15, user='reader', data=lambda f: {'interactions': [
+        {'widget_id': widget.pk, 'completed': True} for widget in f.widgets[:3]
+    ]}),
+    Endpoint('widget-create-llm-widget', 'post', 14,
+             data=lambda f: {'node_id': f.nodes[0].pk, 'widget_type': 'author_remark', 'llm_preset': 'summary'}),
+    Endpoint('widget-batch-generate', 'post', 18, data=lambda f: {
+        'cognition_id': f.doc.pk, 'widget_type': 'author_remark', 'llm_preset': 'summary',
+        'node_ids': [node.pk for node in f.nodes[:2]]}),
+
+    # Groups and invitations
+    Endpoint('group-list', 'get', 4, user='reader'),
+    Endpoint('group-list', 'post', 10, data=lambda f: {'name': 'New group'}),
+    Endpoint('group-detail', 'get', 6, args=_group, user='reader'),
+    Endpoint('group-detail', 'put', 8, args=_group, data=lambda f: {'name': 'Renamed', 'is_public': True}),
+    Endpoint('group-detail', 'patch', 8, args=_group, data=lambda f: {'name': 'Renamed'}),
+    Endpoint('group-detail', 'delete', 20, args=_group),
+    Endpoint('group-members', 'get', 4, args=_group, user='reader'),
+    Endpoint('group-join', 'post', 8, args=_group, user='outsider'),
+    Endpoint('group-leave', 'post', 6, args=_group, user='reader'),
+    Endpoint('group-invite', 'post', 8, args=_group, data=lambda f: {'username': f.outsider.username}),
+    Endpoint('group-update-member-role', 'patch', 7, args=_group, data=lambda f: {'user_id': f.reader.pk,
+                                                                                  'role': 'admin'}),
+    Endpoint('group-remove-member', 'post', 8, args=_group, data=lambda f: {'user_id': f.reader.pk}),
+    Endpoint('group-cognitions', 'get', 5, args=_group, user='reader'),
+    Endpoint('invitation-list', 'get', 3, user='reader'),
+    Endpoint('invitation-detail', 'get', 3, args=lambda f: [f.invitations[0].pk], user='reader'),
+    Endpoint('invitation-accept', 'post', 8, args=lambda f: [f.invitations[0].pk], user='reader'),
+    Endpoint('invitation-decline', 'post', 4, args=lambda f: [f.invitations[0].pk], user='reader'),
+
+    # Background jobs
+    Endpoint('job-list', 'get', 3),
+    Endpoint('job-detail', 'get', 3, args=lambda f: [f.job.pk]),
+]
+
+
+def _normalize(sql):
+    """SQL with literals replaced, so the same statement for different rows compares equal"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\(\?(?:, \?)*\)', '(...)', sql)
+
+
+def duplicated_queries(queries, limit=5):
+    """Report of the statements run more than once, most repeated first"""
+    counts = Counter(_normalize(query['sql']) for query in queries)
+    repeated = [(count, sql) for sql, count in counts.most_common(limit) if count > 1]
+    if not repeated:
+        return 'No statement ran more than once.'
+    return '\n'.join(f'  {count}x {sql}' for count, sql in repeated)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PROCESSING_JOBS_EAGER=True,
+    LLM_ADMISSION_ENABLED=False,
+    LLM_LEDGER_ASYNC=False,  # Ledger rows are written (and counted) in the request instead of a background thread
+)
+class QueryBudgetTests(TestCase):
+    """
+    Every route in api/urls.py, requested against fixtures of each size in
+    SIZES, must stay within its declared query budget and cost the same
+    number of queries at every size. A count that grows with the fixture is
+    an N+1; the failure lists the statements that repeated.
+    """
+
+    def measure(self, endpoint, size):
+        """(status code, captured queries) for one request against a fresh fixture"""
+        with transaction.atomic():
+            fixture = BudgetFixture(size)
+            cache.clear()
+            client = APIClient(raise_request_exception=True)
+            with CaptureQueriesContext(connection) as captured:
+                response = endpoint.call(client, fixture)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            # A budget measured on a job that failed would only cover its error path
+            failed_jobs = list(ProcessingJob.objects.filter(status='failed').values_list('job_type', 'error'))
+            transaction.set_rollback(True)
+        self.assertEqual(failed_jobs, [], f'{endpoint} ran a job that failed at size {size}')
+        return response.status_code, captured.captured_queries
+
+    def test_every_route_has_a_budget(self):
+        declared = {(endpoint.name, endpoint.method) for endpoint in ENDPOINTS}
+        missing, seen = [], {None, 'api-root'}
+        for pattern in get_resolver('api.urls').url_patterns:
+            if pattern.name in seen:
+                continue  # Format-suffix variants repeat the name
+            seen.add(pattern.name)
+            callback = pattern.callback
+            actions = getattr(callback, 'actions', None)
+            if actions is not None:
+                allowed = callback.cls.http_method_names
+                # DRF adds 'head' to a viewset's actions once it has served a GET
+                methods = [method for method in actions if method in allowed and method != 'head']
+            elif hasattr(callback, 'cls'):
+                methods = [method for method in callback.cls.http_method_names if method != 'options']
+            else:
+                methods = ['post']  # async_api_view endpoints are POST-only
+            missing += [f'{method.upper()} {pattern.name}' for method in methods
+                        if (pattern.name, method) not in declared]
+        self.assertEqual(missing, [], 'Declare a query budget in ENDPOINTS for these routes')
+
+    def test_query_budgets(self):
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=str(endpoint)):
+                results = [(size,) + self.measure(endpoint, size) for size in SIZES]
+                for size, status_code, _ in results:
+                    expected = endpoint.statuses or range(200, 300)
+                    self.assertIn(status_code, expected, f'{endpoint} returned {status_code} at size {size}')
+
+                counts = [len(queries) for _, _, queries in results]
+                largest = results[-1][2]
+                self.assertEqual(
+                    len(set(counts)), 1,
+                    f'{endpoint} query count grows with data size: '
+                    f'{dict(zip(SIZES, counts))}\n{duplicated_queries(largest)}'
+                )
+                self.assertLessEqual(
+                    counts[-1], endpoint.budget,
+                    f'{endpoint} ran {counts[-1]} queries, over its budget of {endpoint.budget}\n'
+                    f'{duplicated_queries(largest)}'
+                )
+
+
+class TransferImportTests(TestCase):
+    """An export imported for another user keeps its structure, on freshly assigned ids"""
+
+    def setUp(self):
+        from .toc_processor import TOCProcessor
+
+        self.author, self.commenter, self.importer = create_users(3, prefix='transfer_')
+        self.source = create_cognitions([self.author], 1, nodes=4, public_share=1)[0]
+        self.nodes = list(self.source.nodes.order_by('position'))
+        Widget.objects.create(node=self.nodes[0], user=self.commenter, widget_type='reader_remark', content='Hm.')
+        Arc.objects.create(source_node=self.nodes[0], target_node=self.nodes[3], arc_type='similarity')
+        toc = TOCProcessor._anchor_sections(
+            {'sections': [{'title': 'One', 'start_node': 1, 'end_node': 2},
+                          {'title': 'Two', 'start_node': 3, 'end_node': 4}]},
+            [(node.id, node.character_count) for node in self.nodes],
+        )
+        Cognition.objects.filter(pk=self.source.pk).update(table_of_contents=toc)
+
+    def import_export(self, **options):
+        from .transfer_service import transfer_service
+
+        lines = list(transfer_service.iter_ndjson(Cognition.objects.filter(pk=self.source.pk)))
+        stats = transfer_service.import_records(lines, self.importer, **options)
+        return stats, Cognition.objects.get(user=self.importer)
+
+    def test_ids_are_remapped(self):
+        stats, imported = self.import_export()
+        self.assertEqual(stats['nodes'], 4)
+        nodes = list(imported.nodes.order_by('position'))
+        old_to_new = {old.id: new.id for old, new in zip(self.nodes, nodes)}
+
+        arc = Arc.objects.get(source_node__cognition=imported)
+        self.assertEqual((arc.source_node_id, arc.target_node_id), (nodes[0].id, nodes[3].id))
+
+        sections = imported.table_of_contents['sections']
+        self.assertEqual([section['node_ids'] for section in sections],
+                         [[old_to_new[node.id] for node in self.nodes[:2]],
+                          [old_to_new[node.id] for node in self.nodes[2:]]])
+        self.assertEqual([(s['start_node_id'], s['end_node_id']) for s in sections],
+                         [(nodes[0].id, nodes[1].id), (nodes[2].id, nodes[3].id)])
+
+    def test_widgets_belong_to_the_importer_unless_usernames_are_mapped(self):
+        _, imported = self.import_export()
+        self.assertEqual(Widget.objects.get(node__cognition=imported).user, self.importer)
+
+        Cognition.objects.filter(user=self.importer).delete()
+        _, imported = self.import_export(map_usernames=True)
+        self.assertEqual(Widget.objects.get(node__cognition=imported).user, self.commenter)
+
+    def test_profile_counters_are_refreshed(self):
+        self.import_export()
+        self.assertEqual(UserProfile.objects.get(user=self.importer).stats.public_cognitions_count, 1)
+
+    def test_analyses_are_inserted_per_batch(self):
+        from .transfer_service import transfer_service
+
+        sources = [self.source] + create_cognitions([self.author], 2, nodes=2, seed=1)
+        for cognition in sources:
+            analysis = DocumentAnalysisResult.objects.create(
+                cognition=cognition, document_type='article', overall_summary='Summary.', target_audience='All',
+                complexity_level='beginner', estimated_total_read_time=60, overall_coherence_score=0.9,
+                segmentation_confidence=0.8,
+            )
+            node = cognition.nodes.order_by('position').first()
+            SemanticSegment.objects.create(
+                analysis=analysis, node=node, start_position=0, end_position=10, title='Start', summary='S.',
+                importance_level='primary', estimated_reading_time=10, semantic_coherence_score=0.9,
+                sequence_order=0,
+            )
+
+        lines = list(transfer_service.iter_ndjson(Cognition.objects.filter(pk__in=[c.pk for c in sources])))
+        with CaptureQueriesContext(connection) as captured:
+            stats = transfer_service.import_records(lines, self.importer)
+        inserts = [query for query in captured.captured_queries
+                   if query['sql'].startswith('INSERT INTO "api_documentanalysisresult"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(stats['segments'], 3)
+        for cognition in Cognition.objects.filter(user=self.importer):
+            segment = cognition.analysis.segments.get()
+            self.assertEqual(segment.node, cognition.nodes.order_by('position').first())
+
+
+@override_settings(INGEST_MAX_FILE_BYTES=100)
+class BulkIngestZipTests(TestCase):
+    def setUp(self):
+        self.user = create_users(1, prefix='ingest_')[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        response = self.client.post(reverse('cognition-bulk-ingest'),
+                                    {'archive': SimpleUploadedFile('docs.zip', data)}, format='multipart')
+        if response.streaming:
+            return response, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return response, None
+
+    def test_invalid_archive_is_rejected_before_streaming(self):
+        response, _ = self.upload(b'not a zip archive')
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_files_are_reported_without_being_read(self):
+        import io
+        import zipfile
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('small.txt', 'A short document.')
+            archive.writestr('bomb.txt', 'x' * 10000)
+        response, events = self.upload(buffer.getvalue())
+
+        self.assertEqual(response.status_code, 200)
+        by_index = {event['index']: event for event in events if 'index' in event}
+        self.assertEqual([by_index[0]['status'], by_index[1]['status']], ['created', 'error'])
+        self.assertIn('too large', by_index[1]['error'])
+        self.assertEqual(Cognition.objects.filter(user=self.user).count(), 1)
+
+    def ingest_ndjson(self, *documents):
+        response = self.client.post(reverse('cognition-bulk-ingest'),
+                                    '\n'.join(json.dumps(document) for document in documents) + '\n',
+                                    content_type='application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_invalid_fields_are_reported_per_document(self):
+        events = self.ingest_ndjson({'title': 5, 'content': 'Numbered title.'},
+                                    {'title': 'Quoted', 'content': 'Text.', 'is_public': 'false'},
+                                    {'title': 'Fine', 'content': 'Text.'})
+        by_index = {event['index']: event for event in events if 'index' in event}
+        self.assertEqual([by_index[i]['status'] for i in range(3)], ['error', 'error', 'created'])
+        self.assertIn('title', by_index[0]['error'])
+        self.assertIn('is_public', by_index[1]['error'])
+        self.assertEqual(events[-1]['status'], 'done')
+
+    def test_public_documents_update_profile_stats(self):
+        self.ingest_ndjson({'title': 'Public', 'content': 'Shared text.', 'is_public': True},
+                           {'title': 'Private', 'content': 'Own text.'})
+        stats = UserProfile.objects.get(user=self.user).stats
+        self.assertEqual(stats.public_cognitions_count, 1)
+        self.assertIsNotNone(stats.last_public_activity)
+
+
+class SimilarityIndexTests(TestCase):
+    def test_similar_nodes_are_proposed(self):
+        from .similarity_service import similarity_service
+
+        cognition = create_cognitions(create_users(1, prefix='similar_'), 1, nodes=0)[0]
+        texts = ['Neural networks learn language models.', 'Language models are neural networks.',
+                 'Gardening tomatoes in summer soil.']
+        nodes = Node.objects.bulk_create([
+            Node(cognition=cognition, content=text, position=i, character_count=len(text))
+            for i, text in enumerate(texts)
+        ])
+        proposals = similarity_service.propose(similarity_service.scope_nodes(cognition=cognition), top_k=1)
+        self.assertEqual([(p['source_node'], p['target_node']) for p in proposals], [(nodes[0].id, nodes[1].id)])
+
+    def test_index_is_bounded(self):
+        from .similarity_service import NodeTermIndex
+
+        index = NodeTermIndex(max_nodes=2)
+        index.refresh([(1, 'alpha beta'), (2, 'beta gamma')])
+        index.refresh([(1, 'alpha beta')])  # Touch 1 so 2 is the least recently used
+        rows = index.refresh([(3, 'gamma delta')])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(sorted(index._entries), [1, 3])
+        self.assertEqual(rows[0][1], ('gamma', 'delta'))
+
+
+class ArcFilterTests(TestCase):
+    def test_non_integer_filters_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(create_users(1, prefix='arcs_')[0])
+        for query in ({'node': 'abc'}, {'cognition': '1.5'}):
+            with self.subTest(query=query):
+                self.assertEqual(client.get(reverse('arc-list'), query).status_code, 400)
+        self.assertEqual(client.get(reverse('arc-list'), {'node': '1'}).status_code, 200)
+
+
+# The worker threads cannot write ledger rows to the test transaction's in-memory database
+@override_settings(PROCESSING_JOBS_EAGER=True, LLM_ADMISSION_ENABLED=False, LLM_LEDGER_ASYNC=False)
+class BatchGenerateTests(TestCase):
+    def setUp(self):
+        self.owner = create_users(1, prefix='batch_')[0]
+        self.cognition = create_cognitions([self.owner], 1, nodes=0)[0]
+        Node.objects.bulk_create([
+            Node(cognition=self.cognition, content=text, position=i, character_count=len(text))
+            for i, text in enumerate(['Same text.', 'Same text.', '   ', 'Other text.'])
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post(self, **data):
+        return self.client.post(reverse('widget-batch-generate'), dict(
+            {'cognition_id': self.cognition.pk, 'widget_type': 'author_remark', 'llm_preset': 'explain'}, **data
+        ), format='json')
+
+    def test_invalid_ids_are_rejected(self):
+        self.assertEqual(self.post(cognition_id='abc').status_code, 400)
+        self.assertEqual(self.post(node_ids=['abc']).status_code, 400)
+        self.assertEqual(self.post(node_ids='1').status_code, 400)
+
+    def test_progress_reaches_its_total(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        job = ProcessingJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.progress_current, job.progress_total), (2, 2))
+        self.assertEqual(job.result['widgets_created'], 3, job.result)
+
+    def test_every_call_is_in_the_ledger(self):
+        response = self.post()
+        job = ProcessingJob.objects.get(pk=response.data['id'])
+        calls = LLMCall.objects.filter(operation='llm_widget')
+        self.assertEqual(calls.count(), job.result['llm_calls'])
+        self.assertEqual(set(calls.values_list('user_id', flat=True)), {self.owner.pk})
+
+
+class TOCSyncTests(TestCase):
+    """Node edits through add_or_update_node re-anchor the TOC locally and only queue regeneration past the drift"""
+
+    def setUp(self):
+        from .toc_processor import TOCProcessor
+
+        cache.clear()
+        self.owner, self.stranger = create_users(2, prefix='toc_')
+        self.cognition = create_cognitions([self.owner], 1, nodes=4, public_share=1)[0]
+        self.nodes = list(self.cognition.nodes.order_by('position'))
+        TOCProcessor._shift_existing_nodes(self.cognition)
+        toc = TOCProcessor._anchor_sections(
+            {'sections': [{'title': 'One', 'start_node': 1, 'end_node': 2},
+                          {'title': 'Two', 'start_node': 3, 'end_node': 4}]},
+            [(node.id, node.character_count) for node in self.nodes],
+        )
+        TOCProcessor._update_cognition_toc_data(self.cognition, toc)
+        TOCProcessor._create_toc_node(self.cognition, toc)
+        self.client = APIClient()
+
+    def edit(self, node, content, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.post(reverse('add_or_update_node'), {'node_id': node.pk, 'content': content}, format='json')
+
+    def regeneration_jobs(self):
+        return ProcessingJob.objects.filter(job_type='toc_regeneration').count()
+
+    def test_only_editors_may_edit_nodes(self):
+        self.assertEqual(self.edit(self.nodes[0], 'x' * 10000).status_code, 401)
+        self.assertEqual(self.edit(self.nodes[0], 'x' * 10000, user=self.stranger).status_code, 403)
+        self.assertEqual(self.regeneration_jobs(), 0)
+
+    def test_small_edits_are_synced_without_regeneration(self):
+        response = self.edit(self.nodes[1], self.nodes[1].text + ' More.', user=self.owner)
+        self.assertEqual(response.status_code, 200)
+        toc = Cognition.objects.get(pk=self.cognition.pk).table_of_contents
+        self.assertEqual(toc['sections'][0]['characters'], self.nodes[0].character_count + len(self.nodes[1].text) + 6)
+        self.assertGreater(toc['drift'], 0)
+        self.assertEqual(self.regeneration_jobs(), 0)
+
+    def test_drift_queues_one_regeneration_charged_to_the_owner(self):
+        self.edit(self.nodes[0], 'x' * 10000, user=self.owner)
+        self.edit(self.nodes[1], 'y' * 10000)
+        self.assertEqual(self.regeneration_jobs(), 1)
+        self.assertIsNotNone(cache.get(f'llm-admission:user:{self.owner.pk}'))
+
+    @override_settings(LLM_ADMISSION_MAX_WAIT=0)
+    def test_no_regeneration_without_admission(self):
+        import time
+
+        # The owner's bucket is already in debt, so the charge would have to queue
+        cache.set(f'llm-admission:user:{self.owner.pk}', {'tokens': -1000, 'at': time.time()})
+        self.edit(self.nodes[0], 'x' * 10000, user=self.owner)
+        self.edit(self.nodes[1], 'y' * 10000)
+        self.assertEqual(self.regeneration_jobs(), 0)
+
+
+@override_settings(LLM_LEDGER_ENABLED=False, SINGLE_FLIGHT_SYNC_WAIT=0.1, SINGLE_FLIGHT_TIMEOUT=60)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        from .single_flight import single_flight
+
+        self.flight = single_flight
+        self.key = single_flight.make_key('op', 1, 'hash')
+        self.calls = 0
+
+    def work(self):
+        self.calls += 1
+        return {'value': self.calls}
+
+    def run_op(self):
+        return self.flight.run('op', 1, 'hash', self.work, shared_errors=(ValueError,))
+
+    def test_a_finished_result_is_shared(self):
+        self.assertEqual(self.run_op(), {'value': 1})
+        self.assertEqual(self.run_op(), {'value': 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_a_sync_duplicate_stops_waiting_on_a_running_call(self):
+        from .models import InFlightCall
+        from .single_flight import SingleFlightPending
+
+        InFlightCall.objects.create(key=self.key, operation='op')
+        with self.assertRaises(SingleFlightPending):
+            self.run_op()
+        self.assertEqual(self.calls, 0)
+
+    def test_a_running_call_past_the_timeout_is_taken_over(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import InFlightCall
+
+        InFlightCall.objects.create(key=self.key, operation='op', updated_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(self.run_op(), {'value': 1})
+        self.assertEqual(InFlightCall.objects.get(key=self.key).status, 'completed')
+
+    def test_a_failure_is_retried_by_the_next_request(self):
+        def fail():
+            raise ValueError('Bad input')
+
+        with self.assertRaises(ValueError):
+            self.flight.run('op', 1, 'hash', fail, shared_errors=(ValueError,))
+        self.assertEqual(self.run_op(), {'value': 1})
+
+
+class WidgetInteractionTests(TestCase):
+    def setUp(self):
+        self.owner, self.reader = create_users(2, prefix='interact_')
+        node = create_cognitions([self.owner], 1, nodes=1, public_share=1)[0].nodes.get()
+        self.quiz = Widget.objects.create(node=node, user=self.owner, widget_type='author_quiz', is_required=True,
+                                          quiz_question='Which?', quiz_choices=['A', 'B'], quiz_correct_answer='A')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_invalid_input_is_rejected(self):
+        url = reverse('widget-interact', args=[self.quiz.pk])
+        for data in ({'completed': 'maybe'}, {'quiz_answer': 'AB'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post(url, data, format='json').status_code, 400)
+        batch = reverse('widget-interact-batch')
+        for events in ([{'widget_id': self.quiz.pk, 'completed': 'maybe'}], [{'widget_id': 'x'}], [3]):
+            with self.subTest(events=events):
+                self.assertEqual(self.client.post(batch, {'interactions': events}, format='json').status_code, 400)
+        self.assertFalse(WidgetInteraction.objects.exists())
+
+    @override_settings(WIDGET_INTERACTION_BUFFER_SIZE=10, WIDGET_INTERACTION_FLUSH_INTERVAL=60)
+    def test_a_failed_flush_is_requeued(self):
+        from unittest import mock
+        from .widget_interactions import InteractionWriter
+
+        writer = InteractionWriter()
+        writer.enqueue(self.reader, self.quiz.pk, {'completed': True, 'quiz_answer': 'A'})
+        with mock.patch.object(writer, 'write', side_effect=RuntimeError('database is down')):
+            with self.assertLogs('api.widget_interactions', 'ERROR'):
+                writer._flush_from_timer()
+        self.assertEqual(WidgetInteraction.objects.count(), 0)
+
+        writer.enqueue(self.reader, self.quiz.pk, {'completed': False, 'quiz_answer': 'B'})
+        self.assertEqual(writer.flush(), 1)
+        interaction = WidgetInteraction.objects.get()
+        self.assertEqual((interaction.completed, interaction.quiz_answer), (False, 'B'))
+        self.assertEqual(self.quiz.stats.attempts, 2)
+
+
+class WidgetAnalyticsTests(TestCase):
+    """The incrementally maintained rollups must agree with a rebuild from the interactions"""
+
+    def setUp(self):
+        self.owner, *self.readers = create_users(4, prefix='analytics_')
+        self.cognition = create_cognitions([self.owner], 1, nodes=2, public_share=1)[0]
+        nodes = list(self.cognition.nodes.order_by('position'))
+        self.quizzes = [
+            Widget.objects.create(node=node, user=self.owner, widget_type='author_quiz', quiz_question='Which?',
+                                  quiz_choices=['A', 'B', 'C'], quiz_correct_answer='A')
+            for node in nodes
+        ]
+        self.llm = Widget.objects.create(node=nodes[0], user=self.owner, widget_type='author_llm', content='Ask.')
+
+    def interact(self, reader, widget, **data):
+        from .widget_interactions import interaction_writer
+
+        existing = interaction_writer.authorize(reader, widget.pk)
+        interaction_writer.record(reader, widget.pk, data, existing)
+
+    def snapshot(self):
+        from .widget_analytics import widget_analytics
+
+        report = widget_analytics.report(self.cognition)
+        return report['completion_histogram'], [
+            (row['widget_id'], row['readers'], row['completions'], row['answer_counts'], row['attempts'])
+            for row in report['widgets']
+        ]
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        from .widget_analytics import widget_analytics
+
+        first, second, third = self.readers
+        quiz, other_quiz = self.quizzes
+        self.interact(first, quiz, quiz_answer='B')
+        self.interact(first, quiz, quiz_answer='A', completed=True)
+        self.interact(second, quiz, quiz_answer='A', completed=True)
+        self.interact(second, other_quiz, quiz_answer='C', completed=True)
+        self.interact(second, other_quiz, quiz_answer='C', completed=False)
+        self.interact(third, self.llm, completed=True)
+        self.interact(third, quiz, quiz_answer='C')
+        self.interact(first, self.llm)
+
+        incremental = self.snapshot()
+        widget_analytics.rebuild(self.cognition)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_keeps_attempt_history(self):
+        from .widget_analytics import widget_analytics
+
+        quiz = self.quizzes[0]
+        for answer in 'BCA':
+            self.interact(self.readers[0], quiz, quiz_answer=answer)
+        widget_analytics.rebuild(self.cognition)
+        self.assertEqual((quiz.stats.readers, quiz.stats.attempts), (1, 3))
+
+        quiz.stats.delete()
+        widget_analytics.rebuild(self.cognition)
+        self.assertEqual(WidgetStats.objects.get(widget=quiz).attempts, 1)
+
+
+class FollowTests(TestCase):
+    """Follow and unfollow write the join table even when this worker's cached graph is stale"""
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.other = create_users(2, prefix='follow_')
+        self.profile, self.other_profile = self.user.profile, self.other.profile
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stale(self, following):
+        from array import array
+        from .follow_graph import FollowGraph
+
+        cache.set(FollowGraph._key('following', self.profile.pk), array('q', following).tobytes())
+
+    def test_follow_with_a_stale_cache(self):
+        self.stale([self.other_profile.pk])
+        self.client.post(reverse('profile-follow', args=[self.other_profile.pk]))
+        self.assertTrue(self.profile.is_following(self.other_profile))
+
+    def test_unfollow_with_a_stale_cache(self):
+        self.profile.follow(self.other_profile)
+        self.stale([])
+        self.client.post(reverse('profile-unfollow', args=[self.other_profile.pk]))
+        self.assertFalse(self.profile.is_following(self.other_profile))
+        self.assertEqual(UserProfile.objects.get(pk=self.other_profile.pk).stats.follower_count, 0)
+
+
+@override_settings(
+    LLM_ADMISSION_ENABLED=True,
+    LLM_USER_TOKENS_PER_MINUTE=6000, LLM_USER_TOKEN_BURST=1000,
+    LLM_GLOBAL_TOKENS_PER_MINUTE=600000, LLM_GLOBAL_TOKEN_BURST=100000,
+    LLM_ADMISSION_MAX_WAIT=5,
+)
+class AdmissionDebtTests(TestCase):
+    """A bucket in debt queues the next reservation, refuses it past the max wait, and only for its user"""
+
+    def setUp(self):
+        import time
+
+        cache.clear()
+        self.user, self.other = create_users(2, prefix='admit_')
+        self.now = time.time()
+
+    def in_debt(self, user, tokens):
+        cache.set(f'llm-admission:user:{user.id}', {'tokens': -tokens, 'at': self.now})
+
+    def test_debt_is_the_queue(self):
+        from .admission import admission
+
+        self.assertEqual(admission.reserve(self.user, 500), 0)
+        # 100 tokens per second: 500 left in the bucket, so the next 800 wait for 300 of them
+        self.assertAlmostEqual(admission.reserve(self.user, 800), 3, delta=0.1)
+
+    def test_refused_past_the_max_wait(self):
+        from .admission import admission, AdmissionDenied
+
+        self.in_debt(self.user, 1000)
+        with self.assertRaises(AdmissionDenied) as denied:
+            admission.reserve(self.user, 100)
+        self.assertEqual(denied.exception.scope, 'user')
+        self.assertEqual(denied.exception.retry_after, 6)
+        # A refusal reserves nothing
+        self.assertEqual(cache.get(f'llm-admission:user:{self.user.id}')['tokens'], -1000)
+
+    def test_debt_is_per_user(self):
+        from .admission import admission
+
+        self.in_debt(self.user, 1000)
+        self.assertEqual(admission.reserve(self.other, 500), 0)
+
+    def test_endpoints_answer_429(self):
+        cognition = create_cognitions([self.user], nodes=3)[0]
+        self.in_debt(self.user, 1000)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        requests = {
+            'quick_segment': lambda: client.post(reverse('cognition-quick-segment', args=[cognition.pk])),
+            'analyze': lambda: client.post(reverse('cognition-analyze', args=[cognition.pk]), {'force': True}),
+            'batch_generate': lambda: client.post(reverse('widget-batch-generate'), {
+                'cognition_id': cognition.pk, 'widget_type': 'author_remark', 'llm_preset': 'summary',
+            }, format='json'),
+        }
+        for name, request in requests.items():
+            with self.subTest(name):
+                response = request()
+                self.assertEqual(response.status_code, 429)
+                self.assertIn('Retry-After', response)
+        # Refused before any job was queued
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    @override_settings(PROCESSING_JOBS_EAGER=True)
+    def test_ingest_enrichment_is_admitted(self):
+        self.in_debt(self.user, 1000)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            reverse('cognition-bulk-ingest') + '?enrich=toc',
+            json.dumps({'title': 'One', 'content': paragraph(random.Random(0))}) + '\n',
+            content_type='application/x-ndjson',
+        )
+        summary = json.loads(b''.join(response.streaming_content).splitlines()[-1])
+        result = ProcessingJob.objects.get(pk=summary['job_id']).result
+        outcome, = result['cognitions'].values()
+        self.assertGreater(outcome['toc']['retry_after'], 0)
+
+
+@override_settings(NODE_OFFSET_STORAGE=True)
+class OffsetNodeTests(TestCase):
+    """Untouched segmented nodes are slices of raw_content until they are edited"""
+
+    def setUp(self):
+        self.user, = create_users(1, prefix='offset_')
+        self.paragraphs = [paragraph(random.Random(i)) for i in range(3)]
+        self.cognition = Cognition.objects.create(
+            user=self.user, title='Offsets', raw_content='\n\n'.join(self.paragraphs)
+        )
+        self.cognition.replace_nodes(self.paragraphs)
+
+    def test_nodes_are_offsets(self):
+        nodes = list(self.cognition.nodes.order_by('position'))
+        self.assertTrue(all(node.is_offset_backed and node.content == '' for node in nodes))
+        self.assertEqual([node.text for node in nodes], self.paragraphs)
+        resolved = list(self.cognition.nodes.with_text().order_by('position'))
+        self.assertEqual([node.text for node in resolved], self.paragraphs)
+
+    def test_edit_owns_its_text(self):
+        node = self.cognition.nodes.get(position=1)
+        node.text = 'Edited.'
+        node.save()
+        node.refresh_from_db()
+        self.assertFalse(node.is_offset_backed)
+        self.assertEqual(node.text, 'Edited.')
+
+    def test_raw_content_change_materializes(self):
+        self.cognition.raw_content = 'Replaced.'
+        self.cognition.save()
+        nodes = self.cognition.nodes.order_by('position')
+        self.assertFalse(any(node.is_offset_backed for node in nodes))
+        self.assertEqual([node.content for node in nodes], self.paragraphs)
+
+
+class LedgerReportTests(TestCase):
+    """The ledger report's SQL aggregates match the rows they summarize"""
+
+    def test_report(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .llm_ledger import llm_ledger
+
+        user, = create_users(1, prefix='ledger_')
+        LLMCall.objects.bulk_create([
+            LLMCall(user=user, operation='toc', model='gpt-4o', prompt_tokens=1000, completion_tokens=100,
+                    latency_ms=300, finish_reason='length', cost_usd='0.0035'),
+            LLMCall(user=user, operation='toc', model='gpt-4o', latency_ms=5, cache_hit=True),
+            LLMCall(user=user, operation='quiz', model='gpt-4o-mini', prompt_tokens=200, completion_tokens=50,
+                    latency_ms=100, finish_reason='stop', cost_usd='0.00006', error='timeout'),
+            LLMCall(user=user, operation='quiz', model='gpt-4o-mini', prompt_tokens=200, completion_tokens=50,
+                    latency_ms=200, finish_reason='stop', cost_usd='0.00006'),
+        ])
+        report = llm_ledger.report(timezone.now() - timedelta(hours=1))
+
+        self.assertEqual([row['operation'] for row in report['rows']], ['toc', 'quiz'])
+        toc, quiz = report['rows']
+        self.assertEqual((toc['calls'], toc['cache_hits'], toc['truncated']), (2, 1, 1))
+        self.assertEqual((toc['p50_latency_ms'], toc['cost_usd']), (300, 0.0035))
+        self.assertEqual((quiz['errors'], quiz['prompt_tokens'], quiz['p50_latency_ms'], quiz['p95_latency_ms']),
+                         (1, 400, 100, 200))
+        self.assertEqual(report['total'], {
+            'calls': 4, 'cache_hits': 1, 'errors': 1, 'truncated': 1, 'prompt_tokens': 1400,
+            'completion_tokens': 200, 'cost_usd': 0.00362, 'p50_latency_ms': 200, 'p95_latency_ms': 300,
+        })
+
+
+class ProfileHeaderCORSTests(TestCase):
+    """The frontend may send the profiling header cross-origin"""
+
+    def test_preflight_allows_profile_header(self):
+        response = self.client.options(
+            reverse('cognition-list'),
+            HTTP_ORIGIN='http://localhost:3000',
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD='GET',
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS='authorization, x-profile',
+        )
+        self.assertIn('x-profile', response['Access-Control-Allow-Headers'])
+
+
+class LLMCallAttributionMiddlewareTests(TestCase):
+    """The attribution middleware runs on the event loop under ASGI, binding the request around the view"""
+
+    def test_async_path(self):
+        from asgiref.sync import async_to_sync, iscoroutinefunction
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .llm_ledger import llm_ledger
+        from .middleware import LLMCallAttributionMiddleware
+
+        user, = create_users(1, prefix='attr_')
+        seen = []
+
+        async def view(request):
+            seen.append(llm_ledger.current_user_id())
+            return HttpResponse()
+
+        middleware = LLMCallAttributionMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = user
+        async_to_sync(middleware)(request)
+        self.assertEqual(seen, [user.pk])
+        self.assertIsNone(llm_ledger.current_user_id())
+
+
+class ASGIMiddlewareTests(TestCase):
+    """Every middleware in settings runs natively under ASGI, so async views never hold a thread"""
+
+    def test_handler_is_not_adapted(self):
+        from django.core.handlers.asgi import ASGIHandler
+
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+
+class CreateLLMWidgetInputTests(TestCase):
+    """A malformed node_id is a 400, not a server error, on both create_llm_widget routes"""
+
+    def test_non_integer_node_id(self):
+        user, = create_users(1, prefix='llmwidget_')
+        client = APIClient()
+        # async_api_view authenticates the token itself
+        client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+        for route in ('widget-create-llm-widget', 'async_create_llm_widget'):
+            with self.subTest(route):
+                response = client.post(reverse(route), {'node_id': 'abc', 'widget_type': 'author_remark'},
+                                       format='json')
+                self.assertEqual(response.status_code, 400)
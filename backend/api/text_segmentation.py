@@ -0,0 +1,103 @@
+# api/text_segmentation.py
+"""
+Local (non-AI) segmentation of raw text into paragraph-sized nodes
+"""
+import re
+from typing import List, Optional, Tuple
+
+
+def split_into_paragraphs(text: str) -> List[str]:
+    """
+    Split raw text into paragraphs for node creation.
+
+    Used as the fallback when AI segmentation is unavailable and for bulk
+    ingestion, where documents are segmented locally without an LLM call.
+    """
+    # Clean up text first - normalize line breaks
+    text = re.sub(r'\r\n', '\n', text)  # Windows line endings
+    text = re.sub(r'\r', '\n', text)    # Mac line endings
+
+    # Split by double newlines first (proper paragraphs)
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+
+    # If we got very few paragraphs, try single newlines but be more conservative
+    if len(paragraphs) <= 2:
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+        # Group lines into paragraphs more intelligently
+        paragraphs = []
+        current_para = []
+
+        for line in lines:
+            # If line looks like a header (short, no ending punctuation)
+            if len(line) < 80 and not re.search(r'[.!?]\s*$', line) and len(current_para) > 0:
+                # Save current paragraph and start new one with header
+                if current_para:
+                    paragraphs.append(' '.join(current_para))
+                    current_para = []
+                paragraphs.append(line)  # Header as its own paragraph
+            else:
+                current_para.append(line)
+
+                # End paragraph if line ends with sentence-ending punctuation
+                # and meets minimum length requirement
+                if (re.search(r'[.!?]\s*$', line) and 
+                    len(' '.join(current_para)) > 100):  # Minimum paragraph length
+                    paragraphs.append(' '.join(current_para))
+                    current_para = []
+
+        # Add any remaining content
+        if current_para:
+            paragraphs.append(' '.join(current_para))
+
+    # Final cleanup and merging of very short paragraphs
+    final_paragraphs = []
+    i = 0
+    while i < len(paragraphs):
+        current = paragraphs[i].strip()
+
+        # If current paragraph is very short and doesn't end with punctuation,
+        # try to merge with next
+        if (i + 1 < len(paragraphs) and 
+            len(current) < 80 and 
+            not re.search(r'[.!?;:]\s*$', current)):
+            next_para = paragraphs[i + 1].strip()
+            merged = f"{current}\n\n{next_para}"
+            final_paragraphs.append(merged)
+            i += 2  # Skip next paragraph since we merged it
+        else:
+            final_paragraphs.append(current)
+            i += 1
+
+    paragraphs = final_paragraphs
+
+    # Remove empty paragraphs and very short ones (unless they look like headers)
+    filtered_paragraphs = []
+    for para in paragraphs:
+        # Keep if it's substantial content OR looks like a meaningful header
+        if (len(para.strip()) > 20 or 
+            (len(para.strip()) > 5 and len(para.split()) <= 5)):
+            filtered_paragraphs.append(para.strip())
+
+    return filtered_paragraphs
+
+
+def locate_spans(text: str, pieces: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """
+    Find each piece in text, in order, as a (start, end) span.
+
+    Pieces are searched for left to right from the end of the previous match,
+    so a full pass costs one scan of the text. Pieces that are not a verbatim
+    slice of the text (rejoined lines, merged paragraphs) map to None.
+    """
+    spans = []
+    cursor = 0
+    for piece in pieces:
+        start = text.find(piece, cursor) if piece else -1
+        if start < 0:
+            spans.append(None)
+            continue
+        end = start + len(piece)
+        spans.append((start, end))
+        cursor = end
+    return spans
@@ -1,64 +1,131 @@
 # api/toc_processor.py
-from django.db import transaction
-from .models import Cognition, Node
-from .openai_service import toc_service
-from typing import Dict, Any, Optional
+from django.conf import settings
+from django.db import models, transaction
+from .models import Cognition, Node, ProcessingJob
+from .openai_service import toc_service, TOC_MODES
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 import json
 
+TOC_REGENERATION_JOB_TYPE = 'toc_regeneration'
+DEFAULT_REGENERATION_DRIFT = 0.5
+
 
 class TOCProcessor:
-    """Handles Table of Contents processing and node management"""
+    """
+    Handles Table of Contents processing and node management.
+
+    Generated sections are anchored to node ids (``node_ids``, plus
+    ``start_node_id``/``end_node_id`` for clients) so that sync_toc can
+    recompute the ``start_node``/``end_node`` ordinals and the TOC markdown
+    after splits, merges, deletes and reorders without calling the LLM.
+    """
     
     @staticmethod
-    def generate_toc_for_cognition(cognition: Cognition) -> Dict[str, Any]:
+    def generate_toc_for_cognition(cognition: Cognition, mode: str = 'auto') -> Dict[str, Any]:
         """
         Generate a Table of Contents for a cognition.
         
         Args:
             cognition: The Cognition instance to generate TOC for
+            mode: "flat", "hierarchical" or "auto" (see OpenAITOCService)
             
         Returns:
             Dictionary with toc_node_id, sections_created, and processing_time_ms
         """
         
+        existing, node_data = TOCProcessor._prepare_generation(cognition)
+        if existing:
+            return existing
+        
+        # Generate TOC using OpenAI service, outside any transaction
+        import time
+        start_time = time.time()
+        
+        try:
+            toc_data = toc_service.generate_table_of_contents(node_data, mode=mode)
+        except Exception as e:
+            raise ValueError(f"Failed to generate TOC: {str(e)}")
+        
+        processing_time_ms = int((time.time() - start_time) * 1000)
+        
+        return TOCProcessor._apply_generated_toc(cognition, toc_data, processing_time_ms, node_data)
+    
+    @staticmethod
+    async def generate_toc_for_cognition_async(cognition: Cognition, mode: str = 'auto') -> Dict[str, Any]:
+        """Async variant of generate_toc_for_cognition; database work runs in a worker thread"""
+        from asgiref.sync import sync_to_async
+        
+        existing, node_data = await sync_to_async(TOCProcessor._prepare_generation)(cognition)
+        if existing:
+            return existing
+        
+        import time
+        start_time = time.time()
+        
+        try:
+            toc_data = await toc_service.generate_table_of_contents_async(node_data, mode=mode)
+        except Exception as e:
+            raise ValueError(f"Failed to generate TOC: {str(e)}")
+        
+        processing_time_ms = int((time.time() - start_time) * 1000)
+        
+        return await sync_to_async(TOCProcessor._apply_generated_toc)(cognition, toc_data, processing_time_ms, node_data)
+    
+    @staticmethod
+    def _existing_toc_result(cognition: Cognition) -> Optional[Dict[str, Any]]:
+        existing_toc = cognition.nodes.filter(node_type='toc').first()
+        if existing_toc:
+            toc_data = cognition.table_of_contents
+            return {
+                'toc_node_id': existing_toc.id,
+                'sections_created': len(toc_data.get('sections', [])) if isinstance(toc_data, dict) else 0,
+                'processing_time_ms': 0,
+                'message': 'TOC already exists'
+            }
+        return None
+    
+    @staticmethod
+    def _prepare_generation(cognition: Cognition):
+        """Return (existing_result, None) if a TOC exists, else (None, node_data) for the LLM"""
+        
+        existing = TOCProcessor._existing_toc_result(cognition)
+        if existing:
+            return existing, None
+        
         # Validate minimum node count (excluding any existing TOC nodes)
         content_nodes = cognition.nodes.filter(node_type='content').order_by('position')
         
-        if content_nodes.count() < 2:
+        node_data = []
+        for node in content_nodes:
+            node_data.append({
+                'id': node.id,
+                'position': node.position,
+                'content': node.text,
+                'character_count': node.character_count
+            })
+        
+        if len(node_data) < 2:
             raise ValueError("Minimum 2 content nodes required for TOC generation")
         
-        # Use a single transaction for the entire operation
+        return None, node_data
+    
+    @staticmethod
+    def _apply_generated_toc(cognition: Cognition, toc_data: Dict[str, Any], processing_time_ms: int,
+                             node_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Insert the TOC node and store the TOC data in one transaction"""
+        
+        toc_data = TOCProcessor._anchor_sections(
+            toc_data, [(node['id'], node['character_count']) for node in node_data]
+        )
+        
         with transaction.atomic():
-            # Check if TOC already exists
-            existing_toc = cognition.nodes.filter(node_type='toc').first()
-            if existing_toc:
-                return {
-                    'toc_node_id': existing_toc.id,
-                    'sections_created': len(cognition.table_of_contents.get('sections', [])),
-                    'processing_time_ms': 0,
-                    'message': 'TOC already exists'
-                }
-            
-            # Prepare node data for analysis (refresh content_nodes inside transaction)
-            content_nodes = cognition.nodes.filter(node_type='content').order_by('position')
-            node_data = []
-            for node in content_nodes:
-                node_data.append({
-                    'id': node.id,
-                    'position': node.position,
-                    'content': node.content
-                })
-            
-            # Generate TOC using OpenAI service
-            import time
-            start_time = time.time()
-            
-            try:
-                toc_data = toc_service.generate_table_of_contents(node_data)
-            except Exception as e:
-                raise ValueError(f"Failed to generate TOC: {str(e)}")
+            # Lock the cognition row so concurrent generations don't both insert a TOC
+            Cognition.objects.select_for_update().filter(id=cognition.id).first()
             
-            processing_time_ms = int((time.time() - start_time) * 1000)
+            # Another request may have finished while we were waiting on the LLM
+            existing = TOCProcessor._existing_toc_result(cognition)
+            if existing:
+                return existing
             
             # Shift existing nodes to make room at position 0
             TOCProcessor._shift_existing_nodes(cognition)
@@ -68,6 +135,7 @@ class TOCProcessor:
             
             # Update cognition's TOC data
             TOCProcessor._update_cognition_toc_data(cognition, toc_data)
+            cognition.bump_revision()
         
         return {
             'toc_node_id': toc_node.id,
@@ -76,7 +144,7 @@ class TOCProcessor:
         }
     
     @staticmethod
-    def regenerate_toc_for_cognition(cognition: Cognition) -> Dict[str, Any]:
+    def regenerate_toc_for_cognition(cognition: Cognition, mode: str = 'auto') -> Dict[str, Any]:
         """
         Regenerate TOC for a cognition, replacing any existing one.
         
@@ -87,16 +155,264 @@ class TOCProcessor:
             Dictionary with toc_node_id, sections_created, and processing_time_ms
         """
         
+        TOCProcessor._check_mode(mode)
+        
         # Remove existing TOC
+        TOCProcessor._remove_toc(cognition)
+        
+        # Generate new TOC
+        return TOCProcessor.generate_toc_for_cognition(cognition, mode)
+    
+    @staticmethod
+    def refresh_toc_sections(job: ProcessingJob, cognition_id: int, not_before: float = 0) -> Dict[str, Any]:
+        """
+        Ask the LLM for new sections and write them into the existing TOC node
+        in place (ProcessingJob function queued by sync_toc once drift passes
+        settings.TOC_REGENERATION_DRIFT). Node positions are left untouched.
+        
+        ``not_before`` is when the admission reservation made at queue time
+        comes due; the LLM call waits for it.
+        """
+        import time
+        
+        delay = not_before - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        
+        cognition = Cognition.objects.get(id=cognition_id)
+        if not TOCProcessor.has_toc(cognition):
+            return {'skipped': 'TOC was removed'}
+        
+        node_data = [
+            {'id': node.id, 'position': node.position, 'content': node.text,
+             'character_count': node.character_count}
+            for node in cognition.nodes.filter(node_type='content').order_by('position').with_text()
+        ]
+        if len(node_data) < 2:
+            return {'skipped': 'Minimum 2 content nodes required for TOC generation'}
+        
+        toc_data = TOCProcessor._anchor_sections(
+            toc_service.generate_table_of_contents(node_data),
+            [(node['id'], node['character_count']) for node in node_data]
+        )
+        
+        with transaction.atomic():
+            Cognition.objects.select_for_update().filter(id=cognition.id).first()
+            toc_node = TOCProcessor.get_toc_node(cognition)
+            if toc_node is None:
+                return {'skipped': 'TOC was removed'}
+            # Nodes may have changed while the LLM was working; re-anchor against the current list
+            TOCProcessor._update_cognition_toc_data(cognition, toc_data)
+            TOCProcessor.sync_toc(cognition)
+        
+        return {'toc_node_id': toc_node.id, 'sections_created': len(toc_data['sections'])}
+    
+    @staticmethod
+    def sync_toc(cognition: Cognition, nodes: Optional[Sequence[Node]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Bring the TOC in line with the cognition's current node list, locally.
+        
+        Call after any change to the node list. ``nodes`` is the full ordered
+        node list when the caller already has it in memory (the TOC node in it
+        is updated too); otherwise it is loaded. Section ranges and the TOC
+        markdown are recomputed from the stored node ids, and when content
+        drift since the last LLM generation reaches
+        settings.TOC_REGENERATION_DRIFT a background regeneration is queued.
+        
+        Returns None when the cognition has no generated TOC, else a dict with
+        toc_node_id, changed, drift and regeneration_queued.
+        """
+        if nodes is None:
+            nodes = list(
+                Node.objects.filter(cognition_id=cognition.id)
+                .order_by('position')
+                .only('id', 'node_type', 'character_count')
+            )
+        toc_node = next((node for node in nodes if node.node_type == 'toc'), None)
+        if toc_node is None:
+            return None
+        
+        toc_data = Cognition.objects.filter(id=cognition.id).values_list('table_of_contents', flat=True).first()
+        if not isinstance(toc_data, dict) or 'sections' not in toc_data:
+            return None
+        
+        content = [(node.id, node.character_count) for node in nodes if node.node_type == 'content']
+        anchored = toc_data
+        if any('node_ids' not in section for section in toc_data['sections']):
+            # TOC generated before sections were anchored: take its ranges as they stand today
+            anchored = TOCProcessor._anchor_sections(toc_data, content)
+        
+        sections = TOCProcessor._rebuild_sections(anchored['sections'], content)
+        drift = TOCProcessor._content_drift(anchored.get('baseline_characters', 0), sections)
+        updated = dict(anchored, sections=sections, drift=round(drift, 4))
+        
+        changed = updated != toc_data
+        if changed:
+            TOCProcessor._update_cognition_toc_data(cognition, updated)
+            markdown = TOCProcessor._generate_toc_markdown(updated)
+            Node.objects.filter(id=toc_node.id).update(content=markdown, character_count=len(markdown))
+            toc_node.content = markdown
+            toc_node.character_count = len(markdown)
+        
+        threshold = getattr(settings, 'TOC_REGENERATION_DRIFT', DEFAULT_REGENERATION_DRIFT)
+        queued = threshold is not None and drift >= threshold and TOCProcessor._queue_regeneration(cognition)
+        
+        return {
+            'toc_node_id': toc_node.id,
+            'changed': changed,
+            'drift': updated['drift'],
+            'regeneration_queued': queued,
+        }
+    
+    @staticmethod
+    def _anchor_sections(toc_data: Dict[str, Any], content: List[Tuple[int, int]]) -> Dict[str, Any]:
+        """
+        Attach node ids and a size baseline to sections whose start_node/end_node
+        are 1-based ordinals into ``content``, a list of (node id, character count)
+        in reading order.
+        """
+        sections = []
+        for section in toc_data.get('sections', []):
+            start = max(1, int(section.get('start_node', 1)))
+            end = min(len(content), int(section.get('end_node', start)))
+            members = content[start - 1:end]
+            if members:
+                sections.append(dict(section, node_ids=[node_id for node_id, _ in members]))
+        
+        sections = [
+            dict(section, baseline_characters=section['characters'])
+            for section in TOCProcessor._rebuild_sections(sections, content)
+        ]
+        return dict(
+            toc_data,
+            sections=sections,
+            baseline_characters=sum(section['characters'] for section in sections),
+            drift=0.0,
+        )
+    
+    @staticmethod
+    def _rebuild_sections(sections: List[Dict[str, Any]], content: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+        """
+        Recompute section ranges over the current content nodes.
+        
+        Every node keeps the section it was in; new nodes join the section of
+        the node before them. A section that ends up in several pieces (a
+        node moved away from it) keeps its longest run, and the stray nodes
+        join whichever section they now sit in. Sections with no nodes left
+        are dropped; the first section always starts at the first node.
+        """
+        owner = {}
+        for index, section in enumerate(sections):
+            for node_id in section.get('node_ids', []):
+                owner.setdefault(node_id, index)
+        
+        labels, current = [], None
+        for node_id, _ in content:
+            current = owner.get(node_id, current)
+            labels.append(current)
+        
+        # Longest contiguous run per section, earliest on ties
+        best = {}
+        start = 0
+        for i in range(1, len(labels) + 1):
+            if i == len(labels) or labels[i] != labels[start]:
+                label = labels[start]
+                if label is not None and (label not in best or i - start > best[label][1] - best[label][0]):
+                    best[label] = (start, i)
+                start = i
+        
+        anchors = sorted((run[0], label) for label, run in best.items())
+        rebuilt = []
+        for k, (anchor, label) in enumerate(anchors):
+            first = 0 if k == 0 else anchor
+            last = anchors[k + 1][0] if k + 1 < len(anchors) else len(content)
+            members = content[first:last]
+            rebuilt.append(dict(
+                sections[label],
+                start_node=first + 1,
+                end_node=last,
+                start_node_id=members[0][0],
+                end_node_id=members[-1][0],
+                node_ids=[node_id for node_id, _ in members],
+                characters=sum(count for _, count in members),
+            ))
+        return rebuilt
+    
+    @staticmethod
+    def _content_drift(baseline: int, sections: List[Dict[str, Any]]) -> float:
+        """
+        Share of the generated text that has since been added, removed or
+        moved between sections, measured in characters per section.
+        
+        Splits, merges and moves within a section cancel out; a rewrite that
+        keeps a node's length exactly does not register.
+        """
+        if not baseline:
+            return 0.0
+        
+        changed = sum(abs(section['characters'] - section.get('baseline_characters', 0)) for section in sections)
+        # Sections that lost all their nodes are gone from the list but not from the baseline
+        changed += max(0, baseline - sum(section.get('baseline_characters', 0) for section in sections))
+        return changed / baseline
+    
+    @staticmethod
+    def _queue_regeneration(cognition: Cognition) -> bool:
+        """
+        Queue refresh_toc_sections unless one is already pending; True when queued.
+        
+        The LLM call is charged to the cognition owner's admission budget
+        here. When that budget is exhausted nothing is queued, and a later
+        edit tries again.
+        """
+        import time
+        from .admission import admission, AdmissionDenied, estimate_toc_tokens
+        from .jobs import job_runner
+        
+        if not cognition.user_id:
+            return False
+        pending = ProcessingJob.objects.filter(
+            job_type=TOC_REGENERATION_JOB_TYPE,
+            status__in=['pending', 'running'],
+            params__cognition_id=cognition.id,
+        ).exists()
+        if pending:
+            return False
+        
+        try:
+            not_before = time.time() + admission.reserve(cognition.user, estimate_toc_tokens(cognition))
+        except AdmissionDenied:
+            return False
+        
+        job = job_runner.create(cognition.user, TOC_REGENERATION_JOB_TYPE, params={'cognition_id': cognition.id})
+        # Run after the edit commits so the job sees the new node list
+        transaction.on_commit(
+            lambda: job_runner.submit(job, TOCProcessor.refresh_toc_sections, cognition.id, not_before)
+        )
+        return True
+    
+    @staticmethod
+    async def regenerate_toc_for_cognition_async(cognition: Cognition, mode: str = 'auto') -> Dict[str, Any]:
+        """Async variant of regenerate_toc_for_cognition"""
+        from asgiref.sync import sync_to_async
+        
+        TOCProcessor._check_mode(mode)
+        await sync_to_async(TOCProcessor._remove_toc)(cognition)
+        return await TOCProcessor.generate_toc_for_cognition_async(cognition, mode)
+    
+    @staticmethod
+    def _check_mode(mode: str):
+        if mode not in TOC_MODES:
+            raise ValueError(f"Unknown TOC mode '{mode}'; expected one of {', '.join(TOC_MODES)}")
+    
+    @staticmethod
+    def _remove_toc(cognition: Cognition):
         with transaction.atomic():
             existing_toc = cognition.nodes.filter(node_type='toc').first()
             if existing_toc:
                 existing_toc.delete()
                 # Reorder remaining nodes to fill the gap
                 TOCProcessor._reorder_nodes_after_deletion(cognition, 0)  # TOC was at position 0
-        
-        # Generate new TOC
-        return TOCProcessor.generate_toc_for_cognition(cognition)
+                cognition.bump_revision()
     
     @staticmethod
     def _create_toc_node(cognition: Cognition, toc_data: Dict[str, Any]) -> Node:
@@ -127,8 +443,15 @@ class TOCProcessor:
             return "# Table of Contents\n\n*No sections available.*"
         
         markdown_parts = []
+        current_group = None
         
         for i, section in enumerate(sections, 1):
+            # Hierarchical TOCs tag sections with their top-level group
+            group = section.get('group')
+            if group and group != current_group:
+                markdown_parts.append(f"## {group}")
+            current_group = group
+            
             # Section header with navigation info only
             start_node = section.get('start_node', 1)
             end_node = section.get('end_node', 1)
@@ -141,6 +464,8 @@ class TOCProcessor:
                 header_level = "###"
             else:
                 header_level = "####"
+            if group:
+                header_level += "#"
             
             section_title = section.get('title', f'Section {i}')
             node_range = f"(Nodes {start_node}-{end_node})" if start_node != end_node else f"(Node {start_node})"
@@ -153,37 +478,29 @@ class TOCProcessor:
     @staticmethod
     def _shift_existing_nodes(cognition: Cognition):
         """Shift all existing nodes by +1 position to make room for TOC at position 0"""
-        
-        # Use raw SQL to avoid unique constraint conflicts during the shift
-        from django.db import connection
-        
-        with connection.cursor() as cursor:
-            # Add a large offset to all positions first to avoid conflicts
-            cursor.execute("""
-                UPDATE api_node 
-                SET position = position + 1000 
-                WHERE cognition_id = %s
-            """, [cognition.id])
-            
-            # Then set the final positions (1000 + old_position -> 1 + old_position)
-            cursor.execute("""
-                UPDATE api_node 
-                SET position = position - 999 
-                WHERE cognition_id = %s
-            """, [cognition.id])
+        TOCProcessor._shift_positions(cognition, 0, 1)
     
     @staticmethod
     def _reorder_nodes_after_deletion(cognition: Cognition, deleted_position: int):
         """Reorder nodes after a deletion to fill gaps"""
+        TOCProcessor._shift_positions(cognition, deleted_position + 1, -1)
+    
+    @staticmethod
+    def _shift_positions(cognition: Cognition, from_position: int, delta: int):
+        """
+        Move every node at or after from_position by delta in two UPDATEs.
         
-        # Get all nodes after the deleted position
-        nodes_to_reorder = cognition.nodes.filter(
-            position__gt=deleted_position
-        ).order_by('position')
-        
-        for node in nodes_to_reorder:
-            node.position -= 1
-            node.save(update_fields=['position'])
+        Nodes are first parked above the highest position so no intermediate
+        row trips unique(cognition, position), whatever order the rows are
+        updated in.
+        """
+        nodes = cognition.nodes.filter(position__gte=from_position)
+        highest = cognition.nodes.aggregate(highest=models.Max('position'))['highest']
+        if highest is None:
+            return
+        offset = highest + abs(delta) + 1
+        nodes.update(position=models.F('position') + offset)
+        cognition.nodes.filter(position__gt=highest).update(position=models.F('position') - offset + delta)
     
     @staticmethod
     def _update_cognition_toc_data(cognition: Cognition, toc_data: Dict[str, Any]):
@@ -0,0 +1,359 @@
+# api/transfer_service.py
+"""
+Streaming export and batched import of cognitions for bulk transfer
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
+from .models import (
+    Cognition, Node, Widget, Arc, DocumentAnalysisResult, SemanticSegment
+)
+
+EXPORT_VERSION = 1
+EXPORT_LAYOUTS = ('ndjson', 'columnar')
+
+NODE_FIELDS = ['position', 'character_count', 'is_illuminated', 'node_type']
+WIDGET_FIELDS = [
+    'widget_type', 'title', 'content', 'quiz_question', 'quiz_choices',
+    'quiz_correct_answer', 'quiz_explanation', 'llm_preset', 'llm_custom_prompt',
+    'is_required', 'position'
+]
+ANALYSIS_FIELDS = [
+    'document_type', 'overall_summary', 'main_themes', 'target_audience',
+    'complexity_level', 'estimated_total_read_time', 'overall_coherence_score',
+    'segmentation_confidence', 'table_of_contents', 'reading_flow',
+    'processing_time_ms', 'openai_model_used'
+]
+SEGMENT_FIELDS = [
+    'start_position', 'end_position', 'title', 'summary', 'topic_keywords',
+    'importance_level', 'estimated_reading_time', 'semantic_coherence_score',
+    'sequence_order'
+]
+
+
+class TransferError(Exception):
+    """Raised when an export record cannot be imported"""
+    pass
+
+
+class CognitionTransferService:
+    """Exports cognitions as one JSON record per line and imports them back in batches"""
+
+    def __init__(self, chunk_size: int = 50, batch_size: int = 500):
+        # chunk_size: cognitions fetched (with their prefetches) per database round trip
+        # batch_size: rows per bulk_create statement on import
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+    # Export
+
+    def export_queryset(self, queryset):
+        """Attach the prefetches needed to export a cognition without per-row queries"""
+        return queryset.select_related('user', 'analysis').prefetch_related(
+            Prefetch(
+                'nodes',
+                queryset=Node.objects.order_by('position').prefetch_related(
+                    Prefetch('widgets', queryset=Widget.objects.select_related('user')),
+                    'outgoing_arcs',
+                )
+            ),
+            'analysis__segments',
+        )
+
+    def iter_records(self, queryset, layout: str = 'ndjson') -> Iterator[Dict[str, Any]]:
+        """
+        Yield one export record per cognition.
+
+        Cognitions are streamed in chunks so memory stays bounded by chunk_size,
+        not by the size of the queryset.
+        """
+        if layout not in EXPORT_LAYOUTS:
+            raise TransferError(f"Unknown export layout: {layout}")
+
+        queryset = self.export_queryset(queryset).order_by('id')
+        for cognition in queryset.iterator(chunk_size=self.chunk_size):
+            yield self.serialize_cognition(cognition, layout)
+
+    def iter_ndjson(self, queryset, layout: str = 'ndjson') -> Iterator[str]:
+        """Yield newline-terminated JSON lines, suitable for a streaming response"""
+        for record in self.iter_records(queryset, layout):
+            yield json.dumps(record, separators=(',', ':'), default=str) + '\n'
+
+    def serialize_cognition(self, cognition: Cognition, layout: str = 'ndjson') -> Dict[str, Any]:
+        nodes = list(cognition.nodes.all())
+
+        widgets = []
+        arcs = []
+        for node in nodes:
+            for widget in node.widgets.all():
+                data = {field: getattr(widget, field) for field in WIDGET_FIELDS}
+                data['node_id'] = node.id
+                data['username'] = widget.user.username
+                widgets.append(data)
+            for arc in node.outgoing_arcs.all():
+                arcs.append({
+                    'source_node_id': arc.source_node_id,
+                    'target_node_id': arc.target_node_id,
+                    'arc_type': arc.arc_type,
+                    'description': arc.description,
+                    'strength': arc.strength,
+                })
+
+        analysis = getattr(cognition, 'analysis', None)
+        analysis_data = None
+        if analysis is not None:
+            analysis_data = {field: getattr(analysis, field) for field in ANALYSIS_FIELDS}
+            analysis_data['segments'] = [
+                dict({field: getattr(seg, field) for field in SEGMENT_FIELDS}, node_id=seg.node_id)
+                for seg in analysis.segments.all()
+            ]
+
+        return {
+            'version': EXPORT_VERSION,
+            'layout': layout,
+            'id': cognition.id,
+            'title': cognition.title,
+            'raw_content': cognition.raw_content,
+            'is_starred': cognition.is_starred,
+            'is_public': cognition.is_public,
+            'share_date': cognition.share_date.isoformat() if cognition.share_date else None,
+            'created_at': cognition.created_at.isoformat(),
+            'username': cognition.user.username,
+            'table_of_contents': cognition.table_of_contents,
+            'nodes': self._columnar_nodes(nodes) if layout == 'columnar' else [
+                dict({field: getattr(node, field) for field in NODE_FIELDS}, id=node.id, content=node.text)
+                for node in nodes
+            ],
+            'widgets': widgets,
+            'arcs': arcs,
+            'analysis': analysis_data,
+        }
+
+    def _columnar_nodes(self, nodes: List[Node]) -> Dict[str, Any]:
+        """
+        Store node content as one contiguous text block plus an offsets array.
+
+        Node i's content is content[offsets[i]:offsets[i + 1]]; every other
+        attribute is a parallel array.
+        """
+        offsets = [0]
+        for node in nodes:
+            offsets.append(offsets[-1] + len(node.text))
+
+        columns = {
+            'count': len(nodes),
+            'content': ''.join(node.text for node in nodes),
+            'offsets': offsets,
+            'id': [node.id for node in nodes],
+        }
+        for field in NODE_FIELDS:
+            columns[field] = [getattr(node, field) for node in nodes]
+        return columns
+
+    @staticmethod
+    def _rows_from_columnar(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offsets = columns['offsets']
+        block = columns['content']
+        rows = []
+        for i in range(columns['count']):
+            row = {field: columns[field][i] for field in NODE_FIELDS}
+            row['id'] = columns['id'][i]
+            row['content'] = block[offsets[i]:offsets[i + 1]]
+            rows.append(row)
+        return rows
+
+    # Import
+
+    def import_records(
+        self,
+        records: Iterable[Union[str, bytes, Dict[str, Any]]],
+        user: User,
+        records_per_batch: int = 50,
+        map_usernames: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Import export records for ``user``.
+
+        Records are buffered into batches of ``records_per_batch`` cognitions and
+        each batch is written with bulk_create inside its own transaction. Arcs
+        that point at nodes from a later batch are held back until the end.
+
+        Widgets belong to ``user`` unless ``map_usernames`` is set, in which case
+        they go to the account with the exported author's username (falling back
+        to ``user``). Only use it between databases that share their accounts.
+        """
+        from .profile_stats import profile_stats
+
+        stats = {'cognitions': 0, 'nodes': 0, 'widgets': 0, 'arcs': 0, 'segments': 0}
+        node_id_map: Dict[int, int] = {}
+        pending_arcs: List[Dict[str, Any]] = []
+        user_cache: Optional[Dict[str, User]] = {user.username: user} if map_usernames else None
+
+        batch = []
+        for record in records:
+            if isinstance(record, (str, bytes)):
+                if not record.strip():
+                    continue
+                try:
+                    record = json.loads(record)
+                except json.JSONDecodeError as e:
+                    raise TransferError(f"Invalid JSON record: {str(e)}")
+            batch.append(record)
+            if len(batch) >= records_per_batch:
+                self._import_batch(batch, user, node_id_map, pending_arcs, user_cache, stats)
+                batch = []
+
+        if batch:
+            self._import_batch(batch, user, node_id_map, pending_arcs, user_cache, stats)
+
+        if pending_arcs:
+            with transaction.atomic():
+                stats['arcs'] += self._create_arcs(pending_arcs, node_id_map, defer=None)
+
+        # bulk_create skips the post_save signals that keep the profile counters current
+        if stats['cognitions']:
+            profile_stats.refresh_cognitions(user.id)
+
+        return stats
+
+    def _import_batch(self, batch, user, node_id_map, pending_arcs, user_cache, stats):
+        with transaction.atomic():
+            cognitions = Cognition.objects.bulk_create([
+                Cognition(
+                    title=record.get('title', 'Imported cognition')[:200],
+                    raw_content=record.get('raw_content', ''),
+                    is_starred=record.get('is_starred', False),
+                    is_public=record.get('is_public', False),
+                    share_date=parse_datetime(record['share_date']) if record.get('share_date') else None,
+                    table_of_contents=record.get('table_of_contents') or [],
+                    user=user,
+                )
+                for record in batch
+            ], batch_size=self.batch_size)
+            stats['cognitions'] += len(cognitions)
+
+            # Nodes for every cognition in the batch go out together
+            node_sources = []
+            new_nodes = []
+            for record, cognition in zip(batch, cognitions):
+                rows = record.get('nodes') or []
+                if isinstance(rows, dict):
+                    rows = self._rows_from_columnar(rows)
+                for row in rows:
+                    node_sources.append(row.get('id'))
+                    new_nodes.append(Node(
+                        cognition=cognition,
+                        content=row.get('content', ''),
+                        position=row['position'],
+                        character_count=row.get('character_count', len(row.get('content', ''))),
+                        is_illuminated=row.get('is_illuminated', False),
+                        node_type=row.get('node_type', 'content'),
+                    ))
+            new_nodes = Node.objects.bulk_create(new_nodes, batch_size=self.batch_size)
+            for old_id, node in zip(node_sources, new_nodes):
+                if old_id is not None:
+                    node_id_map[old_id] = node.id
+            stats['nodes'] += len(new_nodes)
+
+            # TOC sections are anchored to node ids from the source database
+            remapped = []
+            for cognition in cognitions:
+                toc = self._remap_toc(cognition.table_of_contents, node_id_map)
+                if toc != cognition.table_of_contents:
+                    cognition.table_of_contents = toc
+                    remapped.append(cognition)
+            Cognition.objects.bulk_update(remapped, ['table_of_contents'], batch_size=self.batch_size)
+
+            new_widgets = []
+            for record in batch:
+                for row in record.get('widgets') or []:
+                    node_id = node_id_map.get(row.get('node_id'))
+                    if node_id is None:
+                        continue
+                    widget = Widget(node_id=node_id, user=self._resolve_user(row.get('username'), user, user_cache))
+                    for field in WIDGET_FIELDS:
+                        if field in row:
+                            setattr(widget, field, row[field])
+                    new_widgets.append(widget)
+            Widget.objects.bulk_create(new_widgets, batch_size=self.batch_size)
+            stats['widgets'] += len(new_widgets)
+
+            analysed = [(record['analysis'], cognition) for record, cognition in zip(batch, cognitions)
+                        if record.get('analysis')]
+            analyses = DocumentAnalysisResult.objects.bulk_create([
+                DocumentAnalysisResult(
+                    cognition=cognition,
+                    **{field: analysis_data[field] for field in ANALYSIS_FIELDS if field in analysis_data}
+                )
+                for analysis_data, cognition in analysed
+            ], batch_size=self.batch_size)
+
+            new_segments = []
+            for (analysis_data, _), analysis in zip(analysed, analyses):
+                for row in analysis_data.get('segments') or []:
+                    segment = SemanticSegment(
+                        analysis=analysis,
+                        node_id=node_id_map.get(row.get('node_id')),
+                    )
+                    for field in SEGMENT_FIELDS:
+                        if field in row:
+                            setattr(segment, field, row[field])
+                    new_segments.append(segment)
+            SemanticSegment.objects.bulk_create(new_segments, batch_size=self.batch_size)
+            stats['segments'] += len(new_segments)
+
+            arcs = [arc for record in batch for arc in (record.get('arcs') or [])]
+            stats['arcs'] += self._create_arcs(arcs, node_id_map, defer=pending_arcs)
+
+    def _create_arcs(self, arcs, node_id_map, defer: Optional[list]) -> int:
+        """Create arcs whose endpoints are known; defer (or drop, at the end) the rest"""
+        new_arcs = []
+        for row in arcs:
+            source = node_id_map.get(row['source_node_id'])
+            target = node_id_map.get(row['target_node_id'])
+            if source is None or target is None:
+                if defer is not None:
+                    defer.append(row)
+                continue
+            new_arcs.append(Arc(
+                source_node_id=source,
+                target_node_id=target,
+                arc_type=row['arc_type'],
+                description=row.get('description', ''),
+                strength=row.get('strength', 5),
+            ))
+        Arc.objects.bulk_create(new_arcs, batch_size=self.batch_size, ignore_conflicts=True)
+        return len(new_arcs)
+
+    @staticmethod
+    def _remap_toc(toc, node_id_map: Dict[int, int]):
+        """A TOC with its sections' node anchors translated to the imported node ids"""
+        if not isinstance(toc, dict) or not isinstance(toc.get('sections'), list):
+            return toc
+
+        sections = []
+        for section in toc['sections']:
+            section = dict(section)
+            if 'node_ids' in section:
+                section['node_ids'] = [node_id_map[i] for i in section['node_ids'] if i in node_id_map]
+            for key in ('start_node_id', 'end_node_id'):
+                if key in section:
+                    section[key] = node_id_map.get(section[key])
+            sections.append(section)
+        return dict(toc, sections=sections)
+
+    @staticmethod
+    def _resolve_user(username, default_user, user_cache):
+        """Map widget authors by username when user_cache is given, else use the importing user"""
+        if not username or user_cache is None:
+            return default_user
+        if username not in user_cache:
+            user_cache[username] = User.objects.filter(username=username).first() or default_user
+        return user_cache[username]
+
+
+# Global instance
+transfer_service = CognitionTransferService()
@@ -3,6 +3,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 from . import auth_views
+from . import async_views
 
 # Create specific URL patterns first, before the router
 urlpatterns = [
@@ -15,6 +16,13 @@ urlpatterns = [
     path('auth/user/', auth_views.get_user_info, name='user_info'),
     path('auth/refresh-token/', auth_views.refresh_token, name='refresh_token'),
     path('text/convert_to_markdown/', views.convert_text_to_markdown, name='convert_text_to_markdown'),
+    path('llm-usage/', views.llm_usage, name='llm_usage'),
+    # Async LLM endpoints (non-blocking when served through backend.asgi)
+    path('async/cognitions/<int:pk>/process_text/', async_views.process_text, name='async_process_text'),
+    path('async/cognitions/<int:pk>/quick_segment/', async_views.quick_segment, name='async_quick_segment'),
+    path('async/cognitions/<int:pk>/generate_toc/', async_views.generate_toc, name='async_generate_toc'),
+    path('async/widgets/create_llm_widget/', async_views.create_llm_widget, name='async_create_llm_widget'),
+    path('async/text/convert_to_markdown/', async_views.convert_text_to_markdown, name='async_convert_text_to_markdown'),
 ]
 
 # Then add router URLs
@@ -28,6 +36,7 @@ router.register(r'profiles', views.UserProfileViewSet, basename='profile')
 router.register(r'widgets', views.WidgetViewSet, basename='widget')
 router.register(r'groups', views.GroupViewSet, basename='group')
 router.register(r'invitations', views.GroupInvitationViewSet, basename='invitation')
+router.register(r'jobs', views.ProcessingJobViewSet, basename='job')
 
 # Append router URLs to the urlpatterns
 urlpatterns += router.urls
@@ -5,30 +5,64 @@ from rest_framework.response import Response
 from django.contrib.auth.models import User
 from .models import (
     Cognition, Node, PresetResponse, Arc, UserProfile, Widget, WidgetInteraction,
-    DocumentAnalysisResult, SemanticSegment, Group, GroupMembership, GroupInvitation
+    DocumentAnalysisResult, SemanticSegment, Group, GroupMembership, GroupInvitation,
+    ProcessingJob
 )
 from .serializers import (
     CognitionSerializer, CognitionDetailSerializer, 
     NodeSerializer, PresetResponseSerializer,
     ArcSerializer, WidgetSerializer, WidgetInteractionSerializer,
+    InteractionInputSerializer, InteractionEventSerializer,
     DocumentAnalysisResultSerializer, SemanticSegmentSerializer,
-    GroupSerializer, GroupDetailSerializer, GroupMembershipSerializer, GroupInvitationSerializer
+    GroupSerializer, GroupDetailSerializer, GroupMembershipSerializer, GroupInvitationSerializer,
+    ProcessingJobSerializer
 )
 # SynthesisSerializer removed - functionality consolidated into widgets
 from .serializers import UserProfileSerializer, CognitionCollectiveSerializer
 from .semantic_service import semantic_service, SemanticAnalysisError
 from .semantic_models import SegmentationPreferences
+from .text_segmentation import split_into_paragraphs
+from .single_flight import single_flight, SingleFlightPending
+from .admission import (
+    admission, AdmissionDenied, estimate_tokens, estimate_toc_tokens, estimate_widget_batch_tokens
+)
 from django.utils import timezone
 from rest_framework import filters
 import re
 import os
+import json
 import openai
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ParseError, Throttled
 from .permissions import IsOwnerOrReadOnlyIfPublic
+from .authorization import authorization_for
 from django.db import models, transaction
+from django.http import StreamingHttpResponse
+from django.conf import settings
+
+def _admit_llm_call(user, tokens):
+    """Queue for LLM capacity; over-budget requests get 429 with Retry-After"""
+    try:
+        admission.acquire(user, tokens)
+    except AdmissionDenied as e:
+        raise Throttled(wait=e.retry_after, detail=str(e))
+
+def _pending_response(pending):
+    """202 for a duplicate of an LLM request still in progress; the retry gets its shared result"""
+    return Response(
+        {'status': 'pending', 'detail': str(pending)},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Retry-After': str(pending.retry_after)}
+    )
+
+def _nodes_changed(cognition):
+    """Record a change to a cognition's node list: bump its revision and re-anchor its TOC"""
+    from .toc_processor import toc_processor
+    cognition.bump_revision()
+    toc_processor.sync_toc(cognition)
 
 @api_view(['GET'])
 def hello_world(request):
@@ -41,9 +75,11 @@ from rest_framework import permissions
 @permission_classes([AllowAny])
 def create_cognition(request):
     # Create the cognition
-    serializer = CognitionSerializer(data=request.data)
+    if not request.user.is_authenticated:
+        return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    serializer = CognitionSerializer(data=request.data, context={'request': request})
     serializer.is_valid(raise_exception=True)
-    cognition = serializer.save()
+    cognition = serializer.save(user=request.user)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
@@ -53,27 +89,46 @@ def add_or_update_node(request):
     node_id = request.data.get("node_id")
     content = request.data.get("content")
 
+    if not request.user.is_authenticated:
+        return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+
     if not node_id:
         return Response({'error': 'node_id is required'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        node = Node.objects.get(id=node_id)
-        node.content = content or ''
-        node.save()
-        return Response(NodeSerializer(node).data)
-    except Node.DoesNotExist:
+        node = Node.objects.select_related('cognition').get(id=node_id)
+    except (Node.DoesNotExist, ValueError):
         return Response({'error': 'Node not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    if not authorization_for(request).can_edit(node.cognition):
+        return Response(
+            {'error': 'You do not have permission to edit this node'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    node.text = content or ''
+    node.character_count = len(node.text)
+    node.save()
+    _nodes_changed(node.cognition)
+    return Response(NodeSerializer(node).data)
+
 class CognitionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnlyIfPublic]
     
     def get_queryset(self):
         user = self.request.user
         if self.action == 'list':
-            return Cognition.objects.filter(user=user).order_by('-created_at')
-        return Cognition.objects.filter(
+            return Cognition.objects.filter(user=user).select_related('user', 'group').with_nodes_count().order_by('-created_at')
+        queryset = Cognition.objects.filter(
             models.Q(user=user) | models.Q(is_public=True)
         ).order_by('-created_at')
+        if self.action in ('retrieve', 'analyze'):
+            queryset = queryset.select_related('user', 'group', 'analysis').prefetch_related('analysis__segments')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                models.Prefetch('nodes', queryset=Node.objects.order_by('position').with_widgets(user))
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -135,16 +190,20 @@ class CognitionViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
         original = self.get_object()
-        duplicated = Cognition.objects.create(raw_content=original.raw_content)
+        duplicated = Cognition.objects.create(
+            user=request.user, title=original.title, raw_content=original.raw_content
+        )
 
-        for node in original.nodes.all():
-            Node.objects.create(
+        Node.objects.bulk_create([
+            Node(
                 cognition=duplicated,
-                content=node.content,
+                content=node.text,
                 position=node.position,
                 character_count=node.character_count,
                 is_illuminated=node.is_illuminated,
             )
+            for node in original.nodes.all()
+        ])
 
         return Response({
             'status': 'success',
@@ -184,25 +243,20 @@ class CognitionViewSet(viewsets.ModelViewSet):
             try:
                 print(f"Attempting AI segmentation for cognition {cognition.id}")
                 
+                # Over budget, fall back to local splitting rather than reject
+                admission.acquire(request.user, estimate_tokens(len(cognition.raw_content), 2000))
+                
                 # Use semantic service for intelligent segmentation
                 result, processing_time = semantic_service.quick_segmentation(
                     cognition.raw_content,
                     max_segments=20
                 )
                 
-                with transaction.atomic():
-                    # Delete existing nodes
-                    cognition.nodes.all().delete()
-                    
-                    # Create nodes from AI segments
-                    for i, segment in enumerate(result.segments):
-                        content = cognition.raw_content[segment.start_position:segment.end_position]
-                        Node.objects.create(
-                            cognition=cognition,
-                            content=content.strip(),
-                            position=i,
-                            character_count=len(content)
-                        )
+                # Replace existing nodes with the AI segments
+                cognition.replace_nodes([
+                    cognition.raw_content[segment.start_position:segment.end_position].strip()
+                    for segment in result.segments
+                ])
                 
                 return Response({
                     'status': 'success',
@@ -212,103 +266,50 @@ class CognitionViewSet(viewsets.ModelViewSet):
                     'processing_time_ms': processing_time
                 })
                 
-            except (SemanticAnalysisError, Exception) as e:
+            except (SemanticAnalysisError, AdmissionDenied, Exception) as e:
                 print(f"AI segmentation failed for cognition {cognition.id}: {str(e)}")
                 # Continue to fallback method below
         
         # Fallback to manual paragraph splitting
         print(f"Using fallback paragraph splitting for cognition {cognition.id}")
-        text = cognition.raw_content
-        
-        # Clean up text first - normalize line breaks
-        text = re.sub(r'\r\n', '\n', text)  # Windows line endings
-        text = re.sub(r'\r', '\n', text)    # Mac line endings
-        
-        # Split by double newlines first (proper paragraphs)
-        paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
-        
-        # If we got very few paragraphs, try single newlines but be more conservative
-        if len(paragraphs) <= 2:
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            
-            # Group lines into paragraphs more intelligently
-            paragraphs = []
-            current_para = []
-            
-            for line in lines:
-                # If line looks like a header (short, no ending punctuation)
-                if len(line) < 80 and not re.search(r'[.!?]\s*$', line) and len(current_para) > 0:
-                    # Save current paragraph and start new one with header
-                    if current_para:
-                        paragraphs.append(' '.join(current_para))
-                        current_para = []
-                    paragraphs.append(line)  # Header as its own paragraph
-                else:
-                    current_para.append(line)
-                    
-                    # End paragraph if line ends with sentence-ending punctuation
-                    # and meets minimum length requirement
-                    if (re.search(r'[.!?]\s*$', line) and 
-                        len(' '.join(current_para)) > 100):  # Minimum paragraph length
-                        paragraphs.append(' '.join(current_para))
-                        current_para = []
-            
-            # Add any remaining content
-            if current_para:
-                paragraphs.append(' '.join(current_para))
-        
-        # Final cleanup and merging of very short paragraphs
-        final_paragraphs = []
-        i = 0
-        while i < len(paragraphs):
-            current = paragraphs[i].strip()
-            
-            # If current paragraph is very short and doesn't end with punctuation,
-            # try to merge with next
-            if (i + 1 < len(paragraphs) and 
-                len(current) < 80 and 
-                not re.search(r'[.!?;:]\s*$', current)):
-                next_para = paragraphs[i + 1].strip()
-                merged = f"{current}\n\n{next_para}"
-                final_paragraphs.append(merged)
-                i += 2  # Skip next paragraph since we merged it
-            else:
-                final_paragraphs.append(current)
-                i += 1
-        
-        paragraphs = final_paragraphs
-        
-        # Remove empty paragraphs and very short ones (unless they look like headers)
-        filtered_paragraphs = []
-        for para in paragraphs:
-            # Keep if it's substantial content OR looks like a meaningful header
-            if (len(para.strip()) > 20 or 
-                (len(para.strip()) > 5 and len(para.split()) <= 5)):
-                filtered_paragraphs.append(para.strip())
-        
-        paragraphs = filtered_paragraphs
-
-        # Delete existing nodes
-        cognition.nodes.all().delete()
-
-        # Create new nodes
-        created_count = 0
-        for i, paragraph in enumerate(paragraphs):
-            if paragraph.strip():  # Only create nodes for non-empty content
-                Node.objects.create(
-                    cognition=cognition,
-                    content=paragraph,
-                    position=i,
-                    character_count=len(paragraph)
-                )
-                created_count += 1
+        paragraphs = split_into_paragraphs(cognition.raw_content)
+
+        # Replace existing nodes (empty paragraphs are skipped)
+        created_count = cognition.replace_nodes(paragraphs)
 
         return Response({
             'status': 'success',
             'method': 'fallback_splitting',
             'nodes_created': created_count
         })
-    
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """
+        Reader engagement with the cognition's author quiz and LLM widgets,
+        read from rollups maintained on interact (author only)
+        """
+        from .widget_analytics import widget_analytics
+
+        cognition = self.get_object()
+        if not authorization_for(request).can_edit(cognition) and cognition.user_id != request.user.pk:
+            return Response(
+                {'error': 'Only the author can view analytics'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(widget_analytics.report(cognition))
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """
+        The requesting reader's progress through the cognition's required
+        widgets: furthest unlocked node and completion percentage
+        """
+        from .reader_progress import reader_progress
+
+        cognition = self.get_object()
+        return Response(reader_progress.as_dict(reader_progress.get(cognition, request.user)))
+
     @action(detail=True, methods=['post'])
     def quick_segment(self, request, pk=None):
         """
@@ -332,7 +333,7 @@ class CognitionViewSet(viewsets.ModelViewSet):
         max_segments = request.data.get('max_segments', None)
         create_nodes = request.data.get('create_nodes', True)
         
-        try:
+        def run_segmentation():
             # Perform quick segmentation
             result, processing_time = semantic_service.quick_segmentation(
                 cognition.raw_content,
@@ -340,21 +341,13 @@ class CognitionViewSet(viewsets.ModelViewSet):
             )
             
             if create_nodes:
-                with transaction.atomic():
-                    # Delete existing nodes
-                    cognition.nodes.all().delete()
-                    
-                    # Create nodes from segments
-                    for i, segment in enumerate(result.segments):
-                        content = cognition.raw_content[segment.start_position:segment.end_position]
-                        Node.objects.create(
-                            cognition=cognition,
-                            content=content.strip(),
-                            position=i,
-                            character_count=len(content)
-                        )
+                # Replace existing nodes with the segments
+                cognition.replace_nodes([
+                    cognition.raw_content[segment.start_position:segment.end_position].strip()
+                    for segment in result.segments
+                ])
             
-            return Response({
+            return {
                 'status': 'success',
                 'document_type': result.document_type.value,
                 'overall_summary': result.overall_summary,
@@ -372,8 +365,22 @@ class CognitionViewSet(viewsets.ModelViewSet):
                         'estimated_reading_time': seg.estimated_reading_time
                     } for seg in result.segments
                 ]
-            })
+            }
+        
+        _admit_llm_call(request.user, estimate_tokens(len(cognition.raw_content), 2000))
+        
+        try:
+            # Identical concurrent requests (double-clicks, several tabs) share one LLM call
+            return Response(single_flight.run(
+                'quick_segment',
+                cognition.id,
+                single_flight.content_hash(cognition.raw_content, max_segments, create_nodes),
+                run_segmentation,
+                shared_errors=(SemanticAnalysisError,)
+            ))
             
+        except SingleFlightPending as e:
+            return _pending_response(e)
         except SemanticAnalysisError as e:
             return Response(
                 {'error': str(e)},
@@ -422,25 +429,18 @@ class CognitionViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            created_nodes = []
-            
             # Get the next position for ordering
             last_position = Node.objects.filter(cognition=cognition).aggregate(
                 max_pos=models.Max('position')
-            )['max_pos'] or 0
+            )['max_pos']
+            next_position = 0 if last_position is None else last_position + 1
             
-            # Create nodes in bulk
+            # Create nodes in bulk (build_nodes skips paragraphs without content)
             with transaction.atomic():
-                for i, paragraph in enumerate(paragraphs):
-                    content = paragraph.strip()
-                    if content:  # Only create nodes with actual content
-                        node = Node.objects.create(
-                            cognition=cognition,
-                            content=content,
-                            position=last_position + i + 1,
-                            is_illuminated=False
-                        )
-                        created_nodes.append(node)
+                created_nodes = Node.objects.bulk_create(cognition.build_nodes(
+                    [str(paragraph).strip() for paragraph in paragraphs], start_position=next_position
+                ))
+                _nodes_changed(cognition)
             
             return Response({
                 'success': True,
@@ -458,6 +458,9 @@ class CognitionViewSet(viewsets.ModelViewSet):
     def generate_toc(self, request, pk=None):
         """
         Generate a Table of Contents for this cognition using AI analysis.
+        
+        Optional body fields: regenerate (bool) and mode ("auto", "flat" or
+        "hierarchical"; auto builds large documents hierarchically).
         """
         from .toc_processor import toc_processor
         
@@ -470,17 +473,31 @@ class CognitionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        # Check if regeneration is requested
+        regenerate = request.data.get('regenerate', False)
+        mode = request.data.get('mode', 'auto')
+        
+        if regenerate or not toc_processor.has_toc(cognition):
+            _admit_llm_call(request.user, estimate_toc_tokens(cognition))
+        
         try:
-            # Check if regeneration is requested
-            regenerate = request.data.get('regenerate', False)
+            def generate():
+                if regenerate:
+                    return toc_processor.regenerate_toc_for_cognition(cognition, mode)
+                return toc_processor.generate_toc_for_cognition(cognition, mode)
             
-            if regenerate:
-                result = toc_processor.regenerate_toc_for_cognition(cognition)
-            else:
-                result = toc_processor.generate_toc_for_cognition(cognition)
+            result = single_flight.run(
+                'generate_toc',
+                cognition.id,
+                single_flight.content_hash(cognition.revision, regenerate, mode),
+                generate,
+                shared_errors=(ValueError,)
+            )
             
             return Response(result)
             
+        except SingleFlightPending as e:
+            return _pending_response(e)
         except ValueError as e:
             return Response(
                 {'error': str(e)},
@@ -493,17 +510,294 @@ class CognitionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get', 'post'])
+    def analyze(self, request, pk=None):
+        """
+        Full semantic analysis of this cognition, computed once and stored.
+
+        GET returns the stored analysis. POST returns it too when it is still
+        current for the cognition's text; otherwise (or with force=true) it
+        starts a background analysis job and returns the job. Any other body
+        keys are SegmentationPreferences fields.
+        """
+        from pydantic import ValidationError
+        from .analysis_service import analysis_pipeline, ANALYSIS_JOB_TYPE
+        from .jobs import job_runner
+
+        cognition = self.get_object()
+
+        if request.method == 'GET':
+            analysis = getattr(cognition, 'analysis', None)
+            if analysis is None:
+                return Response(
+                    {'error': 'This cognition has not been analyzed'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response({
+                'status': 'completed',
+                'is_current': analysis.is_current_for(cognition.raw_content),
+                'analysis': DocumentAnalysisResultSerializer(analysis, context={'request': request}).data
+            })
+
+        if cognition.user != request.user:
+            return Response(
+                {'error': 'You do not have permission to analyze this cognition'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if not cognition.raw_content.strip():
+            return Response(
+                {'error': 'Cannot analyze empty content'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        preferences = {key: value for key, value in request.data.items() if key != 'force'}
+        try:
+            SegmentationPreferences(**preferences)
+        except ValidationError as e:
+            return Response({'error': e.errors(include_url=False)}, status=status.HTTP_400_BAD_REQUEST)
+
+        analysis = getattr(cognition, 'analysis', None)
+        if not request.data.get('force', False) and analysis is not None:
+            if analysis.is_current_for(cognition.raw_content):
+                return Response({
+                    'status': 'completed',
+                    'is_current': True,
+                    'analysis': DocumentAnalysisResultSerializer(analysis, context={'request': request}).data
+                })
+
+        job = analysis_pipeline.pending_job(cognition)
+        if job is None:
+            _admit_llm_call(request.user, estimate_tokens(len(cognition.raw_content), semantic_service.max_tokens))
+            job = job_runner.create(request.user, ANALYSIS_JOB_TYPE, params={
+                'cognition_id': cognition.id,
+                'preferences': preferences,
+            })
+            job_runner.submit(job, analysis_pipeline.run, cognition.id, preferences)
+            job.refresh_from_db()
+
+        return Response({
+            'status': job.status,
+            'job': ProcessingJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'])
+    def node_ops(self, request, pk=None):
+        """
+        Apply an ordered list of node operations in one transaction.
+
+        Body: operations (list of {"op": ..., ...}) and optional base_revision;
+        a stale base_revision is rejected with 409. Ops: update, insert,
+        delete, split, merge_with_next, move, toggle_illumination,
+        set_illumination. Returns the resulting node list and the new revision.
+        """
+        from .node_ops import node_operations, NodeOperationError, RevisionConflict
+
+        cognition = self.get_object()
+
+        if cognition.user != request.user:
+            return Response(
+                {'error': 'You do not have permission to edit this cognition'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            result = node_operations.apply(
+                cognition,
+                request.data.get('operations'),
+                base_revision=request.data.get('base_revision')
+            )
+        except RevisionConflict as e:
+            return Response(
+                {'error': 'The cognition has changed since base_revision', 'revision': e.current},
+                status=status.HTTP_409_CONFLICT
+            )
+        except NodeOperationError as e:
+            return Response(
+                {'error': e.message, 'operation_index': e.index},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'status': 'success',
+            'revision': result['revision'],
+            'created': result['created'],
+            'deleted': result['deleted'],
+            'toc': result['toc'],
+            'nodes': [
+                {
+                    'id': node.id,
+                    'position': node.position,
+                    'content': node.text,
+                    'character_count': node.character_count,
+                    'is_illuminated': node.is_illuminated,
+                    'node_type': node.node_type,
+                }
+                for node in result['nodes']
+            ]
+        })
+
+    @action(detail=True, methods=['post'])
+    def similarity_arcs(self, request, pk=None):
+        """
+        Propose (and optionally create) similarity arcs from local TF-IDF scores.
+
+        Body: top_k (default 5), min_score (default 0.2), scope ('cognition' or
+        'user' to compare against all of the author's cognitions), create (bool).
+        """
+        from .similarity_service import similarity_service
+
+        cognition = self.get_object()
+
+        if cognition.user != request.user:
+            return Response(
+                {'error': 'You do not have permission to create arcs for this cognition'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            top_k = int(request.data.get('top_k', 5))
+            min_score = float(request.data.get('min_score', 0.2))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'top_k must be an integer and min_score a number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= top_k <= 50:
+            return Response({'error': 'top_k must be between 1 and 50'}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = request.data.get('scope', 'cognition')
+        if scope == 'user':
+            nodes = similarity_service.scope_nodes(user=request.user)
+        elif scope == 'cognition':
+            nodes = similarity_service.scope_nodes(cognition=cognition)
+        else:
+            return Response({'error': 'scope must be "cognition" or "user"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        proposals = similarity_service.propose(nodes, top_k=top_k, min_score=min_score)
+        if scope == 'user':
+            # Only keep pairs that touch this cognition
+            own_ids = set(cognition.nodes.values_list('id', flat=True))
+            proposals = [p for p in proposals if p['source_node'] in own_ids or p['target_node'] in own_ids]
+
+        arcs_created = 0
+        if request.data.get('create', False):
+            arcs_created = similarity_service.create_arcs(proposals)
+
+        return Response({
+            'status': 'success',
+            'proposals': proposals,
+            'arcs_created': arcs_created
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the user's cognitions as newline-delimited JSON.
+
+        Query params: ids (comma separated), layout ('ndjson' or 'columnar')
+        """
+        from .transfer_service import transfer_service, EXPORT_LAYOUTS
+
+        layout = request.query_params.get('layout', 'ndjson')
+        if layout not in EXPORT_LAYOUTS:
+            return Response(
+                {'error': f'layout must be one of: {", ".join(EXPORT_LAYOUTS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = Cognition.objects.filter(user=request.user)
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                queryset = queryset.filter(id__in=[int(i) for i in ids.split(',') if i.strip()])
+            except ValueError:
+                return Response(
+                    {'error': 'ids must be a comma separated list of integers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        response = StreamingHttpResponse(
+            transfer_service.iter_ndjson(queryset, layout),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = 'attachment; filename="cognitions.ndjson"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk_ingest(self, request):
+        """
+        Create many cognitions in one request from an NDJSON body or a zip upload.
+
+        NDJSON: one {"title", "content", "is_public"} object per line, sent with
+        Content-Type application/x-ndjson. Zip: multipart field "archive" holding
+        .txt/.md files. Nodes are segmented locally; pass ?enrich=toc to queue AI
+        enrichment. Progress is streamed back as one JSON line per document.
+        """
+        from .ingest_service import ingest_service, IngestError, ENRICHMENT_OPERATIONS
+        from .jobs import job_runner
+
+        enrich = [op for op in request.query_params.get('enrich', '').split(',') if op]
+        unknown = [op for op in enrich if op not in ENRICHMENT_OPERATIONS]
+        if unknown:
+            return Response(
+                {'error': f'Unknown enrichment: {", ".join(unknown)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if request.content_type.startswith('application/x-ndjson'):
+            documents = ingest_service.iter_ndjson_documents(iter(request.stream.readline, b''))
+        elif 'archive' in request.FILES:
+            try:
+                documents = ingest_service.iter_zip_documents(request.FILES['archive'])
+            except IngestError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response(
+                {'error': 'Send application/x-ndjson or a zip file in the "archive" field'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user
+
+        def progress():
+            created_ids = []
+            failed = 0
+            for event in ingest_service.ingest(documents, user):
+                if event['status'] == 'created':
+                    created_ids.append(event['cognition_id'])
+                else:
+                    failed += 1
+                yield json.dumps(event) + '\n'
+
+            summary = {
+                'status': 'done',
+                'documents': len(created_ids) + failed,
+                'created': len(created_ids),
+                'failed': failed,
+                'job_id': None,
+            }
+            if enrich and created_ids:
+                job = job_runner.create(user, 'ingest_enrichment', total=len(created_ids),
+                                        params={'operations': enrich})
+                job_runner.submit(job, ingest_service.enrich, created_ids, enrich)
+                summary['job_id'] = job.id
+            yield json.dumps(summary) + '\n'
+
+        return StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+
     @action(detail=False, methods=['get'])
     def collective(self, request):
         print(f"Collective endpoint called by user: {request.user.username}")
-        queryset = Cognition.objects.filter(is_public=True).order_by('-share_date')
+        queryset = Cognition.objects.filter(is_public=True).select_related('user').with_nodes_count().order_by('-share_date')
         print(f"Public cognitions count: {queryset.count()}")
         print(f"Query SQL: {queryset.query}")
-        following_profiles = request.user.profile.following.all()
-        following_users = [profile.user.id for profile in following_profiles]
         following_only = request.query_params.get('following_only', 'false').lower() == 'true'
-        if following_only and following_users:
-            queryset = queryset.filter(user__in=following_users)
+        if following_only:
+            from .follow_graph import follow_graph_for, profile_id_for
+            following_profiles = follow_graph_for(request).following(profile_id_for(request.user))
+            if following_profiles:
+                queryset = queryset.filter(user__profile__in=following_profiles)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = CognitionCollectiveSerializer(page, many=True)
@@ -513,7 +807,7 @@ class CognitionViewSet(viewsets.ModelViewSet):
 
 
 class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = UserProfile.objects.all()
+    queryset = UserProfile.objects.select_related('user', 'stats')
     serializer_class = UserProfileSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['user__username']
@@ -527,29 +821,44 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True, methods=['post'])
     def follow(self, request, pk=None):
         profile_to_follow = self.get_object()
-        user_profile = request.user.profile
         if profile_to_follow.user == request.user:
             return Response({'error': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
-        user_profile.follow(profile_to_follow)
+        # Always write: the cached follow graph may be stale on this worker, and the add is idempotent
+        request.user.profile.follow(profile_to_follow)
         return Response({'status': 'success', 'message': f'You are now following {profile_to_follow.user.username}'})
 
     @action(detail=True, methods=['post'])
     def unfollow(self, request, pk=None):
         profile_to_unfollow = self.get_object()
-        user_profile = request.user.profile
-        user_profile.unfollow(profile_to_unfollow)
+        request.user.profile.unfollow(profile_to_unfollow)
         return Response({'status': 'success', 'message': f'You have unfollowed {profile_to_unfollow.user.username}'})
 
+    @action(detail=False, methods=['get'])
+    def suggestions(self, request):
+        """People you may know: profiles followed by the people you follow (computed offline)"""
+        from .follow_graph import follow_graph_for, follow_suggestions, profile_id_for
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        suggestions = follow_suggestions.for_profile(profile_id_for(request.user), follow_graph_for(request), limit)
+        context = self.get_serializer_context()
+        return Response([
+            dict(UserProfileSerializer(s.suggested, context=context).data, mutual_count=s.mutual_count)
+            for s in suggestions
+        ])
+
     @action(detail=False, methods=['get'])
     def my_profile(self, request):
-        serializer = self.get_serializer(request.user.profile)
+        serializer = self.get_serializer(self.get_queryset().get(user=request.user))
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
     def following(self, request, pk=None):
         """Get list of users this profile is following"""
+        from .follow_graph import follow_graph_for
         profile = self.get_object()
-        following = profile.get_following()
+        following = self.get_queryset().filter(pk__in=follow_graph_for(request).following(profile.pk)).order_by('id')
         page = self.paginate_queryset(following)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -560,8 +869,9 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True, methods=['get'])
     def followers(self, request, pk=None):
         """Get list of users following this profile"""
+        from .follow_graph import follow_graph_for
         profile = self.get_object()
-        followers = profile.get_followers()
+        followers = self.get_queryset().filter(pk__in=follow_graph_for(request).followers(profile.pk)).order_by('id')
         page = self.paginate_queryset(followers)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -576,7 +886,7 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
         user_cognitions = Cognition.objects.filter(
             user=profile.user, 
             is_public=True
-        ).order_by('-created_at')
+        ).select_related('user').with_nodes_count().order_by('-created_at')
         
         page = self.paginate_queryset(user_cognitions)
         if page is not None:
@@ -622,7 +932,7 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
         profiles = UserProfile.objects.filter(
             models.Q(user__username__icontains=query) |
             models.Q(bio__icontains=query)
-        ).select_related('user').order_by('user__username')
+        ).select_related('user', 'stats').order_by('user__username')
         
         # Exclude current user
         if request.user.is_authenticated:
@@ -640,7 +950,8 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
     def me(self, request):
         """Get current user's detailed profile"""
         from .serializers import UserProfileDetailSerializer
-        serializer = UserProfileDetailSerializer(request.user.profile, context={'request': request})
+        profile = self.get_queryset().get(user=request.user)
+        serializer = UserProfileDetailSerializer(profile, context={'request': request})
         return Response(serializer.data)
 
 
@@ -653,7 +964,7 @@ class NodeViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return Node.objects.filter(
             models.Q(cognition__user=user) | models.Q(cognition__is_public=True)
-        )
+        ).select_related('cognition').with_widgets(user)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -665,6 +976,14 @@ class NodeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    def perform_create(self, serializer):
+        node = serializer.save()
+        _nodes_changed(node.cognition)
+
+    def perform_update(self, serializer):
+        node = serializer.save()
+        _nodes_changed(node.cognition)
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         if instance.cognition.user != request.user:
@@ -686,19 +1005,11 @@ class NodeViewSet(viewsets.ModelViewSet):
             position_to_delete = instance.position
             cognition = instance.cognition
             
-            # Get nodes that need to be shifted down
-            nodes_to_shift = Node.objects.filter(
-                cognition=cognition,
-                position__gt=position_to_delete
-            ).order_by('position')
-            
-            # Delete the node
+            # Delete the node, then shift subsequent nodes down
             instance.delete()
+            Node.objects.filter(cognition=cognition, position__gt=position_to_delete).shift(-1)
             
-            # Shift subsequent nodes down manually
-            for shift_node in nodes_to_shift:
-                shift_node.position = shift_node.position - 1
-                shift_node.save()
+            _nodes_changed(cognition)
         
         return Response({'status': 'deleted'}, status=status.HTTP_204_NO_CONTENT)
 
@@ -707,6 +1018,7 @@ class NodeViewSet(viewsets.ModelViewSet):
         node = self.get_object()
         node.is_illuminated = not node.is_illuminated
         node.save()
+        _nodes_changed(node.cognition)
         return Response({'status': 'success', 'is_illuminated': node.is_illuminated})
 
     @action(detail=True, methods=['post'])
@@ -738,24 +1050,17 @@ class NodeViewSet(viewsets.ModelViewSet):
         
         with transaction.atomic():
             # Merge content
-            merged_content = node.content + separator + next_node.content
+            merged_content = node.text + separator + next_node.text
             node.content = merged_content
             node.character_count = len(merged_content)
             node.save()
             
-            # Get nodes that need to be shifted
-            nodes_to_shift = Node.objects.filter(
-                cognition=node.cognition,
-                position__gt=next_node.position
-            ).order_by('position')
-            
-            # Delete the next node
+            # Delete the next node, then shift subsequent nodes
+            next_position = next_node.position
             next_node.delete()
+            Node.objects.filter(cognition=node.cognition, position__gt=next_position).shift(-1)
             
-            # Shift subsequent nodes
-            for shift_node in nodes_to_shift:
-                shift_node.position = shift_node.position - 1
-                shift_node.save()
+            _nodes_changed(node.cognition)
         
         return Response({
             'status': 'success',
@@ -782,7 +1087,7 @@ class NodeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        content = node.content
+        content = node.text
         if split_position < 0 or split_position >= len(content):
             return Response(
                 {'error': 'Invalid split position'}, 
@@ -805,14 +1110,7 @@ class NodeViewSet(viewsets.ModelViewSet):
             node.save()
             
             # Shift all subsequent nodes forward
-            nodes_to_shift = Node.objects.filter(
-                cognition=node.cognition,
-                position__gt=node.position
-            ).order_by('-position')  # Reverse order to avoid conflicts
-            
-            for shift_node in nodes_to_shift:
-                shift_node.position = shift_node.position + 1
-                shift_node.save()
+            Node.objects.filter(cognition=node.cognition, position__gt=node.position).shift(1)
             
             # Create new node with second part
             new_node = Node.objects.create(
@@ -822,6 +1120,8 @@ class NodeViewSet(viewsets.ModelViewSet):
                 character_count=len(after_content),
                 is_illuminated=False
             )
+            
+            _nodes_changed(node.cognition)
         
         return Response({
             'status': 'success',
@@ -862,32 +1162,28 @@ class NodeViewSet(viewsets.ModelViewSet):
             return Response({'status': 'success', 'message': 'Node already at target position'})
         
         with transaction.atomic():
+            # Park the node so the range can shift into its old position
+            Node.objects.filter(pk=node.pk).park()
             if new_position > old_position:
                 # Moving down: shift nodes between old and new position up
-                nodes_to_shift = Node.objects.filter(
+                Node.objects.filter(
                     cognition=node.cognition,
                     position__gt=old_position,
                     position__lte=new_position
-                ).order_by('position')
-                
-                for shift_node in nodes_to_shift:
-                    shift_node.position = shift_node.position - 1
-                    shift_node.save()
+                ).shift(-1)
             else:
                 # Moving up: shift nodes between new and old position down
-                nodes_to_shift = Node.objects.filter(
+                Node.objects.filter(
                     cognition=node.cognition,
                     position__gte=new_position,
                     position__lt=old_position
-                ).order_by('-position')
-                
-                for shift_node in nodes_to_shift:
-                    shift_node.position = shift_node.position + 1
-                    shift_node.save()
+                ).shift(1)
             
             # Update the node's position
             node.position = new_position
             node.save()
+            
+            _nodes_changed(node.cognition)
         
         return Response({
             'status': 'success',
@@ -897,6 +1193,15 @@ class NodeViewSet(viewsets.ModelViewSet):
         })
 
 
+class ProcessingJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of the current user's background jobs"""
+    serializer_class = ProcessingJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ProcessingJob.objects.filter(user=self.request.user)
+
+
 class PresetResponseViewSet(viewsets.ModelViewSet):
     queryset = PresetResponse.objects.all().order_by('category', 'title')
     serializer_class = PresetResponseSerializer
@@ -918,10 +1223,120 @@ class PresetResponseViewSet(viewsets.ModelViewSet):
 
 
 class ArcViewSet(viewsets.ModelViewSet):
-    queryset = Arc.objects.all()
     serializer_class = ArcSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        from .arc_graph import arc_graph
+
+        try:
+            cognition_id = self._int_param('cognition', required=False)
+            node_id = self._int_param('node', required=False)
+        except ValueError as e:
+            raise ParseError(str(e))
+
+        queryset = arc_graph.visible_arcs(self.request.user)
+        if cognition_id is not None:
+            queryset = queryset.filter(
+                models.Q(source_node__cognition_id=cognition_id) | models.Q(target_node__cognition_id=cognition_id)
+            )
+        if node_id is not None:
+            queryset = queryset.filter(models.Q(source_node_id=node_id) | models.Q(target_node_id=node_id))
+        return queryset.order_by('id')
+
+    def _int_param(self, name, default=None, required=True):
+        value = self.request.query_params.get(name)
+        if value is None or value == '':
+            if default is None and required:
+                raise ValueError(f'{name} is required')
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f'{name} must be an integer')
+
+    def _arc_types(self):
+        arc_types = self.request.query_params.get('arc_types')
+        return [t for t in arc_types.split(',') if t] if arc_types else None
+
+    def _graph_response(self, graph):
+        graph['arcs'] = ArcSerializer(graph['arcs'], many=True).data
+        return Response(graph)
+
+    @action(detail=False, methods=['get'])
+    def neighborhood(self, request):
+        """Nodes and arcs within ?depth= hops (max 4) of ?node=, at most ?max_fanout= arcs per node"""
+        from .arc_graph import arc_graph
+
+        try:
+            node_id = self._int_param('node')
+            depth = self._int_param('depth', 1)
+            max_fanout = self._int_param('max_fanout', 25)
+            max_nodes = self._int_param('max_nodes', 200)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not arc_graph.visible_nodes(request.user).filter(id=node_id).exists():
+            return Response({'error': 'Node not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        graph = arc_graph.neighborhood(
+            request.user, node_id, depth=depth, max_fanout=max_fanout,
+            max_nodes=max_nodes, arc_types=self._arc_types()
+        )
+        return self._graph_response(graph)
+
+    @action(detail=False, methods=['get'])
+    def path(self, request):
+        """Shortest arc path between ?source= and ?target=, searching at most ?max_depth= hops"""
+        from .arc_graph import arc_graph
+
+        try:
+            source_id = self._int_param('source')
+            target_id = self._int_param('target')
+            max_depth = self._int_param('max_depth', 4)
+            max_fanout = self._int_param('max_fanout', 50)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        visible = set(arc_graph.visible_nodes(request.user).filter(
+            id__in=[source_id, target_id]
+        ).values_list('id', flat=True))
+        if {source_id, target_id} - visible:
+            return Response({'error': 'Node not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        graph = arc_graph.shortest_path(
+            request.user, source_id, target_id, max_depth=max_depth,
+            max_fanout=max_fanout, arc_types=self._arc_types()
+        )
+        if graph is None:
+            return Response(
+                {'error': 'No path found within the depth limit'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self._graph_response(graph)
+
+    @action(detail=False, methods=['get'])
+    def subgraph(self, request):
+        """Arcs among the nodes of ?cognition= (add ?include_external=true for arcs leaving it)"""
+        from .arc_graph import arc_graph
+
+        try:
+            cognition_id = self._int_param('cognition')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cognition = Cognition.objects.filter(
+            models.Q(user=request.user) | models.Q(is_public=True), id=cognition_id
+        ).first()
+        if cognition is None:
+            return Response({'error': 'Cognition not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        include_external = request.query_params.get('include_external', 'false').lower() == 'true'
+        graph = arc_graph.cognition_subgraph(
+            request.user, cognition, include_external=include_external, arc_types=self._arc_types()
+        )
+        return self._graph_response(graph)
+
 
 class WidgetViewSet(viewsets.ModelViewSet):
     serializer_class = WidgetSerializer
@@ -936,7 +1351,11 @@ class WidgetViewSet(viewsets.ModelViewSet):
             models.Q(node__cognition__user=user) | 
             models.Q(node__cognition__is_public=True) |
             models.Q(user=user)
-        ).distinct()
+        ).distinct().select_related('user').prefetch_related(models.Prefetch(
+            'interactions',
+            queryset=WidgetInteraction.objects.filter(user=user).order_by('pk'),
+            to_attr='user_interactions'
+        ))
     
     def perform_create(self, serializer):
         # Auto-set user and validate permissions
@@ -960,27 +1379,62 @@ class WidgetViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def interact(self, request, pk=None):
         """Record user interaction with widget"""
-        widget = self.get_object()
-        
-        # Create or update interaction
-        interaction, created = WidgetInteraction.objects.update_or_create(
-            widget=widget,
-            user=request.user,
-            defaults={
-                'completed': request.data.get('completed', False),
-                'quiz_answer': request.data.get('quiz_answer', ''),
-                'interaction_data': request.data.get('interaction_data', {})
-            }
-        )
+        from .widget_interactions import interaction_writer
         
+        # One query authorizes and finds any existing interaction; the write is a single upsert
+        existing = interaction_writer.authorize(request.user, pk) if str(pk).isdigit() else None
+        if existing is None:
+            return Response({'detail': 'No Widget matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+        widget_id = int(pk)
+        
+        serializer = InteractionInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        if interaction_writer.buffering:
+            interaction = interaction_writer.enqueue(request.user, widget_id, serializer.validated_data)
+            return Response(WidgetInteractionSerializer(interaction).data, status=status.HTTP_202_ACCEPTED)
+        
+        interaction = interaction_writer.record(request.user, widget_id, serializer.validated_data, existing)
         return Response(WidgetInteractionSerializer(interaction).data)
+    
+    @action(detail=False, methods=['post'])
+    def interact_batch(self, request):
+        """
+        Record several interactions in one request, e.g. events a client has
+        buffered. Body: {"interactions": [{"widget_id": 1, "completed": true,
+        "quiz_answer": "", "interaction_data": {}}, ...]}. Later events for the
+        same widget replace earlier ones; widgets the user cannot access are
+        reported in "skipped".
+        """
+        from .widget_interactions import interaction_writer
+        
+        events = request.data.get('interactions')
+        if not isinstance(events, list) or not events:
+            return Response({'error': 'interactions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > 500:
+            return Response({'error': 'At most 500 interactions per batch'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = InteractionEventSerializer(data=events, many=True)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid interactions', 'interactions': serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        latest = {event['widget_id']: event for event in serializer.validated_data}
+        
+        allowed = interaction_writer.authorize_many(request.user, latest)
+        interactions = [
+            interaction_writer.build(widget_id, request.user, event)
+            for widget_id, event in latest.items() if widget_id in allowed
+        ]
+        if interactions:
+            interaction_writer.write(interactions)
+        return Response({
+            'recorded': len(interactions),
+            'skipped': sorted(set(latest) - allowed),
+        })
 
     @action(detail=False, methods=['post'])
     def create_llm_widget(self, request):
         """Create a widget using LLM generation"""
-        import openai
-        import os
-        
         node_id = request.data.get('node_id')
         llm_preset = request.data.get('llm_preset')
         custom_prompt = request.data.get('custom_prompt', '')
@@ -998,6 +1452,11 @@ class WidgetViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        try:
+            node_id = int(node_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'node_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
             node = Node.objects.get(id=node_id)
         except Node.DoesNotExist:
@@ -1019,69 +1478,127 @@ class WidgetViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        _admit_llm_call(request.user, estimate_tokens(len(node.text), 500))
+        
         try:
-            # Use OpenAI to generate widget content
-            client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            
-            # Determine the prompt based on preset and widget type
-            if llm_preset == 'quiz':
-                system_prompt = """You are an expert educator. Create a thoughtful quiz question based on the provided text content. The question should test understanding of key concepts or ideas."""
-                user_prompt = f"Create a quiz question for this content:\n\n{node.content}\n\nCustom instructions: {custom_prompt}"
-            elif llm_preset == 'summary':
-                system_prompt = """You are an expert at creating concise summaries. Create a brief, accurate summary of the provided content."""
-                user_prompt = f"Summarize this content:\n\n{node.content}\n\nCustom instructions: {custom_prompt}"
-            elif llm_preset == 'analysis':
-                system_prompt = """You are an expert analyst. Provide insightful analysis of the provided content, highlighting key themes, implications, or significance."""
-                user_prompt = f"Analyze this content:\n\n{node.content}\n\nCustom instructions: {custom_prompt}"
-            elif llm_preset == 'discussion':
-                system_prompt = """You are a discussion facilitator. Create thought-provoking discussion points or questions to help readers engage deeply with the content."""
-                user_prompt = f"Create discussion points for this content:\n\n{node.content}\n\nCustom instructions: {custom_prompt}"
-            else:
-                # Custom prompt
-                system_prompt = "You are a helpful assistant that creates educational content based on provided text."
-                user_prompt = f"Content: {node.content}\n\nTask: {custom_prompt}"
+            from .llm_widget_service import llm_widget_service
+
+            def create_widget():
+                generated_content = llm_widget_service.generate(node.text, llm_preset, custom_prompt)
+                
+                # Create the widget
+                widget_data = {
+                    'node': node.id,
+                    'widget_type': widget_type,
+                    'user': request.user.id
+                }
+                widget_data.update(llm_widget_service.widget_fields(widget_type, llm_preset, generated_content))
+                
+                serializer = WidgetSerializer(data=widget_data)
+                serializer.is_valid(raise_exception=True)
+                widget = serializer.save(user=request.user)
+                return WidgetSerializer(widget).data
             
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500
+            # A double-submitted request gets the same widget instead of a second one
+            data = single_flight.run(
+                'create_llm_widget',
+                node.id,
+                single_flight.content_hash(request.user.id, widget_type, llm_preset, custom_prompt, node.text),
+                create_widget
             )
             
-            generated_content = response.choices[0].message.content.strip()
-            
-            # Create the widget
-            widget_data = {
-                'node': node.id,
-                'widget_type': widget_type,
-                'user': request.user.id
-            }
-            
-            # Set content based on widget type
-            if 'quiz' in widget_type:
-                widget_data['quiz_question'] = generated_content
-            else:
-                widget_data['content'] = generated_content
-            
-            # Add title if it's a remark widget
-            if 'remark' in widget_type:
-                widget_data['title'] = f"AI-Generated {llm_preset.title()}"
-            
-            serializer = WidgetSerializer(data=widget_data)
-            serializer.is_valid(raise_exception=True)
-            widget = serializer.save(user=request.user)
-            
-            return Response(WidgetSerializer(widget).data, status=status.HTTP_201_CREATED)
+            return Response(data, status=status.HTTP_201_CREATED)
             
+        except SingleFlightPending as e:
+            return _pending_response(e)
         except Exception as e:
             return Response(
                 {'error': f'Failed to generate widget: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def batch_generate(self, request):
+        """
+        Generate LLM widgets for every node of a cognition in a background job.
+
+        Body: cognition_id, widget_type, llm_preset, custom_prompt, optional
+        node_ids and max_concurrency. Returns the job; poll /api/jobs/{id}/.
+        """
+        from .llm_widget_service import llm_widget_service
+        from .jobs import job_runner
+
+        cognition_id = request.data.get('cognition_id')
+        widget_type = request.data.get('widget_type')
+        llm_preset = request.data.get('llm_preset')
+        custom_prompt = request.data.get('custom_prompt', '')
+        node_ids = request.data.get('node_ids') or None
+
+        if not cognition_id or not widget_type:
+            return Response(
+                {'error': 'cognition_id and widget_type are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if widget_type not in dict(Widget.WIDGET_TYPE_CHOICES):
+            return Response({'error': 'Invalid widget_type'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cognition_id = int(cognition_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'cognition_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if node_ids is not None:
+            try:
+                if not isinstance(node_ids, list):
+                    raise TypeError
+                node_ids = [int(node_id) for node_id in node_ids]
+            except (TypeError, ValueError):
+                return Response({'error': 'node_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            max_concurrency = int(request.data.get('max_concurrency') or 0) or None
+        except (TypeError, ValueError):
+            return Response({'error': 'max_concurrency must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = getattr(settings, 'LLM_BATCH_MAX_CONCURRENCY', 8)
+        if max_concurrency is not None:
+            max_concurrency = max(1, min(max_concurrency, limit))
+
+        try:
+            cognition = Cognition.objects.get(id=cognition_id)
+        except Cognition.DoesNotExist:
+            return Response({'error': 'Cognition not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if widget_type.startswith('author_') and cognition.user != request.user:
+            return Response(
+                {'error': 'Only the author can create author widgets'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if widget_type.startswith('reader_') and not (cognition.user == request.user or cognition.is_public):
+            return Response(
+                {'error': 'Cannot create reader widgets on inaccessible nodes'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Reserve the whole batch up front; an over-budget batch is refused before any call is made
+        _admit_llm_call(request.user, estimate_widget_batch_tokens(cognition, node_ids))
+
+        job = job_runner.create(request.user, 'batch_widget_generation', params={
+            'cognition_id': cognition.id,
+            'widget_type': widget_type,
+            'llm_preset': llm_preset,
+            'node_ids': node_ids,
+        })
+        job_runner.submit(
+            job, llm_widget_service.generate_for_nodes,
+            request.user, cognition.id, widget_type, llm_preset, custom_prompt,
+            node_ids=node_ids, max_concurrency=max_concurrency
+        )
+        job.refresh_from_db()
+
+        return Response(ProcessingJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -1103,66 +1620,12 @@ def convert_text_to_markdown(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    _admit_llm_call(request.user, estimate_tokens(len(raw_text), len(raw_text) // 4))
+    
     try:
-        # Use OpenAI to convert text to proper markdown
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-        system_prompt = """You are an expert at converting raw text into well-formatted markdown.
-
-Your task is to take raw, unformatted text and convert it into clean, readable markdown with appropriate structure.
-
-Guidelines:
-- Add proper headers (# ## ###) where appropriate to create document structure
-- Format lists, both numbered and bulleted, correctly
-- Add emphasis (*italic*, **bold**) where it improves readability
-- Create proper paragraph breaks
-- Format code blocks with ``` if any code is present
-- Add horizontal rules (---) to separate major sections if appropriate
-- Preserve the original meaning and content exactly
-- Don't add new information or content
-- Don't remove any important information
-- Make the text more readable and well-structured
-
-Return only the formatted markdown, no explanations or additional text."""
-
-        user_prompt = f"Convert this raw text to well-formatted markdown:\n\n{raw_text}"
-        
-        # Calculate appropriate max_tokens based on input length
-        # Input tokens ~= chars/4, leave room for system prompt and formatting expansion
-        estimated_input_tokens = len(raw_text) // 4 + 500  # +500 for system prompt
-        # Allow output to be 1.5x input size (for markdown formatting) + buffer
-        max_output_tokens = min(16000, max(8000, int(len(raw_text) // 2.5)))
-        
-        print(f"Markdown conversion: input_chars={len(raw_text)}, estimated_input_tokens={estimated_input_tokens}, max_output_tokens={max_output_tokens}")
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=max_output_tokens
-        )
-        
-        markdown_text = response.choices[0].message.content.strip()
-        
-        # Check if response was truncated
-        finish_reason = response.choices[0].finish_reason
-        if finish_reason == 'length':
-            print(f"Warning: OpenAI response was truncated (finish_reason: {finish_reason})")
-            # Could fallback to original text here, but let's try with the partial result
-        
-        # Basic validation - check if result looks reasonable
-        if len(markdown_text) < len(raw_text) * 0.3:  # Result is suspiciously short
-            print(f"Warning: Markdown result seems too short (original: {len(raw_text)}, result: {len(markdown_text)})")
-        
-        return Response({
-            'markdown_text': markdown_text,
-            'original_length': len(raw_text),
-            'formatted_length': len(markdown_text),
-            'finish_reason': finish_reason
-        })
+        from .openai_service import markdown_service
+
+        return Response(markdown_service.convert(raw_text))
         
     except Exception as e:
         print(f"Markdown conversion error: {str(e)}")
@@ -1172,6 +1635,38 @@ Return only the formatted markdown, no explanations or additional text."""
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def llm_usage(request):
+    """
+    LLM spend, token usage and latency over the last ``days`` days, grouped
+    ``by`` operation, user or model. Users see their own calls; staff can
+    pass scope=all for everyone's.
+    """
+    from datetime import timedelta
+    from .llm_ledger import llm_ledger
+
+    by = request.query_params.get('by', 'operation')
+    if by not in ('operation', 'user', 'model'):
+        return Response({'error': 'by must be one of: operation, user, model'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        days = int(request.query_params.get('days', 30))
+    except ValueError:
+        return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= days <= 366:
+        return Response({'error': 'days must be between 1 and 366'}, status=status.HTTP_400_BAD_REQUEST)
+
+    scope = request.query_params.get('scope', 'self')
+    if scope == 'all' and not request.user.is_staff:
+        return Response({'error': 'Only staff can view everyone\'s LLM usage'}, status=status.HTTP_403_FORBIDDEN)
+
+    report = llm_ledger.report(
+        timezone.now() - timedelta(days=days), by=by,
+        user_id=None if scope == 'all' else request.user.pk,
+    )
+    return Response({'scope': 'all' if scope == 'all' else 'self', **report})
+
+
 class GroupViewSet(viewsets.ModelViewSet):
     """ViewSet for Group CRUD operations and member management"""
     serializer_class = GroupSerializer
@@ -1184,7 +1679,11 @@ class GroupViewSet(viewsets.ModelViewSet):
             return Group.objects.filter(
                 models.Q(is_public=True) |
                 models.Q(memberships__user=self.request.user)
-            ).distinct().order_by('-created_at')
+            ).distinct().select_related('founder').with_counts().order_by('-created_at')
+        if self.action == 'retrieve':
+            return Group.objects.select_related('founder').with_counts().prefetch_related(
+                models.Prefetch('memberships', queryset=GroupMembership.objects.select_related('user'))
+            )
         return Group.objects.all()
     
     def get_serializer_class(self):
@@ -1197,12 +1696,13 @@ class GroupViewSet(viewsets.ModelViewSet):
         group = serializer.save(founder=self.request.user)
         # Add founder as admin member
         group.add_member(self.request.user, role='admin')
+        authorization_for(self.request).invalidate()
     
     @action(detail=True, methods=['get'])
     def members(self, request, pk=None):
         """Get group members"""
         group = self.get_object()
-        memberships = group.memberships.all().order_by('joined_at')
+        memberships = group.memberships.select_related('user').order_by('joined_at')
         serializer = GroupMembershipSerializer(memberships, many=True)
         return Response(serializer.data)
     
@@ -1217,13 +1717,14 @@ class GroupViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if group.is_member(request.user):
+        if authorization_for(request).is_member(group.id):
             return Response(
                 {'error': 'You are already a member of this group'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         group.add_member(request.user)
+        authorization_for(request).invalidate()
         return Response({'message': f'Successfully joined {group.name}'})
     
     @action(detail=True, methods=['post'])
@@ -1231,7 +1732,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         """Leave a group"""
         group = self.get_object()
         
-        if not group.is_member(request.user):
+        if not authorization_for(request).is_member(group.id):
             return Response(
                 {'error': 'You are not a member of this group'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -1244,6 +1745,7 @@ class GroupViewSet(viewsets.ModelViewSet):
             )
         
         group.remove_member(request.user)
+        authorization_for(request).invalidate()
         return Response({'message': f'Successfully left {group.name}'})
     
     @action(detail=True, methods=['post'])
@@ -1251,7 +1753,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         """Invite a user to the group"""
         group = self.get_object()
         
-        if not group.is_admin(request.user):
+        if not authorization_for(request).is_admin(group.id):
             return Response(
                 {'error': 'Only group admins can send invitations'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -1308,7 +1810,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         """Update a member's role (admin only)"""
         group = self.get_object()
         
-        if not group.is_admin(request.user):
+        if not authorization_for(request).is_admin(group.id):
             return Response(
                 {'error': 'Only group admins can update member roles'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -1333,6 +1835,8 @@ class GroupViewSet(viewsets.ModelViewSet):
             membership = group.memberships.get(user_id=user_id)
             membership.role = new_role
             membership.save()
+            if membership.user_id == request.user.pk:
+                authorization_for(request).invalidate()
             
             serializer = GroupMembershipSerializer(membership)
             return Response(serializer.data)
@@ -1347,7 +1851,7 @@ class GroupViewSet(viewsets.ModelViewSet):
         """Remove a member from the group (admin only)"""
         group = self.get_object()
         
-        if not group.is_admin(request.user):
+        if not authorization_for(request).is_admin(group.id):
             return Response(
                 {'error': 'Only group admins can remove members'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -1382,6 +1886,8 @@ class GroupViewSet(viewsets.ModelViewSet):
             )
         
         group.remove_member(user_to_remove)
+        if user_to_remove.pk == request.user.pk:
+            authorization_for(request).invalidate()
         return Response({'message': f'Successfully removed {user_to_remove.username} from {group.name}'})
     
     @action(detail=True, methods=['get'])
@@ -1390,13 +1896,13 @@ class GroupViewSet(viewsets.ModelViewSet):
         group = self.get_object()
         
         # Only members can view group cognitions
-        if not group.is_member(request.user):
+        if not authorization_for(request).is_member(group.id):
             return Response(
                 {'error': 'Only group members can view group cognitions'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        cognitions = group.cognitions.order_by('-created_at')
+        cognitions = group.cognitions.select_related('user', 'group').with_nodes_count().order_by('-created_at')
         page = self.paginate_queryset(cognitions)
         if page is not None:
             serializer = CognitionSerializer(page, many=True, context={'request': request})
@@ -1413,7 +1919,9 @@ class GroupInvitationViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return invitations for current user"""
-        return GroupInvitation.objects.filter(invitee=self.request.user).order_by('-created_at')
+        return GroupInvitation.objects.filter(invitee=self.request.user).select_related(
+            'group', 'inviter', 'invitee'
+        ).order_by('-created_at')
     
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
@@ -0,0 +1,243 @@
+# api/widget_analytics.py
+"""
+Incrementally maintained engagement rollups for authors' quiz and LLM widgets
+"""
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from .models import Cognition, CognitionEngagementStats, Widget, WidgetInteraction, WidgetStats
+
+TRACKED_WIDGET_TYPES = ('author_quiz', 'author_llm')
+
+
+class InteractionChange:
+    """One recorded interaction and the state of the reader's row before it"""
+
+    def __init__(self, interaction: WidgetInteraction, previous: Optional[Tuple[bool, str]], events: int = 1):
+        self.interaction = interaction
+        # (completed, quiz_answer) of the row this write replaced, None if it created the row
+        self.previous = previous
+        self.events = events
+
+
+class WidgetAnalyticsService:
+    """
+    Keeps WidgetStats and CognitionEngagementStats current as interactions are
+    written, so the author analytics endpoint reads a handful of rows however
+    many readers there are.
+
+    Each write is turned into deltas from the row it replaced: a new row adds
+    a reader, a completed flag that flips moves a completion, and a changed
+    quiz answer moves one reader between answer buckets. The cognition funnel
+    is a histogram of readers by number of completed widgets; a reader moves
+    between buckets using one aggregate over that reader's own interactions.
+    Rollup rows are locked while they are updated.
+
+    Concurrent writes for the same reader and widget can skew the deltas
+    slightly, as can deleting widgets; ``manage.py backfill_widget_analytics``
+    recomputes the rollups exactly from WidgetInteraction.
+    """
+
+    def record(self, changes: List[InteractionChange], widgets: Dict[int, Dict[str, Any]]):
+        """
+        Apply written interactions to the rollups. ``widgets`` maps widget ids
+        to their widget_type and cognition_id (see InteractionWriter.widget_meta).
+        """
+        tracked = {
+            widget_id: meta['cognition_id'] for widget_id, meta in widgets.items()
+            if meta['widget_type'] in TRACKED_WIDGET_TYPES
+        }
+        changes = [change for change in changes if change.interaction.widget_id in tracked]
+        if not changes:
+            return
+
+        by_widget = defaultdict(list)
+        by_reader = defaultdict(list)
+        for change in changes:
+            widget_id = change.interaction.widget_id
+            by_widget[widget_id].append(change)
+            by_reader[(tracked[widget_id], change.interaction.user_id)].append(change)
+
+        with transaction.atomic():
+            for widget_id, widget_changes in by_widget.items():
+                self._apply_widget(widget_id, tracked[widget_id], widget_changes)
+            for (cognition_id, user_id), reader_changes in by_reader.items():
+                self._apply_reader(cognition_id, user_id, reader_changes)
+
+    def _apply_widget(self, widget_id: int, cognition_id: int, changes: List[InteractionChange]):
+        stats = self._locked(WidgetStats, widget_id, widget_id=widget_id, cognition_id=cognition_id)
+        answers = Counter(stats.answer_counts)
+        for change in changes:
+            interaction = change.interaction
+            stats.attempts += change.events
+            previous_completed, previous_answer = change.previous or (False, '')
+            if change.previous is None:
+                stats.readers += 1
+            stats.completions += int(bool(interaction.completed)) - int(bool(previous_completed))
+            if previous_answer:
+                answers[previous_answer] -= 1
+            if interaction.quiz_answer:
+                answers[interaction.quiz_answer] += 1
+        stats.completions = max(stats.completions, 0)
+        stats.answer_counts = {answer: count for answer, count in sorted(answers.items()) if count > 0}
+        stats.save()
+
+    def _apply_reader(self, cognition_id: int, user_id: int, changes: List[InteractionChange]):
+        created = sum(1 for change in changes if change.previous is None)
+        flipped = sum(
+            int(bool(change.interaction.completed)) - int(bool(change.previous and change.previous[0]))
+            for change in changes
+        )
+        if not created and not flipped:
+            # An answer change on a widget the reader had already started moves no one in the funnel
+            return
+
+        current = WidgetInteraction.objects.filter(
+            user_id=user_id,
+            widget__node__cognition_id=cognition_id,
+            widget__widget_type__in=TRACKED_WIDGET_TYPES,
+        ).aggregate(
+            total=models.Count('id'),
+            completed=models.Count('id', filter=models.Q(completed=True)),
+        )
+        before = current['completed'] - flipped
+        had_started = current['total'] - created > 0
+        if had_started and before == current['completed']:
+            return
+
+        stats = self._locked(CognitionEngagementStats, cognition_id, cognition_id=cognition_id)
+        histogram = Counter({int(completed): count for completed, count in stats.completion_histogram.items()})
+        if had_started:
+            histogram[max(before, 0)] -= 1
+        histogram[current['completed']] += 1
+        stats.completion_histogram = {str(completed): count for completed, count in sorted(histogram.items()) if count > 0}
+        stats.save()
+
+    @staticmethod
+    def _locked(model, pk, **defaults):
+        """The rollup row, locked for update; created empty if missing"""
+        row = model.objects.select_for_update().filter(pk=pk).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    row = model.objects.create(**defaults)
+            except IntegrityError:
+                row = model.objects.select_for_update().get(pk=pk)
+        return row
+
+    def report(self, cognition: Cognition) -> Dict[str, Any]:
+        """Author-facing analytics for a cognition, read from the rollups"""
+        widgets = list(
+            Widget.objects.filter(node__cognition=cognition, widget_type__in=TRACKED_WIDGET_TYPES)
+            .select_related('stats')
+            .only('id', 'widget_type', 'title', 'quiz_question', 'quiz_correct_answer', 'node_id',
+                  'stats__readers', 'stats__attempts', 'stats__completions',
+                  'stats__answer_counts', 'stats__updated_at')
+            .order_by('node__position', 'position', 'created_at')
+        )
+        engagement = CognitionEngagementStats.objects.filter(cognition=cognition).first()
+        histogram = engagement.completion_histogram if engagement else {}
+
+        widget_rows = []
+        for widget in widgets:
+            stats = getattr(widget, 'stats', None) or WidgetStats(widget=widget, cognition=cognition)
+            correct_answer = widget.quiz_correct_answer if widget.widget_type == 'author_quiz' else ''
+            widget_rows.append({
+                'widget_id': widget.id,
+                'widget_type': widget.widget_type,
+                'node_id': widget.node_id,
+                'title': widget.quiz_question or widget.title,
+                'readers': stats.readers,
+                'attempts': stats.attempts,
+                'completions': stats.completions,
+                'completion_rate': stats.completions / stats.readers if stats.readers else None,
+                'answer_counts': stats.answer_counts,
+                'correct_answer': correct_answer or None,
+                'correct_rate': stats.correct_rate(correct_answer),
+            })
+
+        total = len(widgets)
+        funnel_stats = engagement or CognitionEngagementStats(cognition=cognition)
+        stages = [('started', 0), ('completed_any', 1), ('completed_half', (total + 1) // 2), ('completed_all', total)]
+        funnel = [
+            {'stage': stage, 'widgets_completed': at_least, 'readers': funnel_stats.readers_completing(at_least)}
+            for stage, at_least in stages if at_least <= total and (stage == 'started' or at_least > 0)
+        ]
+        return {
+            'cognition_id': cognition.id,
+            'tracked_widgets': total,
+            'readers': funnel_stats.readers,
+            'funnel': funnel,
+            'completion_histogram': histogram,
+            'widgets': widget_rows,
+        }
+
+    def rebuild(self, cognition: Cognition) -> Dict[str, int]:
+        """
+        Recompute a cognition's rollups from its interactions.
+
+        The rollup rows are locked before the interactions are read, so a
+        concurrent record() either lands before the read or waits and applies
+        its delta on top. Individual events are not stored, so the attempt
+        count can only be rebuilt as one per reader; a larger existing count
+        is kept.
+        """
+        widget_ids = list(
+            Widget.objects.filter(node__cognition=cognition, widget_type__in=TRACKED_WIDGET_TYPES)
+            .values_list('id', flat=True)
+        )
+        interactions = WidgetInteraction.objects.filter(
+            widget__node__cognition=cognition, widget__widget_type__in=TRACKED_WIDGET_TYPES
+        )
+
+        with transaction.atomic():
+            self._locked(CognitionEngagementStats, cognition.pk, cognition_id=cognition.pk)
+            attempts = dict(
+                WidgetStats.objects.select_for_update().filter(cognition=cognition).values_list('widget_id', 'attempts')
+            )
+
+            totals = {
+                row['widget_id']: row for row in interactions.values('widget_id').annotate(
+                    readers=models.Count('id'),
+                    completions=models.Count('id', filter=models.Q(completed=True)),
+                )
+            }
+            answers = defaultdict(dict)
+            for row in interactions.exclude(quiz_answer='').values('widget_id', 'quiz_answer').annotate(
+                count=models.Count('id')
+            ):
+                answers[row['widget_id']][row['quiz_answer']] = row['count']
+            per_reader = interactions.values('user_id').annotate(
+                completed=models.Count('id', filter=models.Q(completed=True))
+            )
+            histogram = Counter(row['completed'] for row in per_reader)
+
+            WidgetStats.objects.filter(cognition=cognition).exclude(widget_id__in=widget_ids).delete()
+            rows = []
+            for widget_id in widget_ids:
+                readers = totals.get(widget_id, {}).get('readers', 0)
+                rows.append(WidgetStats(
+                    widget_id=widget_id,
+                    cognition=cognition,
+                    readers=readers,
+                    attempts=max(attempts.get(widget_id, 0), readers),
+                    completions=totals.get(widget_id, {}).get('completions', 0),
+                    answer_counts=dict(sorted(answers[widget_id].items())),
+                ))
+            WidgetStats.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['widget'],
+                update_fields=['cognition', 'readers', 'attempts', 'completions', 'answer_counts', 'updated_at'],
+            )
+            CognitionEngagementStats.objects.filter(cognition=cognition).update(
+                completion_histogram={str(k): v for k, v in sorted(histogram.items())},
+                updated_at=timezone.now(),
+            )
+        return {'widgets': len(widget_ids), 'readers': sum(histogram.values())}
+
+
+# Global instance
+widget_analytics = WidgetAnalyticsService()
@@ -0,0 +1,262 @@
+# api/widget_interactions.py
+"""
+Fast write path for reader interactions with widgets (quiz answers, completion toggles)
+"""
+import atexit
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from .models import Widget, WidgetInteraction
+from .reader_progress import reader_progress
+from .widget_analytics import TRACKED_WIDGET_TYPES, InteractionChange, widget_analytics
+
+UPSERT_FIELDS = ['completed', 'quiz_answer', 'interaction_data', 'updated_at']
+MAX_FLUSH_ATTEMPTS = 3
+WIDGET_META_FIELDS = ('widget_type', 'is_required', 'node_id')
+WIDGET_META_EXPRESSIONS = {
+    'node_position': models.F('node__position'),
+    'cognition_id': models.F('node__cognition_id'),
+    'revision': models.F('node__cognition__revision'),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def is_observed(meta: Dict[str, Any]) -> bool:
+    """Whether writes to this widget feed the analytics rollups or reader progress"""
+    return meta['widget_type'] in TRACKED_WIDGET_TYPES or (
+        meta['is_required'] and meta['widget_type'].startswith('author_')
+    )
+
+
+def accessible_widgets(user):
+    """Widgets the user may interact with; the same rule as WidgetViewSet.get_queryset"""
+    return Widget.objects.filter(
+        models.Q(node__cognition__user=user) |
+        models.Q(node__cognition__is_public=True) |
+        models.Q(user=user)
+    )
+
+
+class InteractionWriter:
+    """
+    Records WidgetInteraction rows with one authorization query and one upsert.
+
+    An interaction is still "the latest event wins" per (widget, user): each
+    event replaces completed, quiz_answer and interaction_data, keeps
+    created_at and bumps updated_at, exactly as update_or_create did. The
+    upsert is a bulk_create with update_conflicts, i.e. INSERT ... ON
+    CONFLICT (widget_id, user_id) DO UPDATE, so concurrent events for the
+    same pair cannot race into a duplicate key error either. The widget
+    analytics rollups and cached reader progress are updated in the same
+    transaction.
+
+    With WIDGET_INTERACTION_BUFFER_SIZE > 1, events are collected in memory,
+    coalesced per (widget, user), and written in one upsert when the buffer
+    fills or WIDGET_INTERACTION_FLUSH_INTERVAL seconds after the first
+    buffered event. Buffered events are not visible to reads until flushed
+    and are lost if the process dies first, so buffering is opt-in. A batch
+    whose write fails goes back into the buffer, behind any newer event for
+    the same pair, and is dropped after MAX_FLUSH_ATTEMPTS failed writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (widget_id, user_id) -> (unsaved interaction, events coalesced into it, failed writes)
+        self._buffer: Dict[Tuple[int, int], Tuple[WidgetInteraction, int, int]] = {}
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    @property
+    def buffer_size(self) -> int:
+        return getattr(settings, 'WIDGET_INTERACTION_BUFFER_SIZE', 0)
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, 'WIDGET_INTERACTION_FLUSH_INTERVAL', 2)
+
+    @property
+    def buffering(self) -> bool:
+        return self.buffer_size > 1
+
+    @staticmethod
+    def build(widget_id: int, user, data: Dict[str, Any]) -> WidgetInteraction:
+        """An unsaved interaction from InteractionInputSerializer's validated data"""
+        return WidgetInteraction(
+            widget_id=widget_id,
+            user=user,
+            completed=data.get('completed', False),
+            quiz_answer=data.get('quiz_answer', ''),
+            interaction_data=data.get('interaction_data', {}),
+        )
+
+    def authorize(self, user, widget_id) -> Optional[Dict[str, Any]]:
+        """
+        None when the widget does not exist or the user cannot see it. Otherwise
+        the widget's metadata (see widget_meta) plus the user's existing
+        interaction (interaction_id None if there is none), in one query.
+        """
+        return accessible_widgets(user).filter(pk=widget_id).annotate(
+            mine=models.FilteredRelation('interactions', condition=models.Q(interactions__user=user)),
+        ).values(
+            *WIDGET_META_FIELDS,
+            **WIDGET_META_EXPRESSIONS,
+            interaction_id=models.F('mine__id'),
+            interaction_created_at=models.F('mine__created_at'),
+            interaction_completed=models.F('mine__completed'),
+            interaction_quiz_answer=models.F('mine__quiz_answer'),
+        ).first()
+
+    @staticmethod
+    def widget_meta(widget_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """widget_id -> what the rollups need to know about the widget, in one query"""
+        return {
+            row['id']: row for row in Widget.objects.filter(id__in=set(widget_ids)).values(
+                'id', *WIDGET_META_FIELDS, **WIDGET_META_EXPRESSIONS
+            )
+        }
+
+    def authorize_many(self, user, widget_ids: Iterable) -> set:
+        """The subset of widget_ids the user may interact with"""
+        return set(accessible_widgets(user).filter(pk__in=set(widget_ids)).values_list('id', flat=True))
+
+    def record(self, user, widget_id: int, data: Dict[str, Any],
+               existing: Dict[str, Any]) -> WidgetInteraction:
+        """
+        Write one interaction now and return it. ``existing`` is what
+        authorize() returned; it supplies the id and created_at of an updated
+        row so the result matches what update_or_create would have returned.
+        """
+        interaction = self.build(widget_id, user, data)
+        previous = {}
+        if existing['interaction_id'] is not None:
+            previous[(widget_id, user.pk)] = (existing['interaction_completed'], existing['interaction_quiz_answer'])
+        self.write([interaction], previous=previous, widgets={widget_id: existing})
+
+        if existing['interaction_id'] is not None:
+            interaction.pk = existing['interaction_id']
+            interaction.created_at = existing['interaction_created_at']
+        elif interaction.pk is None:
+            # Backends that cannot return ids from an upsert
+            interaction.pk = WidgetInteraction.objects.filter(
+                widget_id=widget_id, user=user
+            ).values_list('id', flat=True).first()
+        return interaction
+
+    def enqueue(self, user, widget_id: int, data: Dict[str, Any]) -> WidgetInteraction:
+        """Buffer one interaction for the next flush and return it unsaved"""
+        interaction = self.build(widget_id, user, data)
+        with self._lock:
+            key = (widget_id, user.pk)
+            events = self._buffer[key][1] + 1 if key in self._buffer else 1
+            self._buffer[key] = (interaction, events, 0)
+            full = len(self._buffer) >= self.buffer_size
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+        return interaction
+
+    def _schedule(self):
+        """Start the flush timer if it is not running; call with the lock held"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> int:
+        """Write all buffered interactions; returns how many rows were upserted"""
+        with self._lock:
+            pending = list(self._buffer.values())
+            self._buffer.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            try:
+                self.write(
+                    [interaction for interaction, _, _ in pending],
+                    events={(i.widget_id, i.user_id): events for i, events, _ in pending},
+                )
+            except Exception:
+                self._requeue(pending)
+                raise
+        return len(pending)
+
+    def _requeue(self, pending: List[Tuple[WidgetInteraction, int, int]]):
+        """Put a batch whose write failed back in the buffer; newer events for a pair win"""
+        dropped = 0
+        with self._lock:
+            for interaction, events, failures in pending:
+                key = (interaction.widget_id, interaction.user_id)
+                if failures + 1 >= MAX_FLUSH_ATTEMPTS:
+                    dropped += 1
+                elif key in self._buffer:
+                    newer, newer_events, newer_failures = self._buffer[key]
+                    self._buffer[key] = (newer, newer_events + events, newer_failures)
+                else:
+                    self._buffer[key] = (interaction, events, failures + 1)
+            if self._buffer:
+                self._schedule()
+        if dropped:
+            logger.error('Dropped %d widget interactions after %d failed writes', dropped, MAX_FLUSH_ATTEMPTS)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Widget interaction flush failed; the batch was re-queued')
+        finally:
+            close_old_connections()
+
+    def write(self, interactions: List[WidgetInteraction], previous: Optional[Dict[Tuple[int, int], tuple]] = None,
+              widgets: Optional[Dict[int, Dict[str, Any]]] = None, events: Optional[Dict[Tuple[int, int], int]] = None):
+        """
+        Upsert interactions, at most one per (widget, user), and update the
+        analytics rollups and reader progress. ``previous`` maps (widget_id,
+        user_id) to the (completed, quiz_answer) of rows being replaced and
+        ``widgets`` is widget_meta() for the batch; both are loaded when not given.
+        """
+        if widgets is None:
+            widgets = self.widget_meta(i.widget_id for i in interactions)
+            # A widget deleted since the event was buffered takes its interactions with it
+            interactions = [i for i in interactions if i.widget_id in widgets]
+        observed = [i for i in interactions if i.widget_id in widgets and is_observed(widgets[i.widget_id])]
+        if previous is None:
+            previous = {}
+            pairs = {(i.widget_id, i.user_id) for i in observed}
+            if pairs:
+                rows = WidgetInteraction.objects.filter(
+                    widget_id__in={pair[0] for pair in pairs},
+                    user_id__in={pair[1] for pair in pairs},
+                ).values_list('widget_id', 'user_id', 'completed', 'quiz_answer')
+                previous = {(w, u): (c, a) for w, u, c, a in rows if (w, u) in pairs}
+
+        with transaction.atomic():
+            WidgetInteraction.objects.bulk_create(
+                interactions,
+                update_conflicts=True,
+                unique_fields=['widget', 'user'],
+                update_fields=UPSERT_FIELDS,
+                batch_size=500,
+            )
+            if observed:
+                changes = [
+                    InteractionChange(
+                        interaction,
+                        previous.get((interaction.widget_id, interaction.user_id)),
+                        (events or {}).get((interaction.widget_id, interaction.user_id), 1),
+                    )
+                    for interaction in observed
+                ]
+                widget_analytics.record(changes, widgets)
+                reader_progress.record(changes, widgets)
+
+
+# Global instance
+interaction_writer = InteractionWriter()
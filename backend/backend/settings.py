@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -68,6 +69,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RequestProfilingMiddleware',
+    'api.middleware.LLMCallAttributionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -144,6 +147,46 @@ USE_TZ = True
 STATIC_URL = '/static/'
 TOKEN_EXPIRY_TIME = 7  # Tokens expire after 7 days
 
+# Background processing jobs (bulk ingestion enrichment, batch generation)
+PROCESSING_JOB_WORKERS = 4
+PROCESSING_JOBS_EAGER = False  # Run jobs inline instead of on the worker pool
+SIMILARITY_INDEX_MAX_NODES = 50000  # Nodes whose term counts the similarity service keeps in memory per process
+INGEST_MAX_FILE_BYTES = 2 * 1024 * 1024  # Largest uncompressed file accepted from a bulk_ingest zip archive
+LLM_BATCH_MAX_CONCURRENCY = 8  # Parallel OpenAI calls per batch generation job
+NODE_OFFSET_STORAGE = False  # Store untouched segmented nodes as offsets into Cognition.raw_content
+COMPRESSED_TEXT_FIELDS = {}  # e.g. {"api.Cognition.raw_content": {"algorithm": "zlib", "threshold": 4096}}
+TOC_REGENERATION_DRIFT = 0.5  # Share of TOC text changed before sections are regenerated by the LLM (None: never)
+SINGLE_FLIGHT_TIMEOUT = 120  # Seconds a duplicate async LLM request waits on the first one (also its lease)
+SINGLE_FLIGHT_SYNC_WAIT = 3  # Seconds a duplicate sync request waits before answering 202 with Retry-After
+SINGLE_FLIGHT_RESULT_TTL = 5  # Seconds a finished result is still shared with identical requests (and retries)
+
+# Admission control for LLM endpoints (token buckets in the Django cache, sized in estimated tokens)
+LLM_ADMISSION_ENABLED = True
+LLM_USER_TOKENS_PER_MINUTE = 40000
+LLM_USER_TOKEN_BURST = 80000
+LLM_GLOBAL_TOKENS_PER_MINUTE = 400000
+LLM_GLOBAL_TOKEN_BURST = 800000
+LLM_ADMISSION_MAX_WAIT = 10  # Seconds a request may queue before it is refused with Retry-After
+
+FOLLOW_GRAPH_CACHE_TIMEOUT = 60  # Seconds a cached follow set lives; raise it only with a shared CACHES backend
+
+WIDGET_INTERACTION_BUFFER_SIZE = 0  # Buffer this many widget interactions per process before writing (0/1: write through)
+WIDGET_INTERACTION_FLUSH_INTERVAL = 2  # Seconds a buffered interaction may wait before it is written
+
+# On-demand request profiling for staff users (X-Profile: 1 header or ?_profile=1); WSGI deployments only
+REQUEST_PROFILING_ENABLED = True
+REQUEST_PROFILE_HEADER = 'X-Profile'
+REQUEST_PROFILE_QUERY_PARAM = '_profile'
+REQUEST_PROFILE_SAMPLE_INTERVAL = 0.002  # Seconds between stack samples
+REQUEST_PROFILE_MAX_QUERIES = 5000  # SQL statements kept per profile (all are counted and timed)
+
+# Ledger of OpenAI calls (api.models.LLMCall): tokens, latency, truncation, cache hits and cost
+LLM_LEDGER_ENABLED = True
+LLM_LEDGER_ASYNC = True  # Queue rows for a background writer instead of inserting them in the request
+LLM_LEDGER_BATCH_SIZE = 100  # Rows per background insert
+LLM_LEDGER_FLUSH_INTERVAL = 2  # Seconds a queued row may wait before it is written
+LLM_PRICING = {}  # USD per 1K (prompt, completion) tokens by model prefix, e.g. {"gpt-4o": (0.0025, 0.01)}
+
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = False
 CORS_ALLOW_CREDENTIALS = True
@@ -159,6 +202,9 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+CORS_ALLOW_HEADERS = [*default_headers, REQUEST_PROFILE_HEADER.lower()]
+CORS_EXPOSE_HEADERS = ['X-Request-Profile']
+
 CSRF_TRUSTED_ORIGINS = ['http://localhost:3000']
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -0,0 +1,181 @@
+# benchmarks/asgi_vs_wsgi.py
+"""
+Load test of the sync (WSGI) LLM endpoints against their async (ASGI) versions.
+
+Starts the fake OpenAI server, seeds a throwaway database, then runs the app
+twice: under gunicorn with a fixed thread pool, hitting the DRF endpoint, and
+under uvicorn, hitting the /api/async/ endpoint. Each run fires --requests
+requests with --concurrency in flight and the script prints one JSON object
+with throughput and latency percentiles per server.
+
+Requires gunicorn and uvicorn, which are not application dependencies:
+
+    pip install gunicorn uvicorn
+    python -m benchmarks.asgi_vs_wsgi --latency 0.5 --concurrency 200 --requests 1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .fake_openai import FakeOpenAIServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # name: (sync path, async path, request body)
+    'markdown': (
+        '/api/text/convert_to_markdown/',
+        '/api/async/text/convert_to_markdown/',
+        lambda node_id: {'raw_text': 'A short paragraph of text to format as markdown.'},
+    ),
+    'widget': (
+        '/api/widgets/create_llm_widget/',
+        '/api/async/widgets/create_llm_widget/',
+        lambda node_id: {'node_id': node_id, 'widget_type': 'author_remark', 'llm_preset': 'summary'},
+    ),
+}
+
+
+def seed(env):
+    """Migrate the benchmark database and create a user, token and node; return (token, node_id)"""
+    script = (
+        "import django; django.setup()\n"
+        "from django.core.management import call_command\n"
+        "call_command('migrate', verbosity=0)\n"
+        "from django.contrib.auth.models import User\n"
+        "from rest_framework.authtoken.models import Token\n"
+        "from api.models import Cognition, Node\n"
+        "user, _ = User.objects.get_or_create(username='benchmark')\n"
+        "token, _ = Token.objects.get_or_create(user=user)\n"
+        "cognition = Cognition.objects.create(user=user, title='Benchmark', raw_content='Benchmark text.')\n"
+        "node = Node.objects.create(cognition=cognition, content='Benchmark text.', position=0, character_count=15)\n"
+        "print(token.key, node.id)\n"
+    )
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env, text=True)
+    token, node_id = output.split()[-2:]
+    return token, int(node_id)
+
+
+def wait_until_up(base_url, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/api/hello/', timeout=1)
+            return
+        except urllib.error.HTTPError:
+            return  # Any HTTP answer means the server is accepting requests
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not start')
+
+
+def fire(url, token, body, count, concurrency):
+    """POST ``body`` to ``url`` ``count`` times with ``concurrency`` in flight"""
+    payload = json.dumps(body).encode('utf-8')
+
+    def one(_):
+        request = urllib.request.Request(url, data=payload, method='POST', headers={
+            'Authorization': f'Token {token}',
+            'Content-Type': 'application/json',
+        })
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                response.read()
+                ok = 200 <= response.status < 300
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))] * 1000, 1)
+
+    return {
+        'requests': count,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, ok in results if not ok),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(count / elapsed, 2),
+        'latency_ms': {'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99), 'max': percentile(100)},
+    }
+
+
+def run_server(command, env, port, url, token, body, args):
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_up(base_url)
+        fire(base_url + url, token, body, min(args.concurrency, args.requests), args.concurrency)  # warm-up
+        return fire(base_url + url, token, body, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the WSGI and ASGI LLM endpoints under load')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='markdown')
+    parser.add_argument('--latency', type=float, default=0.5, help='Fake OpenAI latency in seconds')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--wsgi-workers', type=int, default=2)
+    parser.add_argument('--wsgi-threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8811)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency).start()
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BENCHMARK_DB=database,
+        OPENAI_BASE_URL=fake.base_url,
+        OPENAI_API_KEY='benchmark',
+    )
+
+    try:
+        token, node_id = seed(env)
+        sync_url, async_url, make_body = SCENARIOS[args.scenario]
+        body = make_body(node_id)
+
+        wsgi = run_server(
+            [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+             '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.wsgi_workers),
+             '--threads', str(args.wsgi_threads), '--timeout', '300'],
+            env, args.port, sync_url, token, body, args,
+        )
+        asgi = run_server(
+            [sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+             '--host', '127.0.0.1', '--port', str(args.port + 1), '--no-access-log'],
+            env, args.port + 1, async_url, token, body, args,
+        )
+    finally:
+        fake.shutdown()
+        os.unlink(database)
+
+    print(json.dumps({
+        'scenario': args.scenario,
+        'llm_latency_s': args.latency,
+        'llm_calls': fake.calls,
+        'wsgi': dict(wsgi, server=f'gunicorn {args.wsgi_workers}x{args.wsgi_threads} threads', path=sync_url),
+        'asgi': dict(asgi, server='uvicorn', path=async_url),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
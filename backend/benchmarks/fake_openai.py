@@ -0,0 +1,184 @@
+# benchmarks/fake_openai.py
+"""
+Minimal stand-in for the OpenAI chat completions API, for load tests.
+
+Every POST to /v1/chat/completions sleeps for the configured latency and then
+returns a well-formed completion: quick segmentation and full document
+analysis get one segment per paragraph, TOC generation gets sections of three
+nodes, anything else gets a short text. Point the app at it with OPENAI_BASE_URL=http://host:port/v1.
+
+    python -m benchmarks.fake_openai --port 8765 --latency 0.5
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTION_SIZE = 3
+
+
+def _quick_segmentation(prompt):
+    text = prompt.split('Document text:\n', 1)[-1].rsplit('\n\nProvide ', 1)[0]
+    segments = []
+    for match in re.finditer(r'(?:(?!\n\s*\n).)+', text, re.S):
+        paragraph = match.group(0)
+        if not paragraph.strip():
+            continue
+        segments.append({
+            'start_position': match.start(),
+            'end_position': match.end(),
+            'title': f'Segment {len(segments) + 1}',
+            'summary': paragraph.strip()[:80],
+            'topic_keywords': [],
+            'importance_level': 'primary',
+            'estimated_reading_time': max(1, len(paragraph.split()) // 4),
+            'semantic_coherence_score': 0.9,
+        })
+    return {
+        'segments': segments,
+        'document_type': 'article',
+        'overall_summary': 'Synthetic summary',
+        'estimated_total_read_time': sum(s['estimated_reading_time'] for s in segments),
+    }
+
+
+def _document_analysis(prompt):
+    quick = _quick_segmentation(prompt)
+    segments = quick['segments']
+    indices = list(range(len(segments)))
+    return dict(
+        quick,
+        main_themes=['synthetic'],
+        target_audience='General readers',
+        complexity_level='intermediate',
+        table_of_contents=[{
+            'title': 'Document',
+            'summary': 'All segments',
+            'segment_indices': indices,
+            'estimated_read_time': quick['estimated_total_read_time'],
+        }],
+        reading_flow={
+            'segment_order': indices,
+            'prerequisite_map': {},
+            'difficulty_progression': ['steady'] * len(segments),
+            'suggested_breaks': [],
+        },
+        overall_coherence_score=0.9,
+        segmentation_confidence=0.9,
+    )
+
+
+def _table_of_contents(prompt):
+    positions = [int(p) for p in re.findall(r'^(?:NODE|ITEM) (\d+):', prompt, re.M)]
+    count = len(positions)
+    sections = []
+    for start in range(1, count + 1, SECTION_SIZE):
+        end = min(start + SECTION_SIZE - 1, count)
+        sections.append({
+            'title': f'Section {len(sections) + 1}',
+            'description': f'Nodes {start} to {end}',
+            'start_node': start,
+            'end_node': end,
+            'importance': 'primary',
+        })
+    return {'title': 'Table of Contents', 'sections': sections}
+
+
+def completion_content(messages):
+    """Pick a plausible reply for the prompt, based on which call site sent it"""
+    system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+    prompt = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+    if 'QuickSegmentationResult' in system:
+        return json.dumps(_quick_segmentation(prompt))
+    if 'DocumentAnalysis structure' in system:
+        return json.dumps(_document_analysis(prompt))
+    if '"sections"' in system:
+        return json.dumps(_table_of_contents(prompt))
+    return 'Synthetic completion for load testing.'
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.endswith('/chat/completions'):
+            self._send(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+
+        request = json.loads(body or b'{}')
+        time.sleep(self.server.latency)
+        content = completion_content(request.get('messages', []))
+        prompt_tokens = sum(len(m.get('content') or '') for m in request.get('messages', [])) // 4
+        completion_tokens = len(content) // 4
+
+        self.server.record_call()
+        self._send(200, {
+            'id': f'chatcmpl-fake-{self.server.calls}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.5):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def start(self):
+        """Serve from a daemon thread; returns self so it can be chained"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds to wait before each reply')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer((args.host, args.port), latency=args.latency)
+    print(f'Fake OpenAI listening on {server.base_url} (latency {args.latency}s)')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# benchmarks/generators.py
+"""
+Synthetic data for benchmarks and query-budget tests.
+
+Every builder bulk-inserts its rows (signals do not fire, so the profile,
+stats and token rows they would create are inserted here too) and is
+deterministic for a given seed. build() assembles a whole dataset:
+
+    from benchmarks.generators import build
+    data = build(users=50, cognitions_per_user=2, nodes=200, widgets_per_node=1,
+                 follows_per_user=10, groups=5)
+"""
+import random
+from typing import Dict, List
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import (
+    Cognition, Group, GroupMembership, Node, UserProfile, UserProfileStats, Widget,
+)
+
+Follow = UserProfile.following.through
+
+WORDS = (
+    'memory attention language model context structure argument evidence claim theory '
+    'reader author network signal pattern system process history method result source '
+    'question answer example concept practice design value change growth limit form'
+).split()
+
+PASSWORD = 'benchmark'
+
+
+def paragraph(rng: random.Random, sentences: int = 4) -> str:
+    """A few sentences of filler prose"""
+    return ' '.join(
+        ' '.join(rng.choices(WORDS, k=rng.randint(6, 16))).capitalize() + '.'
+        for _ in range(sentences)
+    )
+
+
+def create_users(count: int, prefix: str = 'bench') -> List[User]:
+    """Users with a profile, a stats row and an API token each; all share the password PASSWORD"""
+    password = make_password(PASSWORD)
+    start = User.objects.count()
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{start + i}', password=password) for i in range(count)
+    ])
+    if users and users[0].pk is None:  # Backends that don't return ids from bulk inserts
+        users = list(User.objects.filter(username__in=[u.username for u in users]).order_by('id'))
+
+    profiles = UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+    if profiles and profiles[0].pk is None:
+        profiles = list(UserProfile.objects.filter(user__in=users).order_by('user_id'))
+    UserProfileStats.objects.bulk_create([UserProfileStats(profile=profile) for profile in profiles])
+    Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+    return users
+
+
+def create_cognitions(users: List[User], per_user: int = 1, nodes: int = 10, public_share: float = 0.5,
+                      seed: int = 0) -> List[Cognition]:
+    """Cognitions with ``nodes`` content nodes each; roughly ``public_share`` of them shared publicly"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    cognitions = []
+    for user in users:
+        for i in range(per_user):
+            is_public = rng.random() < public_share
+            cognitions.append(Cognition(
+                user=user,
+                title=f'{user.username} cognition {i}',
+                raw_content=paragraph(rng, 8),
+                is_public=is_public,
+                share_date=now if is_public else None,
+            ))
+    cognitions = Cognition.objects.bulk_create(cognitions)
+
+    Node.objects.bulk_create([
+        Node(cognition=cognition, content=text, position=position, character_count=len(text))
+        for cognition in cognitions
+        for position, text in enumerate(paragraph(rng) for _ in range(nodes))
+    ], batch_size=1000)
+    return cognitions
+
+
+def create_widgets(cognitions: List[Cognition], per_node: int = 1, required_share: float = 0.2,
+                   seed: int = 0) -> int:
+    """Author widgets (remarks, quizzes and LLM responses, in turn) on every node of the cognitions"""
+    rng = random.Random(seed)
+    widgets = []
+    for node in Node.objects.filter(cognition__in=cognitions).select_related('cognition').only(
+        'id', 'cognition__user_id'
+    ):
+        for position in range(per_node):
+            widget_type = ('author_remark', 'author_quiz', 'author_llm')[(node.id + position) % 3]
+            widget = Widget(
+                node=node,
+                user_id=node.cognition.user_id,
+                widget_type=widget_type,
+                content=paragraph(rng, 2),
+                is_required=rng.random() < required_share,
+                position=position,
+            )
+            if widget_type == 'author_quiz':
+                widget.quiz_question = paragraph(rng, 1)
+                widget.quiz_choices = ['A', 'B', 'C', 'D']
+                widget.quiz_correct_answer = rng.choice('ABCD')
+            if widget_type == 'author_llm':
+                widget.llm_preset = 'explain'
+            widgets.append(widget)
+    Widget.objects.bulk_create(widgets, batch_size=1000)
+    return len(widgets)
+
+
+def create_follows(users: List[User], per_user: int = 5, seed: int = 0) -> int:
+    """Random follows among the users' profiles, with follower/following counters refreshed"""
+    from api.profile_stats import profile_stats
+
+    rng = random.Random(seed)
+    profile_ids = list(UserProfile.objects.filter(user__in=users).values_list('id', flat=True))
+    follows = set()
+    for profile_id in profile_ids:
+        others = [other for other in profile_ids if other != profile_id]
+        for other in rng.sample(others, min(per_user, len(others))):
+            follows.add((profile_id, other))
+    Follow.objects.bulk_create([
+        Follow(from_userprofile_id=source, to_userprofile_id=target) for source, target in sorted(follows)
+    ], batch_size=1000, ignore_conflicts=True)
+    profile_stats.refresh_follows(profile_ids)
+    return len(follows)
+
+
+def create_groups(users: List[User], count: int = 1, members: int = 5, cognitions_per_group: int = 2,
+                  nodes: int = 10, seed: int = 0) -> List[Group]:
+    """Groups founded by successive users, each with ``members`` members and some group cognitions"""
+    rng = random.Random(seed)
+    groups = []
+    for i in range(count):
+        founder = users[i % len(users)]
+        group = Group.objects.create(name=f'Benchmark group {i}', description=paragraph(rng, 1), founder=founder)
+        others = [user for user in users if user.pk != founder.pk]
+        chosen = rng.sample(others, min(max(members - 1, 0), len(others)))
+        GroupMembership.objects.bulk_create(
+            [GroupMembership(group=group, user=founder, role='admin')]
+            + [GroupMembership(group=group, user=user) for user in chosen]
+        )
+        cognitions = create_cognitions([founder], cognitions_per_group, nodes, public_share=0, seed=seed + i)
+        Cognition.objects.filter(pk__in=[c.pk for c in cognitions]).update(group=group)
+        groups.append(group)
+    return groups
+
+
+def build(users: int = 10, cognitions_per_user: int = 1, nodes: int = 10, widgets_per_node: int = 0,
+          follows_per_user: int = 0, groups: int = 0, group_members: int = 5, seed: int = 0) -> Dict:
+    """A whole dataset; returns the created users, cognitions and groups"""
+    from api.profile_stats import profile_stats
+
+    created_users = create_users(users)
+    cognitions = create_cognitions(created_users, cognitions_per_user, nodes, seed=seed)
+    if widgets_per_node:
+        create_widgets(cognitions, widgets_per_node, seed=seed)
+    if follows_per_user:
+        create_follows(created_users, follows_per_user, seed=seed)
+    created_groups = create_groups(created_users, groups, group_members, nodes=nodes, seed=seed) if groups else []
+    for user in created_users:
+        profile_stats.refresh_cognitions(user.pk)
+    return {
+        'users': created_users,
+        'cognitions': cognitions,
+        'groups': created_groups,
+        'tokens': dict(Token.objects.filter(user__in=created_users).values_list('user_id', 'key')),
+    }
@@ -0,0 +1,267 @@
+# benchmarks/scenarios.py
+"""
+Scripted request scenarios against a synthetic dataset, for comparing commits.
+
+Seeds a throwaway database with benchmarks.generators, starts the fake OpenAI
+server, then drives the app in-process through the DRF test client,
+authenticating with real tokens. Each scenario runs --requests requests one
+after another (after --warmup unrecorded ones) and reports throughput,
+latency percentiles and SQL queries per request. The JSON result records the
+git commit, so runs from two commits can be compared with --compare:
+
+    python -m benchmarks.scenarios --nodes 500 --requests 200 --output before.json
+    git checkout my-branch
+    python -m benchmarks.scenarios --nodes 500 --requests 200 --compare before.json
+
+Scenarios:
+    detail                GET a cognition with --nodes nodes and its widgets
+    collective            GET the public collective feed
+    collective_following  GET the feed filtered to followed profiles
+    split_merge           alternate split_node/merge_with_next on random nodes
+    process_text          POST process_text, segmented by the fake OpenAI server
+
+LLM admission control is disabled for process_text unless --admission is
+given, so the scenario measures the endpoint rather than the token bucket.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from .fake_openai import FakeOpenAIServer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def git_revision():
+    """(commit, dirty) of the working tree, or (None, None) outside a git checkout"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                         cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL)
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Scenario:
+    """A named stream of (method, path, body) requests made as one user"""
+
+    def __init__(self, name, user, requests, settings=None):
+        self.name = name
+        self.user = user
+        self.requests = requests
+        self.settings = settings or {}
+
+
+def build_scenarios(args, data):
+    from api.models import Cognition, Node
+
+    rng = random.Random(args.seed)
+    owner = data['target'].user
+    reader = data['users'][1]
+
+    def detail():
+        while True:
+            yield 'get', f"/api/cognitions/{data['target'].id}/", None
+
+    def collective(following_only=False):
+        path = '/api/cognitions/collective/' + ('?following_only=true' if following_only else '')
+        while True:
+            yield 'get', path, None
+
+    def split_merge():
+        # Split a random node in two, then merge it back, so the node count stays put
+        while True:
+            position = rng.randrange(max(Node.objects.filter(cognition=data['target']).count() - 1, 1))
+            node = Node.objects.get(cognition=data['target'], position=position)
+            yield 'post', f'/api/nodes/{node.id}/split_node/', {'split_position': len(node.text) // 2}
+            yield 'post', f'/api/nodes/{node.id}/merge_with_next/', {'separator': ' '}
+
+    def process_text():
+        cognition = Cognition.objects.create(
+            user=owner, title='Process text benchmark',
+            raw_content='\n\n'.join(node.text for node in data['target'].nodes.all()[:args.process_nodes]),
+        )
+        while True:
+            yield 'post', f'/api/cognitions/{cognition.id}/process_text/', None
+
+    scenarios = {
+        'detail': Scenario('detail', owner, detail()),
+        'collective': Scenario('collective', reader, collective()),
+        'collective_following': Scenario('collective_following', reader, collective(following_only=True)),
+        'split_merge': Scenario('split_merge', owner, split_merge()),
+        'process_text': Scenario(
+            'process_text', owner, process_text(),
+            settings={} if args.admission else {'LLM_ADMISSION_ENABLED': False},
+        ),
+    }
+    return [scenarios[name] for name in args.scenario]
+
+
+def run_scenario(scenario, tokens, args, fake):
+    from django.db import connection
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    client = APIClient(SERVER_NAME='localhost', raise_request_exception=False)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {tokens[scenario.user.id]}')
+
+    def send(method, path, body):
+        return getattr(client, method)(path, body, format='json') if body is not None else getattr(client, method)(path)
+
+    latencies, queries, errors = [], [], 0
+    with override_settings(**scenario.settings), contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for _ in range(args.warmup):
+            send(*next(scenario.requests))
+
+        calls_before = fake.calls
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            method, path, body = next(scenario.requests)
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = send(method, path, body)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(captured.captured_queries))
+            if not 200 <= response.status_code < 300:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+    def ms(p):
+        return round(percentile(latencies, p) * 1000, 2)
+
+    return {
+        'requests': args.requests,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(args.requests / elapsed, 2),
+        'latency_ms': {'p50': ms(50), 'p90': ms(90), 'p95': ms(95), 'p99': ms(99), 'max': ms(100)},
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'p50': percentile(queries, 50),
+            'max': max(queries),
+        },
+        'llm_calls': fake.calls - calls_before,
+    }
+
+
+def compare(results, baseline):
+    """Ratios of this run to the baseline run, per scenario (throughput above 1 and the rest below 1 are better)"""
+
+    def ratio(new, old):
+        return round(new / old, 3) if old else None
+
+    comparison = {}
+    for name, result in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        comparison[name] = {
+            'throughput_rps': ratio(result['throughput_rps'], before['throughput_rps']),
+            'latency_p50_ms': ratio(result['latency_ms']['p50'], before['latency_ms']['p50']),
+            'latency_p95_ms': ratio(result['latency_ms']['p95'], before['latency_ms']['p95']),
+            'queries_mean': ratio(result['queries']['mean'], before['queries']['mean']),
+        }
+    return {'baseline_commit': baseline.get('commit'), 'ratios': comparison}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run scripted request scenarios and report latency and queries')
+    parser.add_argument('--scenario', nargs='+', default=['detail', 'collective', 'collective_following',
+                                                          'split_merge', 'process_text'],
+                        choices=['detail', 'collective', 'collective_following', 'split_merge', 'process_text'])
+    parser.add_argument('--requests', type=int, default=100, help='Recorded requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='Unrecorded requests before each scenario')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--cognitions-per-user', type=int, default=2)
+    parser.add_argument('--background-nodes', type=int, default=10, help='Nodes per generated cognition')
+    parser.add_argument('--nodes', type=int, default=200, help='Nodes in the cognition the detail and split/merge scenarios use')
+    parser.add_argument('--widgets-per-node', type=int, default=1)
+    parser.add_argument('--follows-per-user', type=int, default=10)
+    parser.add_argument('--groups', type=int, default=5)
+    parser.add_argument('--process-nodes', type=int, default=20, help='Paragraphs in the process_text document')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake OpenAI latency in seconds')
+    parser.add_argument('--admission', action='store_true', help='Keep LLM admission control on for process_text')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the JSON result to this file')
+    parser.add_argument('--compare', help='JSON result of an earlier run to compare against')
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency).start()
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+    os.environ['BENCHMARK_DB'] = database
+    os.environ['OPENAI_BASE_URL'] = fake.base_url
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from api.models import Cognition
+    from .generators import build, create_cognitions, create_widgets
+
+    try:
+        call_command('migrate', verbosity=0)
+        seeding_started = time.perf_counter()
+        data = build(
+            users=max(args.users, 2), cognitions_per_user=args.cognitions_per_user, nodes=args.background_nodes,
+            widgets_per_node=args.widgets_per_node, follows_per_user=args.follows_per_user,
+            groups=args.groups, seed=args.seed,
+        )
+        data['target'] = create_cognitions(data['users'][:1], 1, args.nodes, public_share=1, seed=args.seed)[0]
+        if args.widgets_per_node:
+            create_widgets([data['target']], args.widgets_per_node, seed=args.seed)
+        seeding_s = time.perf_counter() - seeding_started
+
+        results = {}
+        for scenario in build_scenarios(args, data):
+            results[scenario.name] = run_scenario(scenario, data['tokens'], args, fake)
+
+        commit, dirty = git_revision()
+        report = {
+            'commit': commit,
+            'dirty': dirty,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'dataset': {
+                'users': len(data['users']),
+                'cognitions': Cognition.objects.count(),
+                'groups': len(data['groups']),
+                'seeding_s': round(seeding_s, 3),
+            },
+            'scenarios': results,
+        }
+        if args.compare:
+            with open(args.compare) as handle:
+                report['comparison'] = compare(results, json.load(handle))
+    finally:
+        fake.shutdown()
+        os.unlink(database)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
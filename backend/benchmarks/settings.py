@@ -0,0 +1,21 @@
+# benchmarks/settings.py
+"""
+Project settings pointed at a throwaway database for benchmark runs.
+
+The database file comes from BENCHMARK_DB so servers started by a benchmark
+share the data it seeded.
+"""
+import os
+
+from backend.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DB', '/tmp/lenk-benchmark.sqlite3'),
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
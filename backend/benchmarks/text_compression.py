@@ -0,0 +1,155 @@
+# benchmarks/text_compression.py
+"""
+Storage size and read/write latency of CompressedTextField settings.
+
+Loads a corpus into a throwaway database once per configuration (plain,
+zlib and, when zstandard is installed, zstd at each threshold) and reports
+stored bytes for Cognition.raw_content and Node.content, bulk write time and
+read time, as JSON. Use a directory of real .txt/.md documents for a
+realistic corpus; without one, synthetic prose with a Zipfian vocabulary is
+generated.
+
+    python -m benchmarks.text_compression --corpus ~/documents --thresholds 1024 4096
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+FIELDS = ('api.Cognition.raw_content', 'api.Node.content')
+
+
+def synthetic_corpus(documents, seed=0):
+    """Markdown-ish prose with a Zipfian word distribution and log-normal document sizes"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10)))
+                  for _ in range(5000)]
+    weights = [1.0 / rank for rank in range(1, len(vocabulary) + 1)]
+
+    corpus = []
+    for i in range(documents):
+        target = int(min(200000, max(500, rng.lognormvariate(9, 1))))
+        parts, size = [], 0
+        while size < target:
+            if rng.random() < 0.1:
+                paragraph = '## ' + ' '.join(rng.choices(vocabulary, weights, k=rng.randint(2, 6))).title()
+            else:
+                sentences = []
+                for _ in range(rng.randint(2, 7)):
+                    words = rng.choices(vocabulary, weights, k=rng.randint(6, 24))
+                    sentences.append(' '.join(words).capitalize() + '.')
+                paragraph = ' '.join(sentences)
+            parts.append(paragraph)
+            size += len(paragraph) + 2
+        corpus.append((f'Document {i}', '\n\n'.join(parts)))
+    return corpus
+
+
+def file_corpus(directory):
+    corpus = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(('.txt', '.md', '.markdown')):
+                with open(os.path.join(root, name), encoding='utf-8', errors='replace') as handle:
+                    corpus.append((name, handle.read()))
+    return corpus
+
+
+def stored_bytes(table, column):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(SUM(LENGTH(CAST({column} AS BLOB))), 0) FROM {table}')
+        return cursor.fetchone()[0]
+
+
+def run_configuration(corpus, config, user):
+    from django.db import transaction
+    from django.test import override_settings
+    from api.models import Cognition, Node
+    from api.text_segmentation import split_into_paragraphs
+
+    with override_settings(COMPRESSED_TEXT_FIELDS=config):
+        Cognition.objects.all().delete()
+        documents = [(title, text, split_into_paragraphs(text)) for title, text in corpus]
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            cognitions = Cognition.objects.bulk_create(
+                [Cognition(user=user, title=title[:200], raw_content=text) for title, text, _ in documents],
+                batch_size=200,
+            )
+            Node.objects.bulk_create(
+                [node for cognition, (_, _, paragraphs) in zip(cognitions, documents)
+                 for node in cognition.build_nodes(paragraphs)],
+                batch_size=500,
+            )
+        write_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        characters = sum(len(text) for text in Cognition.objects.values_list('raw_content', flat=True))
+        characters += sum(len(text) for text in Node.objects.values_list('content', flat=True))
+        read_s = time.perf_counter() - started
+
+    return {
+        'raw_content_bytes': stored_bytes('api_cognition', 'raw_content'),
+        'node_content_bytes': stored_bytes('api_node', 'content'),
+        'write_s': round(write_s, 4),
+        'read_s': round(read_s, 4),
+        'characters_read': characters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compressed text storage')
+    parser.add_argument('--corpus', help='Directory of .txt/.md documents (default: synthetic)')
+    parser.add_argument('--documents', type=int, default=200, help='Synthetic documents to generate')
+    parser.add_argument('--thresholds', type=int, nargs='+', default=[1024, 4096, 16384])
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+    os.environ['BENCHMARK_DB'] = database
+
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from api.fields import zstandard
+
+    try:
+        call_command('migrate', verbosity=0)
+        user = User.objects.create(username='benchmark')
+        corpus = file_corpus(args.corpus) if args.corpus else synthetic_corpus(args.documents)
+
+        algorithms = ['zlib'] + (['zstd'] if zstandard is not None else [])
+        configurations = [('plain', None, {})]
+        for algorithm in algorithms:
+            for threshold in args.thresholds:
+                options = {'algorithm': algorithm, 'threshold': threshold}
+                configurations.append((f'{algorithm}@{threshold}', options, {field: options for field in FIELDS}))
+
+        results = []
+        for name, options, config in configurations:
+            results.append(dict(run_configuration(corpus, config, user), configuration=name, options=options))
+
+        baseline = results[0]
+        for result in results:
+            for key in ('raw_content_bytes', 'node_content_bytes'):
+                result[key.replace('_bytes', '_ratio')] = round(result[key] / baseline[key], 4) if baseline[key] else None
+
+        print(json.dumps({
+            'documents': len(corpus),
+            'corpus_characters': sum(len(text) for _, text in corpus),
+            'results': results,
+        }, indent=2))
+    finally:
+        os.unlink(database)
+
+
+if __name__ == '__main__':
+    main()